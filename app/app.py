@@ -1,16 +1,87 @@
 import asyncio
+import logging
+import os
+import threading
+import time
 import urllib.parse
-from typing import Dict, AsyncGenerator
+import uuid
+from typing import Dict, List, AsyncGenerator
+from contextlib import aclosing
+from contextvars import ContextVar
 
-import orjson
 import httpx
 import gradio as gr
+from news_common import aiter_ndjson
+
+from summary_store import SummaryStore, normalize_query
+
+logger = logging.getLogger('app')
 
 #NEWS_SCRAPER_URL = "http://localhost:8001/article-details"
-#SUMMARIZER_URL = "http://localhost:8002/article-summary"
+#SUMMARIZER_STREAM_URL = "http://localhost:8002/article-summary/stream"
 
 NEWS_SCRAPER_URL = "http://news-scraper:8000/article-details"
-SUMMARIZER_URL = "http://summarizer:8000/article-summary"
+SUMMARIZER_STREAM_URL = "http://summarizer:8000/article-summary/stream"
+QUERY_SUMMARIES_URL = "http://summarizer:8000/query-summaries"
+# Whether the summarizer gets the articles straight from the news scraper (see stream_query_summaries), instead of through the frontend
+FUSED_PIPELINE = os.environ.get("FUSED_PIPELINE", "1") == "1"
+RENDER_INTERVAL = 0.1 # Seconds between re-renders of the summaries, so that every streamed token does not cause a re-render
+
+CONNECT_TIMEOUT = float(os.environ.get("CONNECT_TIMEOUT", 5)) # Seconds to connect to the news scraper and summarizer services
+# Max seconds between two chunks of the article stream. The news scraper sends heartbeats while it is still searching, so a
+# longer silence means that it is stuck
+SCRAPER_READ_TIMEOUT = float(os.environ.get("SCRAPER_READ_TIMEOUT", 30))
+SUMMARIZER_READ_TIMEOUT = float(os.environ.get("SUMMARIZER_READ_TIMEOUT", 120)) # Max seconds between two chunks of a summary stream
+SUMMARY_TIMEOUT = float(os.environ.get("SUMMARY_TIMEOUT", 300)) # Max seconds to summarize an article, once its request has been sent
+SEARCH_TIMEOUT = float(os.environ.get("SEARCH_TIMEOUT", 600)) # Max seconds for a query, after which the remaining work is cancelled
+# Max number of articles being summarized at the same time (over all the users), so that one large query does not flood the GPU.
+# Only applies when the articles are relayed through the frontend (FUSED_PIPELINE=0). In the fused pipeline the frontend never sees the
+# articles before they are summarized, and the admission control of the summarizer (MAX_ACTIVE_SUMMARIES and MAX_QUEUED_SUMMARIES)
+# bounds them instead, over every client of the summarizer
+MAX_CONCURRENT_SUMMARIES = int(os.environ.get("MAX_CONCURRENT_SUMMARIES", 8))
+MAX_CONNECTIONS = int(os.environ.get("MAX_CONNECTIONS", 32)) # Max number of connections in the pool of each service
+
+SUMMARY_STORE_PATH = os.environ.get("SUMMARY_STORE_PATH", "summaries.sqlite3") # Local database of the summaries of prefetched and searched queries
+SUMMARY_STORE_MAX_AGE = float(os.environ.get("SUMMARY_STORE_MAX_AGE", 1800)) # Seconds after which the stored summaries of a query are not served
+# Queries to keep summaries of in the store, e.g. trending topics. Comma-separated
+PREFETCH_QUERIES = [query.strip() for query in os.environ.get("PREFETCH_QUERIES", "").split(",") if query.strip()]
+PREFETCH_INTERVAL = float(os.environ.get("PREFETCH_INTERVAL", 900)) # Seconds between refreshes of the prefetched queries
+PREFETCH_LIMIT = int(os.environ.get("PREFETCH_LIMIT", 5)) # Number of articles prefetched per query
+# The queries searched at least PREFETCH_MIN_SEARCHES times in the last PREFETCH_TRAFFIC_WINDOW seconds are also prefetched (at most
+# PREFETCH_MAX_POPULAR_QUERIES of them)
+PREFETCH_TRAFFIC_WINDOW = float(os.environ.get("PREFETCH_TRAFFIC_WINDOW", 3600))
+PREFETCH_MIN_SEARCHES = int(os.environ.get("PREFETCH_MIN_SEARCHES", 3))
+PREFETCH_MAX_POPULAR_QUERIES = int(os.environ.get("PREFETCH_MAX_POPULAR_QUERIES", 5))
+
+# Clients shared by every request for the lifetime of the app, so that connections to the services are reused.
+# They are created on first use, inside the event loop of the gradio server
+news_scraper_client: httpx.AsyncClient | None = None
+summarizer_client: httpx.AsyncClient | None = None
+summary_slots = asyncio.Semaphore(MAX_CONCURRENT_SUMMARIES)
+summary_store = SummaryStore(SUMMARY_STORE_PATH)
+
+TRACE_ID_HEADER = "X-Request-ID"
+# The trace ID of the search, sent to the services with every request, so that the search can be followed through their logs
+trace_id: ContextVar[str] = ContextVar("trace_id", default="-")
+
+def trace_headers() -> Dict[str, str]:
+    return {TRACE_ID_HEADER: trace_id.get()}
+
+def make_client(read_timeout: float) -> httpx.AsyncClient:
+    return httpx.AsyncClient(timeout=httpx.Timeout(CONNECT_TIMEOUT, read=read_timeout),
+                             limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS))
+
+def get_news_scraper_client() -> httpx.AsyncClient:
+    global news_scraper_client
+    if news_scraper_client is None or news_scraper_client.is_closed:
+        news_scraper_client = make_client(SCRAPER_READ_TIMEOUT)
+    return news_scraper_client
+
+def get_summarizer_client() -> httpx.AsyncClient:
+    global summarizer_client
+    if summarizer_client is None or summarizer_client.is_closed:
+        summarizer_client = make_client(SUMMARIZER_READ_TIMEOUT)
+    return summarizer_client
 
 async def get_stream_from_news_scraper(query: str, limit: int) -> AsyncGenerator[Dict[str, str], None]:
     """
@@ -27,25 +98,27 @@ async def get_stream_from_news_scraper(query: str, limit: int) -> AsyncGenerator
         Yields
         ------
         line: Dict[str]
-        The response from the news scraping service. A dictionary containing the url and the <p> tags from the article
+        The articles from the news scraping service. A dictionary containing the url and the <p> tags from the article
         {
+            "type": "article"
             "url": The url of the article
             "paragraphs": A list containing the <p> tags from the article
         }
+        The heartbeat, error and duplicate records in the stream are skipped.
     """
     search_params = {"search_query": query,
                      "limit": limit}
 
-    async with httpx.AsyncClient(timeout=None) as client:
-        # TODO: implement a timeout for get_articles_by_query
-        async with client.stream("GET", NEWS_SCRAPER_URL, params=search_params) as response:
-            async for line in response.aiter_text():
-                line = orjson.loads(line)
+    # Leaving the stream early (e.g. the query was abandoned) closes the connection, which cancels the scraping pipeline
+    async with get_news_scraper_client().stream("GET", NEWS_SCRAPER_URL, params=search_params, headers=trace_headers()) as response:
+        response.raise_for_status()
+        async for line in aiter_ndjson(response):
+            if line.get("type", "article") == "article":
                 yield line
 
-async def get_news_summary(line: Dict[str, str]):
+async def stream_news_summary(line: Dict[str, str]) -> AsyncGenerator[Dict, None]:
     """
-        Passes the article (containing its url and a list of <p> text) to the summarizer service and returns the response
+        Passes the article (containing its url and a list of <p> text) to the summarizer service, and yields the summary as it is generated
 
         Parameters
         ----------
@@ -56,24 +129,56 @@ async def get_news_summary(line: Dict[str, str]):
                 "paragraphs": List[str] containing the text from all the <p> tags in the article
             }
 
-        Returns
-        -------
-        response: Dict[str, str]
-            A dictionary containing the response from the summarizer servicce
-            {
-                "url": url of the article
-                "summary": Summary of the article
-            }
+        Yields
+        ------
+        record: Dict
+            The records streamed by the summarizer service, one of
+            {"url": url of the article, "chunk": index of the chunk, "delta": the next piece of text of the summary of the chunk}
+            {"url": url of the article, "summary": the article summary, "done": true}
+            {"url": url of the article, "error": the error message, "done": true}
+    """
+    async with get_summarizer_client().stream("POST", SUMMARIZER_STREAM_URL,
+                                              json={
+                                                    "url": line['url'],
+                                                    "paragraphs": line['paragraphs']
+                                                },
+                                              headers=trace_headers()
+                                              ) as response:
+        response.raise_for_status()
+        async for record in aiter_ndjson(response):
+            yield record
+
+async def stream_query_summaries(query: str, limit: int) -> AsyncGenerator[Dict, None]:
     """
-    async with httpx.AsyncClient(timeout=None) as client:
-        response = await client.post(SUMMARIZER_URL, 
-                                 json={
-                                        "url": line['url'],
-                                        "paragraphs": line['paragraphs']
-                                    }
-                                )
-    # if resp = 200 ok?
-    return response.json() 
+        Obtains a stream of the summaries of the articles for the query from the /query-summaries pipeline of the summarizer service, which
+        gets the articles from the news scraping service itself. This saves relaying the text of every article through the frontend.
+
+        Parameters
+        ----------
+        query: str
+            To query the news service on
+
+        limit: int
+            The max number of articles to summarize
+
+        Yields
+        ------
+        record: Dict
+            The records streamed by the summarizer service, one of
+            {"type": "article", "url": url of the article}, when the article is being summarized
+            The records of stream_news_summary for each article
+            {"type": "error", "error": the error message}, if the articles could not be obtained
+            The heartbeat records in the stream are skipped.
+    """
+    search_params = {"search_query": query,
+                     "limit": limit,
+                     "stream_tokens": True}
+
+    async with get_summarizer_client().stream("GET", QUERY_SUMMARIES_URL, params=search_params, headers=trace_headers()) as response:
+        response.raise_for_status()
+        async for record in aiter_ndjson(response):
+            if record.get("type") != "heartbeat":
+                yield record
 
 def format_markdown_article(i: int, url: str, summary: str):
     """
@@ -101,11 +206,112 @@ def format_markdown_article(i: int, url: str, summary: str):
     """
     return s
 
-async def search_query(query: str, limit: int, progress = gr.Progress()) -> str:
+def format_markdown_summaries(query: str, articles: List[Dict], searching: bool) -> str:
+    """
+        Formats the summaries of all the articles (including the ones that are still being generated) for display on the gradio interface
+
+        Parameters
+        ----------
+        query: str
+            The query the articles are on
+
+        articles: List[Dict]
+            The articles in the order they arrived, each containing the url, the summary of each chunk (so far) and whether it is done
+
+        searching: bool
+            Whether more articles may still arrive
+
+        Returns
+        -------
+        markdown_output: str
+            The markdown output of all the article summaries
+    """
+    markdown_output = [f"# Summary for articles related to <u>{query}</u>"]
+    for i, article in enumerate(articles):
+        summary = article["summary"] if article["done"] else " ".join(article["chunks"][k] for k in sorted(article["chunks"]))
+        markdown_output.append(format_markdown_article(i+1, article["url"], summary or "*Summarizing...*"))
+    if searching:
+        markdown_output.append("*Searching for more articles...*")
+    return "\n___\n".join(markdown_output)
+
+async def prefetch_query(client: httpx.AsyncClient, query: str) -> int:
+    """
+        Summarizes the articles for the query with the /query-summaries pipeline of the summarizer service, and replaces the summaries of the
+        query in the summary store
+
+        Parameters
+        ----------
+        client: httpx.AsyncClient
+            The client to send the request to the summarizer service with
+
+        query: str
+            The query to prefetch
+
+        Returns
+        -------
+        num_articles: int
+            The number of summaries stored
+    """
+    # Queued behind the searches of the users, and shed first when the summarizer is overloaded
+    search_params = {"search_query": query,
+                     "limit": PREFETCH_LIMIT,
+                     "priority": "background"}
+    urls, summaries = [], {}
+    trace_id.set(f"prefetch-{uuid.uuid4().hex}")
+    async with asyncio.timeout(SEARCH_TIMEOUT), client.stream("GET", QUERY_SUMMARIES_URL, params=search_params, headers=trace_headers()) as response:
+        response.raise_for_status()
+        async for record in aiter_ndjson(response):
+            if record.get("type") == "article":
+                urls.append(record["url"])
+            elif record.get("type") == "error":
+                raise RuntimeError(record["error"])
+            elif record.get("summary"):
+                summaries[record["url"]] = record["summary"]
+
+    # Keep the order that the articles arrived in, like a live search
+    articles = [{"url": url, "summary": summaries[url]} for url in urls if url in summaries]
+    if articles:
+        await asyncio.to_thread(summary_store.put, query, articles)
+    return len(articles)
+
+def get_prefetch_queries() -> List[str]:
+    """
+        Gets the queries to prefetch, the ones in PREFETCH_QUERIES followed by the ones that have been searched often recently
+    """
+    popular = summary_store.get_popular_queries(PREFETCH_TRAFFIC_WINDOW, PREFETCH_MIN_SEARCHES, PREFETCH_MAX_POPULAR_QUERIES)
+    return list(dict.fromkeys(normalize_query(query) for query in [*PREFETCH_QUERIES, *popular]))
+
+async def run_prefetcher() -> None:
+    """
+        Every PREFETCH_INTERVAL seconds, refreshes the summaries of the queries to prefetch in the summary store.
+        The queries are refreshed one at a time, so that the prefetching does not take the capacity of the services away from the users.
+    """
+    # A client of its own, as the prefetcher runs in its own event loop
+    async with make_client(SUMMARIZER_READ_TIMEOUT) as client:
+        while True:
+            for query in await asyncio.to_thread(get_prefetch_queries):
+                try:
+                    num_articles = await prefetch_query(client, query)
+                    logger.info(f"[{trace_id.get()}] Prefetched {num_articles} summaries for \"{query}\"")
+                except Exception as e:
+                    logger.error(f"[{trace_id.get()}] Failed to prefetch \"{query}\": {e!r}")
+            await asyncio.sleep(PREFETCH_INTERVAL)
+
+def start_prefetcher() -> threading.Thread:
+    """
+        Starts the prefetcher in a background thread, with its own event loop, so that it does not compete with the gradio server for its event loop
+    """
+    thread = threading.Thread(target=asyncio.run, args=(run_prefetcher(),), name="prefetcher", daemon=True)
+    thread.start()
+    return thread
+
+async def search_query(query: str, limit: int) -> AsyncGenerator[str, None]:
     """
         Obtain the summaries of all the articles associated with the query, and formats them in output format for
-        display on the gradio interface.
-        TODO: maybe implement a database layer to collect article summaries 
+        display on the gradio interface. The output is re-rendered as the summaries are streamed, so each summary is displayed as soon as
+        its first words are generated, instead of after every article has been summarized.
+        The summaries are served from the summary store if it has enough recent summaries of the query (e.g. prefetched by run_prefetcher),
+        and otherwise the summaries obtained from the services are stored, for the next search of the same query.
 
         Parameters
         ----------
@@ -113,47 +319,114 @@ async def search_query(query: str, limit: int, progress = gr.Progress()) -> str:
             The query to articles on
         
         limit: int
-            The max number of articles to collect. Collecting each article comes with a 5 second delay (for scraping purposes), 
-            so there will be significant latency if too many articles are scraped in the same time
+            The max number of articles to collect
 
-        Returns
+        Yields
         -------
         markdown_output: str
-        The markdown output of all the article summaries
+        The markdown output of all the article summaries so far
     """
-    progress(0, "Getting Article Details")
-    summaries = []
-    count = 0
+    # Set before creating any task, so that the tasks inherit the trace ID
+    trace_id.set(uuid.uuid4().hex)
+    start_time = time.perf_counter()
+    await asyncio.to_thread(summary_store.record_search, query)
+    stored = await asyncio.to_thread(summary_store.get, query, limit, SUMMARY_STORE_MAX_AGE)
+    if stored is not None:
+        logger.info(f"[{trace_id.get()}] Served \"{query}\" from the summary store in {time.perf_counter() - start_time:.2f}s")
+        yield format_markdown_summaries(query, [{**article, "chunks": {}, "done": True} for article in stored], False)
+        return
 
-    # Obtain the article summaries
-    async with asyncio.TaskGroup() as tg:
-        async for line in get_stream_from_news_scraper(query, limit):
-            task = tg.create_task(get_news_summary(line))
+    timings: Dict[str, float] = {} # Seconds from the start of the search to the first article, and to the first words of a summary
 
-            task.add_done_callback(lambda x: summaries.append(x.result()))
-            progress((count, limit), "Summarizing articles", unit="articles")
-            count += 1
+    articles: List[Dict] = []
+    updated = asyncio.Event()
+    searching = True
 
-    # Format the article summaries to markdown
-    markdown_output = [f"# Summary for articles related to <u>{query}</u>"]
-    for i, article_summary in progress.tqdm(enumerate(summaries), "Formatting Summaries"):
-        url = article_summary['url']
-        summary = article_summary['summary']
-        markdown_summary = format_markdown_article(i+1, url, summary)
-        markdown_output.append(markdown_summary)
+    def update_summary(article: Dict, record: Dict):
+        timings.setdefault("first_summary", time.perf_counter() - start_time)
+        if "delta" in record:
+            article["chunks"][record["chunk"]] = article["chunks"].get(record["chunk"], "") + record["delta"]
+        elif record.get("done"):
+            article["summary"] = record.get("summary") or f"*Failed to summarize the article: {record.get('error')}*"
+            article["failed"] = not record.get("summary")
+            article["done"] = True
+        updated.set()
 
-    return "\n___\n".join(markdown_output)
+    async def summarize(article: Dict, line: Dict[str, str]):
+        try:
+            # Wait for a free slot before sending the request, and only then start the timeout
+            async with summary_slots, asyncio.timeout(SUMMARY_TIMEOUT):
+                async with aclosing(stream_news_summary(line)) as records:
+                    async for record in records:
+                        update_summary(article, record)
+        except (httpx.HTTPError, TimeoutError) as e:
+            # Only this article failed, the others are still being summarized
+            article["summary"] = f"*Failed to summarize the article: {e!r}*"
+            article["failed"] = True
+        article["done"] = True
+        updated.set()
+
+    async def get_summaries():
+        nonlocal searching
+        try:
+            # Leaving the task group cancels all the summaries that are in flight, closing their connections to the summarizer
+            async with asyncio.timeout(SEARCH_TIMEOUT), asyncio.TaskGroup() as tg:
+                async with aclosing(get_stream_from_news_scraper(query, limit)) as lines:
+                    async for line in lines:
+                        timings.setdefault("first_article", time.perf_counter() - start_time)
+                        article = {"url": line["url"], "chunks": {}, "summary": "", "done": False}
+                        articles.append(article)
+                        tg.create_task(summarize(article, line))
+                        updated.set()
+        finally:
+            searching = False
+            updated.set()
+
+    async def get_fused_summaries():
+        nonlocal searching
+        in_progress: Dict[str, Dict] = {} # url -> article that is still being summarized
+        # No summary_slots here: the summarizer starts summarizing each article as soon as it is scraped, and its admission control
+        # limits how many are summarized at the same time
+        try:
+            # Leaving the stream closes the connection to the summarizer, which cancels the pipeline
+            async with asyncio.timeout(SEARCH_TIMEOUT), aclosing(stream_query_summaries(query, limit)) as records:
+                async for record in records:
+                    if record.get("type") == "article":
+                        timings.setdefault("first_article", time.perf_counter() - start_time)
+                        in_progress[record["url"]] = {"url": record["url"], "chunks": {}, "summary": "", "done": False}
+                        articles.append(in_progress[record["url"]])
+                        updated.set()
+                    elif record.get("type") == "error":
+                        raise gr.Error(record["error"])
+                    elif record.get("url") in in_progress:
+                        update_summary(in_progress[record["url"]], record)
+                        if record.get("done"):
+                            del in_progress[record["url"]]
+        finally:
+            searching = False
+            updated.set()
 
-async def search_query_async(query, limit):
-    # TODO: FIND A WAY TO MAKE GRADIO RENDER AND DISPLAY THE OUTPUT DYNAMICALLY AND ASYNCHRONOUSLY
-    tasks = []
-    async for line in get_stream_from_news_scraper(query, limit):
-        task = asyncio.create_task(get_news_summary(line))
-        tasks.append(task)
-    
-    for task in asyncio.as_completed(tasks):
-        result = await task
-        yield result
+    yield format_markdown_summaries(query, articles, searching)
+    task = asyncio.create_task(get_fused_summaries() if FUSED_PIPELINE else get_summaries())
+    try:
+        while not task.done():
+            await updated.wait()
+            updated.clear()
+            yield format_markdown_summaries(query, articles, searching)
+            # Let a few more tokens arrive before re-rendering
+            await asyncio.sleep(RENDER_INTERVAL)
+        task.result() # Raise any errors
+        yield format_markdown_summaries(query, articles, searching)
+        summarized = [{"url": article["url"], "summary": article["summary"]} for article in articles if article["done"] and not article.get("failed")]
+        if summarized:
+            await asyncio.to_thread(summary_store.put, query, summarized)
+    finally:
+        # The user left (or the query failed), so tear down the scraping and summarization instead of letting them run on
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        logger.info(f"[{trace_id.get()}] Searched \"{query}\" in {time.perf_counter() - start_time:.2f}s: {len(articles)} articles, "
+                    f"first article after {timings.get('first_article', float('nan')):.2f}s, "
+                    f"first summary after {timings.get('first_summary', float('nan')):.2f}s")
 
 with gr.Blocks() as interface:
     query_output = gr.State({})
@@ -179,4 +452,6 @@ with gr.Blocks() as interface:
         submit_btn.click(search_query, inputs=[input_query, num_queries], outputs=summaries) 
 
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format="[%(asctime)s] - %(levelname)-5s - %(name)-17s: %(message)s")
+    start_prefetcher()
     interface.launch()
\ No newline at end of file
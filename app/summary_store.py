@@ -0,0 +1,128 @@
+from typing import Dict, List, Optional
+import sqlite3
+import threading
+import time
+
+def normalize_query(query: str) -> str:
+    """
+        Normalizes the query so that queries that only differ in case or whitespace share the same summaries
+    """
+    return " ".join(query.lower().split())
+
+class SummaryStore:
+    """
+        Local SQLite database of the article summaries of queries, which have either been prefetched in the background or been searched
+        before, so that searching the same query again can be served without scraping and summarizing the articles again.
+        It also keeps a log of the searches, to find the queries that are searched often.
+        The methods are blocking, so they should be run in a thread (e.g. asyncio.to_thread) from async code.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock() # The store is used by both the gradio server and the prefetcher thread
+
+    def _get_db(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS queries (query TEXT PRIMARY KEY, refreshed_at REAL)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS summaries (query TEXT, position INTEGER, url TEXT, summary TEXT, PRIMARY KEY (query, position))")
+            self._db.execute("CREATE TABLE IF NOT EXISTS searches (query TEXT, searched_at REAL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS searches_searched_at ON searches (searched_at)")
+        return self._db
+
+    def get(self, query: str, limit: int, max_age: float) -> Optional[List[Dict[str, str]]]:
+        """
+            Gets the stored summaries of the query, if there are at least limit of them and they were refreshed within max_age seconds
+
+            Parameters
+            ----------
+            query: str
+                The query the articles are on
+
+            limit: int
+                The number of articles needed
+
+            max_age: float
+                Seconds after which the stored summaries are too old to be served
+
+            Returns
+            -------
+            articles: Optional[List[Dict[str, str]]]
+                The url and summary of the first limit articles, or None if the store cannot serve the query
+        """
+        query = normalize_query(query)
+        with self._lock:
+            db = self._get_db()
+            row = db.execute("SELECT refreshed_at FROM queries WHERE query = ?", (query,)).fetchone()
+            if row is None or time.time() - row[0] > max_age:
+                return None
+            rows = db.execute("SELECT url, summary FROM summaries WHERE query = ? ORDER BY position LIMIT ?", (query, limit)).fetchall()
+        if len(rows) < limit:
+            return None
+        return [{"url": url, "summary": summary} for url, summary in rows]
+
+    def put(self, query: str, articles: List[Dict[str, str]]) -> None:
+        """
+            Replaces the stored summaries of the query
+
+            Parameters
+            ----------
+            query: str
+                The query the articles are on
+
+            articles: List[Dict[str, str]]
+                The url and summary of each article, in the order they should be displayed
+        """
+        query = normalize_query(query)
+        with self._lock:
+            db = self._get_db()
+            with db:
+                db.execute("DELETE FROM summaries WHERE query = ?", (query,))
+                db.executemany("INSERT INTO summaries VALUES (?, ?, ?, ?)",
+                               [(query, i, article["url"], article["summary"]) for i, article in enumerate(articles)])
+                db.execute("INSERT OR REPLACE INTO queries VALUES (?, ?)", (query, time.time()))
+
+    def record_search(self, query: str) -> None:
+        """
+            Logs that the query has been searched
+        """
+        with self._lock:
+            db = self._get_db()
+            with db:
+                db.execute("INSERT INTO searches VALUES (?, ?)", (normalize_query(query), time.time()))
+
+    def get_popular_queries(self, window: float, min_searches: int, max_queries: int) -> List[str]:
+        """
+            Gets the queries that have been searched the most in the last window seconds. Older searches are dropped from the log.
+
+            Parameters
+            ----------
+            window: float
+                Seconds of searches to count
+
+            min_searches: int
+                The minimum number of searches of a query for it to be returned
+
+            max_queries: int
+                The maximum number of queries to return
+
+            Returns
+            -------
+            queries: List[str]
+                The queries, from the most searched
+        """
+        since = time.time() - window
+        with self._lock:
+            db = self._get_db()
+            with db:
+                db.execute("DELETE FROM searches WHERE searched_at < ?", (since,))
+            rows = db.execute("SELECT query FROM searches GROUP BY query HAVING COUNT(*) >= ? ORDER BY COUNT(*) DESC LIMIT ?",
+                              (min_searches, max_queries)).fetchall()
+        return [query for query, in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,151 @@
+"""
+    Cold start benchmark of the news scraper and the summarizer, i.e. how quickly a new container can take traffic
+    - import: the time to import the service, measured with python -X importtime, and the modules that took the longest to import
+    - accepting: the time from starting the server until it accepts connections
+    - ready: the time until /ready responds with 200, once the service has warmed up (services without /ready are taken to be ready once
+      they accept connections, like a load balancer without a readiness probe would)
+    - first_request: the time until the first request, sent once the service is ready, has been answered
+    The services run offline like in run_benchmarks.py: the news scraper with the fake Google News search and publishers, and the summarizer
+    with the stub vLLM server. Each service is started --repeat times, and the medians are reported.
+
+    To compare against another revision, check it out into a worktree and pass it as --root, e.g.
+        git worktree add /tmp/before <revision>
+        python benchmarks/cold_start.py --root /tmp/before
+        python benchmarks/cold_start.py
+
+    Usage (from the repository root, in an environment with the dependencies of both services):
+        python benchmarks/cold_start.py --services news-scraper summarizer --repeat 5
+"""
+from typing import Callable, Dict, List, Optional, Tuple
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+from run_benchmarks import (BENCHMARKS_DIR, ROOT_DIR, PUBLISHERS_PORT, NEWS_SCRAPER_URL, SUMMARIZER_URL, SUMMARIZER_PORT, NEWS_SCRAPER_PORT,
+                            STUB_VLLM_PORT, start_process, stop_servers)
+
+SERVICES = ("news-scraper", "summarizer")
+IMPORT_TIME_PATTERN = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+ARTICLE = {"url": "https://example.com/cold-start",
+           "paragraphs": [f"Paragraph {i} of the article, which the government said on tuesday would support the economy." for i in range(12)]}
+
+def measure_import(module: str, cwd: str, env: Dict[str, str]) -> Tuple[float, List[Tuple[str, float]]]:
+    """
+        Imports the module in a new interpreter with -X importtime
+
+        Returns
+        -------
+        seconds, slowest: Tuple[float, List[Tuple[str, float]]]
+            The seconds to import the module, and the top-level packages it imported, by the seconds they took (slowest first)
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=cwd, env={**os.environ, **env},
+                            capture_output=True, text=True, check=True)
+    # The imports are listed after the modules they import, and the nested imports are indented
+    nested: List[Tuple[str, float]] = []
+    for match in IMPORT_TIME_PATTERN.finditer(result.stderr):
+        cumulative, name = int(match.group(2)) / 1e6, match.group(4)
+        if len(match.group(3)) > 1:
+            nested.append((name, cumulative))
+        elif name == module:
+            packages: Dict[str, float] = {}
+            for nested_name, nested_cumulative in nested:
+                package = nested_name.split(".")[0]
+                packages[package] = max(packages.get(package, 0.0), nested_cumulative)
+            return cumulative, sorted(packages.items(), key=lambda item: item[1], reverse=True)
+        else:
+            nested = []
+    raise RuntimeError(f"{module} is not in the output of -X importtime")
+
+def measure_start(args: List[str], base_url: str, first_request: Callable[[httpx.Client], httpx.Response],
+                  cwd: Optional[str] = None, env: Optional[Dict[str, str]] = None, timeout: float = 120) -> Dict[str, float]:
+    """
+        Starts the server in a subprocess, and measures the seconds until it accepts connections, until it is ready and until it has
+        answered the first request
+    """
+    timings: Dict[str, float] = {}
+    start_time = time.perf_counter()
+    process = subprocess.Popen([sys.executable, *args], cwd=cwd, env={**os.environ, **(env or {})})
+    try:
+        with httpx.Client(timeout=timeout) as client:
+            while "ready" not in timings:
+                if process.poll() is not None:
+                    raise RuntimeError(f"{args[0]} exited with code {process.returncode}")
+                if time.perf_counter() - start_time > timeout:
+                    raise RuntimeError(f"{args[0]} was not ready within {timeout}s")
+                try:
+                    response = client.get(f"{base_url}/ready", timeout=1)
+                except httpx.TransportError:
+                    time.sleep(0.01)
+                    continue
+                timings.setdefault("accepting", time.perf_counter() - start_time)
+                if response.status_code in (200, 404):
+                    timings["ready"] = time.perf_counter() - start_time
+                else:
+                    time.sleep(0.01)
+
+            first_request(client).raise_for_status()
+            timings["first_request"] = time.perf_counter() - start_time
+    finally:
+        stop_servers([process])
+    return timings
+
+def run_service(service: str, root: str, repeat: int) -> None:
+    if service == "news-scraper":
+        module, cwd = "news_scraper", os.path.join(root, "news-scraper", "src")
+        env = {"ARTICLE_CACHE_PATH": ""}
+        args = [os.path.join(root, "benchmarks", "offline_news_scraper.py"), "--port", str(NEWS_SCRAPER_PORT),
+                "--publishers", f"http://127.0.0.1:{PUBLISHERS_PORT}"]
+        base_url, server_cwd = NEWS_SCRAPER_URL, None
+
+        def first_request(client: httpx.Client) -> httpx.Response:
+            with client.stream("GET", f"{base_url}/article-details", params={"search_query": f"cold start {time.time_ns()}", "limit": 1}) as response:
+                response.read()
+            return response
+    else:
+        module, cwd = "main", os.path.join(root, "summarizer", "src")
+        env = {"VLLM_API_BASE": f"http://127.0.0.1:{STUB_VLLM_PORT}/v1", "SUMMARY_CACHE_SIZE": "0"}
+        args = ["-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(SUMMARIZER_PORT), "--log-level", "warning"]
+        base_url, server_cwd = SUMMARIZER_URL, cwd
+
+        def first_request(client: httpx.Client) -> httpx.Response:
+            return client.post(f"{base_url}/article-summary", json=ARTICLE)
+
+    # The first import compiles the byte code, which the image already has
+    measure_import(module, cwd, env)
+    imports = [measure_import(module, cwd, env) for _ in range(repeat)]
+    starts = [measure_start(args, base_url, first_request, cwd=server_cwd, env=env) for _ in range(repeat)]
+
+    print(f"{service} ({root}), median of {repeat}:")
+    print(f"  import: {statistics.median(seconds for seconds, _ in imports):.3f}s  "
+          + "  ".join(f"{name}: {statistics.median(start[name] for start in starts):.3f}s" for name in ("accepting", "ready", "first_request")))
+    print("  slowest imports: " + ", ".join(f"{name} {seconds:.3f}s" for name, seconds in imports[-1][1][:10]))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--services", nargs="+", choices=SERVICES, default=list(SERVICES))
+    parser.add_argument("--root", default=ROOT_DIR, help="Checkout of the repository to benchmark the services of")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of times to start each service")
+    args = parser.parse_args()
+    root = os.path.abspath(args.root)
+
+    processes = []
+    try:
+        if "news-scraper" in args.services:
+            processes.append(start_process([os.path.join(BENCHMARKS_DIR, "fake_publishers.py"), "--port", str(PUBLISHERS_PORT)],
+                                           f"http://127.0.0.1:{PUBLISHERS_PORT}/docs"))
+        if "summarizer" in args.services:
+            processes.append(start_process([os.path.join(ROOT_DIR, "summarizer", "benchmarks", "stub_openai_server.py"), "--port", str(STUB_VLLM_PORT)],
+                                           f"http://127.0.0.1:{STUB_VLLM_PORT}/docs"))
+        for service in args.services:
+            run_service(service, root, args.repeat)
+    finally:
+        stop_servers(processes)
+
+if __name__ == "__main__":
+    main()
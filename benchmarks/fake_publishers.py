@@ -0,0 +1,79 @@
+"""
+    Local stand-in for the websites of the news publishers, for benchmarking the news scraper without network access.
+    It serves a corpus of article pages (*.html files in a directory, e.g. recorded from real publishers), or generated pages if there is
+    no corpus, at /<query>/<page>.html. The query is only part of the URL, so that every query scrapes different URLs (and does not hit
+    the article cache), while any page can be served for any query (the page number wraps around the corpus). Each response takes LATENCY
+    seconds, plus up to JITTER seconds.
+
+    Usage:
+        python benchmarks/fake_publishers.py --port 8010 --corpus path/to/corpus --latency 0.2 --jitter 0.3
+"""
+from typing import List, Optional
+import argparse
+import asyncio
+import os
+import random
+
+from fastapi import FastAPI
+from fastapi.responses import Response
+import uvicorn
+
+LATENCY = 0.2
+JITTER = 0.3
+NUM_GENERATED_PAGES = 200
+
+WORDS = ("the government said on tuesday that it would announce new measures to support the economy after the report showed "
+         "inflation rose faster than expected in the third quarter while officials warned markets could remain volatile as "
+         "investors weighed the outlook for interest rates trade and jobs across the region over the coming months").split()
+
+app = FastAPI(title="fake-publishers")
+pages: List[bytes] = []
+
+def load_corpus(corpus_dir: str) -> List[bytes]:
+    files = sorted(f for f in os.listdir(corpus_dir) if f.endswith((".html", ".htm")))
+    corpus = []
+    for f in files:
+        with open(os.path.join(corpus_dir, f), "rb") as fp:
+            corpus.append(fp.read())
+    return corpus
+
+def generate_corpus(num_pages: int, seed: int = 0) -> List[bytes]:
+    """
+        Generates article pages with 10-30 paragraphs of random words, surrounded by the usual navigation, scripts and footer
+    """
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(num_pages):
+        paragraphs = "".join(f"<p>{' '.join(rng.choices(WORDS, k=rng.randint(20, 80)))}.</p>\n" for _ in range(rng.randint(10, 30)))
+        corpus.append(f"""<!DOCTYPE html>
+<html><head><title>Article {i}</title><script>var analytics = {{"page": {i}}};</script><style>p {{ margin: 0 }}</style></head>
+<body><header><nav><p>Home | World | Business</p></nav></header>
+<article><h1>Article {i}</h1>
+{paragraphs}</article>
+<aside><p>Most read</p></aside><footer><p>Copyright</p></footer></body></html>""".encode("utf-8"))
+    return corpus
+
+@app.get("/{query}/{page}.html")
+async def get_page(query: str, page: int) -> Response:
+    await asyncio.sleep(LATENCY + random.uniform(0, JITTER))
+    return Response(pages[page % len(pages)], media_type="text/html; charset=utf-8")
+
+def setup(corpus_dir: Optional[str], latency: float, jitter: float) -> None:
+    global LATENCY, JITTER
+    LATENCY, JITTER = latency, jitter
+    pages[:] = load_corpus(corpus_dir) if corpus_dir else generate_corpus(NUM_GENERATED_PAGES)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--corpus", default=None, help="Directory of *.html article pages (generated pages are served if not given)")
+    parser.add_argument("--latency", type=float, default=LATENCY)
+    parser.add_argument("--jitter", type=float, default=JITTER)
+    args = parser.parse_args()
+
+    setup(args.corpus, args.latency, args.jitter)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
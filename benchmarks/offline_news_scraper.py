@@ -0,0 +1,76 @@
+"""
+    Runs the news scraper with local stand-ins for Google News, for benchmarking without network access. The search returns NUM_RESULTS
+    entries for any query (after SEARCH_LATENCY seconds), whose links decode (after DECODE_LATENCY seconds each) to pages of the fake
+    publishers server (see fake_publishers.py). Everything else, i.e. fetching, parsing, caching and streaming, is the real news scraper.
+    The Google News rate limit and the politeness delay are turned off, unless they are set in the environment, as every page is on the
+    same local host.
+
+    Usage (the publishers server must be running):
+        python benchmarks/offline_news_scraper.py --port 8011 --publishers http://127.0.0.1:8010
+"""
+from typing import Dict
+import argparse
+import os
+import sys
+import time
+import zlib
+
+NEWS_SCRAPER_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "news-scraper", "src")
+
+SEARCH_LATENCY = 0.5
+DECODE_LATENCY = 0.2
+NUM_RESULTS = 20
+GOOGLE_NEWS_LINK = "https://news.google.com/rss/articles/"
+
+class FakeGoogleNews:
+    """
+        Stand-in for pygooglenews.GoogleNews, returning the same number of results for every query
+    """
+    def __init__(self, publishers_url: str):
+        self.publishers_url = publishers_url.rstrip("/")
+
+    def search(self, query: str, when: str = None, helper: bool = True) -> Dict:
+        time.sleep(SEARCH_LATENCY)
+        # Consecutive pages from a different offset for each query, so that there are no duplicates within the results of a query
+        first_page = zlib.crc32(query.encode("utf-8")) % 100000
+        path = "-".join(query.split()) or "query"
+        entries = [{"title": f"{query} {i}", "link": f"{GOOGLE_NEWS_LINK}{self.publishers_url}/{path}/{first_page + i}.html"}
+                   for i in range(NUM_RESULTS)]
+        return {"feed": {}, "entries": entries}
+
+def fake_decoder(link: str) -> Dict:
+    """
+        Stand-in for googlenewsdecoder.new_decoderv1. The fake links contain the url of the page on the publishers server
+    """
+    time.sleep(DECODE_LATENCY)
+    return {"status": True, "decoded_url": link.removeprefix(GOOGLE_NEWS_LINK)}
+
+def main():
+    global SEARCH_LATENCY, DECODE_LATENCY, NUM_RESULTS
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8011)
+    parser.add_argument("--publishers", default="http://127.0.0.1:8010", help="Base url of the fake publishers server")
+    parser.add_argument("--search-latency", type=float, default=SEARCH_LATENCY)
+    parser.add_argument("--decode-latency", type=float, default=DECODE_LATENCY)
+    parser.add_argument("--results", type=int, default=NUM_RESULTS, help="Number of search results for every query")
+    args = parser.parse_args()
+    SEARCH_LATENCY, DECODE_LATENCY, NUM_RESULTS = args.search_latency, args.decode_latency, args.results
+
+    os.environ.setdefault("INTERVAL_TIME", "0")
+    os.environ.setdefault("DOMAIN_MIN_INTERVAL", "0")
+    os.environ.setdefault("DOMAIN_MAX_CONNECTIONS", "100")
+
+    # The news scraper reads its logging config from the working directory
+    os.chdir(NEWS_SCRAPER_DIR)
+    sys.path.insert(0, NEWS_SCRAPER_DIR)
+    import uvicorn
+    import news_scraper
+    import utils.get_news
+
+    utils.get_news.gn = FakeGoogleNews(args.publishers)
+    utils.get_news.new_decoderv1 = fake_decoder
+    uvicorn.run(news_scraper.app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
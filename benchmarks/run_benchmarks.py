@@ -0,0 +1,257 @@
+"""
+    Offline end-to-end benchmark of the news scraper, the summarizer and the frontend pipeline. Everything runs locally, on a CPU-only box
+    with no network access:
+    - fake_publishers.py serves the article pages, with a configurable latency
+    - offline_news_scraper.py runs the news scraper with a fake Google News search and link decoder
+    - summarizer/benchmarks/stub_openai_server.py stands in for the vLLM server, with a configurable per-token latency
+    - the summarizer runs as is, pointed at the stub server and the news scraper
+    Each scenario is run at each concurrency level, with a different query for every request (so the requests are not coalesced and do not
+    hit the caches), and the throughput, the p50/p95/p99 latency and the time to the first article are reported.
+    - article-details: GET /article-details on the news scraper, until the stream ends
+    - article-summary: POST /article-summary on the summarizer, with articles scraped from the fake publishers
+    - pipeline: search_query of the frontend, until every summary is done (the frontend is imported in-process, so gradio must be installed)
+
+    Usage (from the repository root, in an environment with the dependencies of all three services):
+        python benchmarks/run_benchmarks.py --scenarios article-details article-summary pipeline --concurrency 1 4 16 --requests 32
+"""
+from typing import AsyncGenerator, Awaitable, Callable, Dict, List, Optional, Tuple
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import orjson
+
+BENCHMARKS_DIR = os.path.dirname(os.path.realpath(__file__))
+ROOT_DIR = os.path.join(BENCHMARKS_DIR, "..")
+SUMMARIZER_DIR = os.path.join(ROOT_DIR, "summarizer", "src")
+APP_DIR = os.path.join(ROOT_DIR, "app")
+
+PUBLISHERS_PORT = 8010
+NEWS_SCRAPER_PORT = 8011
+SUMMARIZER_PORT = 8012
+STUB_VLLM_PORT = 8013
+NEWS_SCRAPER_URL = f"http://127.0.0.1:{NEWS_SCRAPER_PORT}"
+SUMMARIZER_URL = f"http://127.0.0.1:{SUMMARIZER_PORT}"
+SCENARIOS = ("article-details", "article-summary", "pipeline")
+
+# A request returns (whether it succeeded, seconds to the first article or None)
+Request = Callable[[int], Awaitable[Tuple[bool, Optional[float]]]]
+
+def start_process(args: List[str], ready_url: str, cwd: Optional[str] = None, env: Optional[Dict[str, str]] = None,
+                  timeout: float = 60) -> subprocess.Popen:
+    """
+        Starts the server in a subprocess, and waits until ready_url responds with a success status (e.g. /ready, once the service has warmed up)
+    """
+    process = subprocess.Popen([sys.executable, *args], cwd=cwd, env={**os.environ, **(env or {})})
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{args[0]} exited with code {process.returncode}")
+        try:
+            if httpx.get(ready_url, timeout=1).is_success:
+                return process
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"{args[0]} did not start within {timeout}s")
+
+def start_servers(args: argparse.Namespace) -> List[subprocess.Popen]:
+    publishers_args = ["--port", str(PUBLISHERS_PORT), "--latency", str(args.publisher_latency), "--jitter", str(args.publisher_jitter)]
+    if args.corpus:
+        publishers_args += ["--corpus", os.path.abspath(args.corpus)]
+    processes = []
+    try:
+        processes.append(start_process([os.path.join(BENCHMARKS_DIR, "fake_publishers.py"), *publishers_args],
+                                       f"http://127.0.0.1:{PUBLISHERS_PORT}/docs"))
+        processes.append(start_process([os.path.join(BENCHMARKS_DIR, "offline_news_scraper.py"),
+                                        "--port", str(NEWS_SCRAPER_PORT),
+                                        "--publishers", f"http://127.0.0.1:{PUBLISHERS_PORT}",
+                                        "--search-latency", str(args.search_latency),
+                                        "--decode-latency", str(args.decode_latency)],
+                                       f"{NEWS_SCRAPER_URL}/ready",
+                                       env={"ARTICLE_CACHE_PATH": ""}))
+        processes.append(start_process([os.path.join(ROOT_DIR, "summarizer", "benchmarks", "stub_openai_server.py"),
+                                        "--port", str(STUB_VLLM_PORT),
+                                        "--base-latency", str(args.vllm_base_latency),
+                                        "--per-token-latency", str(args.vllm_per_token_latency)],
+                                       f"http://127.0.0.1:{STUB_VLLM_PORT}/docs"))
+        processes.append(start_process(["-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(SUMMARIZER_PORT), "--log-level", "warning"],
+                                       f"{SUMMARIZER_URL}/ready",
+                                       cwd=SUMMARIZER_DIR,
+                                       env={"VLLM_API_BASE": f"http://127.0.0.1:{STUB_VLLM_PORT}/v1",
+                                            "NEWS_SCRAPER_URL": f"{NEWS_SCRAPER_URL}/article-details",
+                                            # Every query gets the same pages, so the summaries would be cached after the first run
+                                            **({} if args.warm_caches else {"SUMMARY_CACHE_SIZE": "0"})}))
+    except Exception:
+        stop_servers(processes)
+        raise
+    return processes
+
+def stop_servers(processes: List[subprocess.Popen]) -> None:
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.wait()
+
+async def aiter_records(response: httpx.Response) -> AsyncGenerator[Dict, None]:
+    async for line in response.aiter_lines():
+        if line:
+            yield orjson.loads(line)
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return float("nan")
+    return statistics.quantiles(values, n=100)[int(p) - 1] if len(values) > 1 else values[0]
+
+async def run_scenario(request: Request, num_requests: int, concurrency: int) -> Dict[str, float]:
+    """
+        Sends num_requests requests, at most concurrency at a time, and gets the throughput and the latency percentiles
+
+        Returns
+        -------
+        results: Dict[str, float]
+            The number of requests and errors, the throughput (requests per second), and the p50/p95/p99 latency and time to the first article
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, first_articles = [], []
+    errors = 0
+
+    async def send(i: int):
+        nonlocal errors
+        async with semaphore:
+            start_time = time.perf_counter()
+            try:
+                success, first_article = await request(i)
+            except Exception:
+                success, first_article = False, None
+            latencies.append(time.perf_counter() - start_time)
+            errors += not success
+            if first_article is not None:
+                first_articles.append(first_article)
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*(send(i) for i in range(num_requests)))
+    elapsed = time.perf_counter() - start_time
+    return {"requests": num_requests, "concurrency": concurrency, "errors": errors, "throughput": num_requests / elapsed,
+            **{f"latency_p{p}": percentile(latencies, p) for p in (50, 95, 99)},
+            **{f"ttfa_p{p}": percentile(first_articles, p) for p in (50, 95, 99)}}
+
+def make_query(run: int, i: int) -> str:
+    return f"benchmark {run} {i}"
+
+async def get_articles(client: httpx.AsyncClient, query: str, limit: int) -> List[Dict]:
+    async with client.stream("GET", f"{NEWS_SCRAPER_URL}/article-details", params={"search_query": query, "limit": limit}) as response:
+        return [record async for record in aiter_records(response) if record.get("type") == "article"]
+
+def article_details_request(client: httpx.AsyncClient, run: int, limit: int) -> Request:
+    async def request(i: int) -> Tuple[bool, Optional[float]]:
+        start_time = time.perf_counter()
+        first_article, num_articles = None, 0
+        async with client.stream("GET", f"{NEWS_SCRAPER_URL}/article-details",
+                                 params={"search_query": make_query(run, i), "limit": limit}) as response:
+            async for record in aiter_records(response):
+                if record.get("type") == "article":
+                    num_articles += 1
+                    if first_article is None:
+                        first_article = time.perf_counter() - start_time
+        return response.is_success and num_articles > 0, first_article
+    return request
+
+def article_summary_request(client: httpx.AsyncClient, articles: List[Dict]) -> Request:
+    async def request(i: int) -> Tuple[bool, Optional[float]]:
+        article = articles[i % len(articles)]
+        response = await client.post(f"{SUMMARIZER_URL}/article-summary", json={"url": article["url"], "paragraphs": article["paragraphs"]})
+        # The summary arrives in one piece, so there is no separate time to the first article
+        return response.is_success, None
+    return request
+
+def pipeline_request(app, run: int, limit: int) -> Request:
+    async def request(i: int) -> Tuple[bool, Optional[float]]:
+        start_time = time.perf_counter()
+        first_article, output = None, ""
+        async for output in app.search_query(make_query(run, i), limit):
+            if first_article is None and "## Article" in output:
+                first_article = time.perf_counter() - start_time
+        return "Failed to summarize" not in output and first_article is not None, first_article
+    return request
+
+def import_frontend(fused: bool):
+    """
+        Imports the frontend in-process, pointed at the local services, with an empty summary store so that every search is live
+    """
+    os.environ["SUMMARY_STORE_PATH"] = os.path.join(tempfile.mkdtemp(), "summaries.sqlite3")
+    os.environ["FUSED_PIPELINE"] = "1" if fused else "0"
+    sys.path.insert(0, APP_DIR)
+    import app
+    app.NEWS_SCRAPER_URL = f"{NEWS_SCRAPER_URL}/article-details"
+    app.SUMMARIZER_STREAM_URL = f"{SUMMARIZER_URL}/article-summary/stream"
+    app.QUERY_SUMMARIES_URL = f"{SUMMARIZER_URL}/query-summaries"
+    return app
+
+def print_results(scenario: str, results: Dict[str, float]) -> None:
+    print(f"{scenario:<16} {results['concurrency']:>4} {results['requests']:>5} {results['errors']:>6} {results['throughput']:>8.2f}/s "
+          f"{results['latency_p50']:>7.2f}s {results['latency_p95']:>7.2f}s {results['latency_p99']:>7.2f}s "
+          f"{results['ttfa_p50']:>7.2f}s {results['ttfa_p95']:>7.2f}s")
+
+async def run(args: argparse.Namespace) -> List[Dict]:
+    all_results = []
+    print(f"{'scenario':<16} {'conc':>4} {'reqs':>5} {'errors':>6} {'throughput':>10} {'p50':>8} {'p95':>8} {'p99':>8} {'ttfa p50':>8} {'ttfa p95':>8}")
+    async with httpx.AsyncClient(timeout=None, limits=httpx.Limits(max_connections=None)) as client:
+        articles = []
+        if "article-summary" in args.scenarios:
+            # Scrape some articles to summarize, through the real scraper so that they are processed like in production
+            articles = await get_articles(client, "benchmark articles", max(args.limit, 10))
+            if not articles:
+                raise RuntimeError("Could not scrape any articles from the fake publishers")
+
+        app = import_frontend(args.frontend_mode == "fused") if "pipeline" in args.scenarios else None
+        for run_id, (scenario, concurrency) in enumerate((s, c) for s in args.scenarios for c in args.concurrency):
+            if scenario == "article-details":
+                request = article_details_request(client, run_id, args.limit)
+            elif scenario == "article-summary":
+                request = article_summary_request(client, articles)
+            else:
+                request = pipeline_request(app, run_id, args.limit)
+
+            results = await run_scenario(request, args.requests, concurrency)
+            print_results(scenario, results)
+            all_results.append({"scenario": scenario, **results})
+    return all_results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16], help="Concurrency levels to run each scenario at")
+    parser.add_argument("--requests", type=int, default=32, help="Number of requests at each concurrency level")
+    parser.add_argument("--limit", type=int, default=3, help="Number of articles per query")
+    parser.add_argument("--corpus", default=None, help="Directory of recorded *.html article pages (generated pages are used if not given)")
+    parser.add_argument("--publisher-latency", type=float, default=0.2)
+    parser.add_argument("--publisher-jitter", type=float, default=0.3)
+    parser.add_argument("--search-latency", type=float, default=0.5)
+    parser.add_argument("--decode-latency", type=float, default=0.2)
+    parser.add_argument("--vllm-base-latency", type=float, default=0.05)
+    parser.add_argument("--vllm-per-token-latency", type=float, default=0.01)
+    parser.add_argument("--frontend-mode", choices=("fused", "relay"), default="fused", help="How the frontend gets the summaries")
+    parser.add_argument("--warm-caches", action="store_true", help="Keep the summary cache enabled, to benchmark cached summaries")
+    parser.add_argument("--output", default=None, help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    processes = start_servers(args)
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        stop_servers(processes)
+
+    if args.output:
+        with open(args.output, "wb") as f:
+            f.write(orjson.dumps(results, option=orjson.OPT_INDENT_2))
+
+if __name__ == "__main__":
+    main()
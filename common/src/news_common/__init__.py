@@ -0,0 +1,3 @@
+from .ndjson import ndjson_line, with_heartbeats, aiter_ndjson, NDJSONDecoder, HEARTBEAT, HEARTBEAT_INTERVAL
+from .warm_up import WarmUp, WARM_UP
+from .cpus import available_cpus
@@ -0,0 +1,18 @@
+import os
+
+CGROUP_CPU_MAX = "/sys/fs/cgroup/cpu.max" # The CPU quota of the container, as "<quota> <period>" (in microseconds) or "max <period>"
+
+def available_cpus() -> int:
+    """
+        Gets the number of CPUs the process may use. Unlike os.cpu_count, this takes into account the CPUs the process is pinned to and
+        the CPU quota of the container (cgroup v2 cpu.max), which os.cpu_count ignores as it reports the cores of the host
+    """
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    try:
+        with open(CGROUP_CPU_MAX) as f:
+            quota, period = f.read().split()[:2]
+        if quota != "max":
+            cpus = min(cpus, max(1, int(quota) // int(period)))
+    except (OSError, ValueError):
+        pass
+    return cpus
@@ -0,0 +1,82 @@
+from typing import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+import logging
+import os
+import re
+import time
+import uuid
+
+from prometheus_client import Histogram
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1" # Whether to record the stage timings in the Prometheus histograms
+SLOW_STAGE_SECONDS = float(os.environ.get("SLOW_STAGE_SECONDS", 10)) # Stages slower than this are logged, with the trace ID of the request
+TRACE_ID_HEADER = "X-Request-ID"
+TRACE_ID_PATTERN = re.compile(r"[A-Za-z0-9._\-]{1,64}") # Trace IDs sent by the clients are only used if they are safe to log
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+
+# The trace ID of the request being handled, set by TraceIDMiddleware. Tasks created while handling the request inherit it
+trace_id: ContextVar[str] = ContextVar("trace_id", default="-")
+
+class StageMetrics:
+    """
+        Times the stages of the pipeline of a service, in the Prometheus histogram <service>_stage_seconds labelled by stage.
+        The stages slower than SLOW_STAGE_SECONDS are also logged to the logger of the service, with the trace ID of the request.
+    """
+    def __init__(self, service: str, description: str):
+        self.logger = logging.getLogger(service)
+        self.stage_seconds = Histogram(f"{service.replace('-', '_')}_stage_seconds", description, ["stage"], buckets=STAGE_BUCKETS)
+
+    def observe(self, stage: str, seconds: float) -> None:
+        """
+            Records the time spent in a stage of the pipeline, and logs it if it was slow
+
+            Parameters
+            ----------
+            stage: str
+                The name of the stage, e.g. fetch
+
+            seconds: float
+                The number of seconds spent in the stage
+        """
+        if METRICS_ENABLED:
+            self.stage_seconds.labels(stage).observe(seconds)
+        if seconds >= SLOW_STAGE_SECONDS:
+            self.logger.warning(f"[{trace_id.get()}] Slow {stage} stage: {seconds:.2f}s")
+
+    @contextmanager
+    def time(self, stage: str) -> Iterator[None]:
+        """
+            Records the time spent in the body of the context as a stage of the pipeline (see observe)
+        """
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start_time)
+
+class TraceIDMiddleware:
+    """
+        ASGI middleware that sets the trace ID of each request, from the X-Request-ID header sent by the client (or a new one),
+        and sends it back in the response headers, so that the logs of one request can be followed across the services
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        value = dict(scope["headers"]).get(TRACE_ID_HEADER.lower().encode("latin-1"), b"").decode("latin-1")
+        request_trace_id = value if TRACE_ID_PATTERN.fullmatch(value) else uuid.uuid4().hex
+        token = trace_id.set(request_trace_id)
+
+        async def send_with_trace_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (TRACE_ID_HEADER.lower().encode("latin-1"), request_trace_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_trace_id)
+        finally:
+            trace_id.reset(token)
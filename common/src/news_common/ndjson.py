@@ -0,0 +1,146 @@
+from typing import Any, AsyncGenerator, AsyncIterator, Dict, List
+import asyncio
+import logging
+
+import httpx
+import orjson
+
+logger = logging.getLogger('ndjson')
+
+HEARTBEAT_INTERVAL = 5 # Seconds without a record before a heartbeat is sent, so that the consumer knows the stream is still alive
+HEARTBEAT = b'{"type":"heartbeat"}\n'
+
+def ndjson_line(record: Dict) -> bytes:
+    """
+        Formats the record as a line of newline-delimited JSON (NDJSON). orjson never outputs raw newlines, so each record is exactly one line.
+    """
+    return orjson.dumps(record) + b"\n"
+
+async def with_heartbeats(lines: AsyncIterator[bytes], interval: float = HEARTBEAT_INTERVAL) -> AsyncGenerator[bytes, None]:
+    """
+        Yields the lines, and a heartbeat line whenever no line has been yielded for interval seconds.
+
+        Parameters
+        ----------
+        lines: AsyncIterator[bytes]
+            The NDJSON lines to stream
+
+        interval: float
+            Seconds without a line before a heartbeat is sent
+
+        Yields
+        ------
+        line: bytes
+            The NDJSON lines, with heartbeat lines in between
+    """
+    next_line = None
+    try:
+        while True:
+            if next_line is None:
+                next_line = asyncio.ensure_future(anext(lines))
+            # Wait on the same future across heartbeats, cancelling it would close the generator
+            done, _ = await asyncio.wait({next_line}, timeout=interval)
+            if not done:
+                yield HEARTBEAT
+                continue
+
+            try:
+                line = next_line.result()
+            except StopAsyncIteration:
+                break
+            next_line = None
+            yield line
+    finally:
+        if next_line is not None and not next_line.done():
+            next_line.cancel()
+            await asyncio.gather(next_line, return_exceptions=True)
+        if hasattr(lines, "aclose"):
+            await lines.aclose()
+
+class NDJSONDecoder:
+    """
+        Incrementally decodes newline-delimited JSON (NDJSON) from chunks of bytes, as they arrive from a stream.
+        A record may be split across chunks, or several records may arrive in the same chunk. The bytes after the last newline are
+        kept in the buffer until the rest of the record arrives, and are not scanned for a newline again, so a large record arriving
+        in many small chunks is only scanned and copied once.
+        Lines that are not valid JSON (e.g. a record cut short by the sender) are logged and skipped, so that one bad line does not end
+        the stream of records after it. The number of lines skipped is counted in skipped.
+    """
+    def __init__(self):
+        self._buffer = bytearray()
+        self._start = 0 # Start of the first record that has not been decoded
+        self._scanned = 0 # Everything before this has been scanned for newlines
+        self.skipped = 0
+
+    def _decode(self, line: memoryview, records: List[Any]) -> None:
+        try:
+            records.append(orjson.loads(line))
+        except orjson.JSONDecodeError as e:
+            if not bytes(line).strip():
+                return
+            self.skipped += 1
+            logger.warning(f"Skipped a line that is not valid JSON ({e}): {bytes(line[:200])!r}")
+
+    def feed(self, chunk: bytes) -> List[Any]:
+        """
+            Adds the chunk to the buffer, and decodes all the complete records in the buffer
+
+            Parameters
+            ----------
+            chunk: bytes
+                The next chunk of bytes from the stream
+
+            Returns
+            -------
+            records: List[Any]
+                The decoded records (empty lines, and lines that are not valid JSON, are skipped)
+        """
+        self._buffer += chunk
+        records = []
+        while (end := self._buffer.find(b"\n", self._scanned)) != -1:
+            if end > self._start:
+                # Decode straight from the buffer, without copying the line out first
+                with memoryview(self._buffer)[self._start:end] as line:
+                    self._decode(line, records)
+            self._start = self._scanned = end + 1
+        self._scanned = len(self._buffer)
+
+        # Drop the decoded records from the buffer
+        if self._start:
+            del self._buffer[:self._start]
+            self._scanned -= self._start
+            self._start = 0
+        return records
+
+    def close(self) -> List[Any]:
+        """
+            Decodes the last record if the stream did not end with a newline
+        """
+        records = []
+        if self._buffer[self._start:].strip():
+            with memoryview(self._buffer)[self._start:] as line:
+                self._decode(line, records)
+        self._buffer.clear()
+        self._start = self._scanned = 0
+        return records
+
+async def aiter_ndjson(response: httpx.Response) -> AsyncGenerator[Any, None]:
+    """
+        Yields the records of the NDJSON response as they arrive (see NDJSONDecoder)
+
+        Parameters
+        ----------
+        response: httpx.Response
+            The streamed response
+
+        Yields
+        ------
+        record: Any
+            The decoded records (empty lines, and lines that are not valid JSON, are skipped)
+    """
+    decoder = NDJSONDecoder()
+    async for chunk in response.aiter_bytes():
+        for record in decoder.feed(chunk):
+            yield record
+    for record in decoder.close():
+        yield record
@@ -0,0 +1,84 @@
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import os
+import time
+
+WARM_UP = os.environ.get("WARM_UP", "1") == "1" # Whether to run the warm-up steps at startup (e.g. loading the model). Otherwise everything is loaded on first use
+WARM_UP_RETRY_DELAY = float(os.environ.get("WARM_UP_RETRY_DELAY", 1)) # Seconds before a failed warm-up step is retried, doubled after every attempt
+WARM_UP_MAX_RETRY_DELAY = float(os.environ.get("WARM_UP_MAX_RETRY_DELAY", 300)) # Max seconds between two retries of a failed warm-up step
+
+class WarmUp:
+    """
+        Runs the warm-up steps of the service (e.g. loading the tokenizer) in the background at startup, so that the service can
+        start accepting connections right away, and reports whether they are done for the readiness endpoint.
+        The steps run one at a time, in the order they were added. Every step loads something that would otherwise be loaded on first use,
+        so a step that fails (e.g. the backend is not reachable yet at boot) does not keep the service from being ready: the service reports
+        ready but degraded once every step has run, and the failed steps are retried in the background with exponential backoff, until they
+        succeed (or are loaded on first use).
+    """
+    def __init__(self, service: str, enabled: bool = WARM_UP, retry_delay: float = WARM_UP_RETRY_DELAY,
+                 max_retry_delay: float = WARM_UP_MAX_RETRY_DELAY):
+        self.logger = logging.getLogger(service)
+        self.enabled = enabled
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.steps: List[Tuple[str, Callable[[], Awaitable[None]]]] = []
+        self.seconds: Dict[str, float] = {} # Seconds each step took, the last attempt for the steps that were retried
+        self.errors: Dict[str, str] = {} # The error of the last attempt of the steps that have not succeeded
+        self.attempts: Dict[str, int] = {}
+        self.done = not enabled
+        self.created_at = time.perf_counter()
+        self.ready_after: Optional[float] = None # Seconds from the creation of the app until it was ready
+
+    def add(self, name: str, step: Callable[[], Awaitable[None]]) -> None:
+        self.steps.append((name, step))
+
+    async def _run_step(self, name: str, step: Callable[[], Awaitable[None]]) -> None:
+        start_time = time.perf_counter()
+        self.attempts[name] = self.attempts.get(name, 0) + 1
+        try:
+            await step()
+        except Exception as e:
+            self.logger.error(f"Failed to warm up {name} (attempt {self.attempts[name]}): {e!r}")
+            self.errors[name] = repr(e)
+        else:
+            if self.errors.pop(name, None) is not None:
+                self.logger.info(f"Warmed up {name} after {self.attempts[name]} attempts")
+        self.seconds[name] = time.perf_counter() - start_time
+
+    async def run(self) -> None:
+        if not self.enabled:
+            return
+        for name, step in self.steps:
+            await self._run_step(name, step)
+        self.done = True
+        self.ready_after = time.perf_counter() - self.created_at
+        self.logger.info(f"Warm-up done in {sum(self.seconds.values()):.2f}s ({', '.join(f'{name}: {s:.2f}s' for name, s in self.seconds.items())})"
+                         + (f", degraded as {', '.join(self.errors)} failed" if self.errors else ""))
+
+        delay = self.retry_delay
+        while self.errors:
+            await asyncio.sleep(delay)
+            delay = min(2 * delay, self.max_retry_delay)
+            for name, step in self.steps:
+                if name in self.errors:
+                    await self._run_step(name, step)
+
+    @property
+    def ready(self) -> bool:
+        return self.done
+
+    @property
+    def degraded(self) -> bool:
+        """
+            Whether any of the steps has failed, and is left to be loaded on first use until a retry succeeds
+        """
+        return bool(self.errors)
+
+    def get_state(self) -> Dict:
+        """
+            Gets whether the service is ready (and degraded), and how long each of the warm-up steps took
+        """
+        return {"ready": self.ready, "degraded": self.degraded, "warm_up": self.enabled, "steps": dict(self.seconds), "errors": dict(self.errors),
+                "attempts": dict(self.attempts), "ready_after": self.ready_after}
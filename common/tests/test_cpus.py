@@ -0,0 +1,21 @@
+"""
+    Tests of the number of CPUs available to the container
+"""
+import os
+
+import pytest
+
+from news_common import cpus
+
+@pytest.mark.parametrize("cpu_max, expected", [("max 100000\n", None), ("200000 100000\n", 2), ("50000 100000\n", 1), ("garbage\n", None)])
+def test_cpu_quota(tmp_path, monkeypatch: pytest.MonkeyPatch, cpu_max: str, expected):
+    path = tmp_path / "cpu.max"
+    path.write_text(cpu_max)
+    monkeypatch.setattr(cpus, "CGROUP_CPU_MAX", str(path))
+    monkeypatch.setattr(os, "sched_getaffinity", lambda pid: set(range(4)))
+    assert cpus.available_cpus() == (expected or 4)
+
+def test_without_cgroup(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(cpus, "CGROUP_CPU_MAX", "/nonexistent/cpu.max")
+    monkeypatch.setattr(os, "sched_getaffinity", lambda pid: {0, 1})
+    assert cpus.available_cpus() == 2
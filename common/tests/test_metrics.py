@@ -0,0 +1,39 @@
+"""
+    Tests of the stage timings and the trace IDs
+"""
+import asyncio
+
+from prometheus_client import REGISTRY
+
+from news_common.metrics import StageMetrics, TraceIDMiddleware, TRACE_ID_HEADER, trace_id
+
+stage_metrics = StageMetrics("test-service", "Seconds spent in each stage of the test pipeline")
+
+def test_stage_is_recorded_in_the_histogram_of_the_service():
+    with stage_metrics.time("parse"):
+        pass
+    stage_metrics.observe("parse", 0.5)
+    assert REGISTRY.get_sample_value("test_service_stage_seconds_count", {"stage": "parse"}) == 2
+    assert REGISTRY.get_sample_value("test_service_stage_seconds_sum", {"stage": "parse"}) >= 0.5
+
+def run_request(header: bytes) -> tuple:
+    seen, sent = [], []
+
+    async def app(scope, receive, send):
+        seen.append(trace_id.get())
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "headers": [(TRACE_ID_HEADER.lower().encode("latin-1"), header)]}
+    asyncio.run(TraceIDMiddleware(app)(scope, None, send))
+    return seen[0], dict(sent[0]["headers"])[TRACE_ID_HEADER.lower().encode("latin-1")].decode("latin-1")
+
+def test_trace_id_is_taken_from_the_request_and_sent_back():
+    assert run_request(b"abc-123") == ("abc-123", "abc-123")
+    assert trace_id.get() == "-"
+
+def test_unsafe_trace_id_is_replaced():
+    seen, returned = run_request(b"bad id\r\n")
+    assert seen == returned and seen != "bad id\r\n" and len(seen) == 32
@@ -0,0 +1,46 @@
+"""
+    Tests of the incremental NDJSON decoder
+"""
+from typing import Any, List
+import random
+
+import orjson
+
+from news_common import NDJSONDecoder
+
+def decode(chunks: List[bytes]) -> List[Any]:
+    decoder = NDJSONDecoder()
+    records = []
+    for chunk in chunks:
+        records.extend(decoder.feed(chunk))
+    return records + decoder.close()
+
+def test_records_split_across_chunks():
+    records = [{"url": f"https://example.com/{i}", "paragraphs": ["text " * i] * i} for i in range(20)]
+    data = b"".join(orjson.dumps(record) + b"\n" for record in records)
+    rng = random.Random(0)
+    for _ in range(50):
+        cuts = sorted(rng.sample(range(1, len(data)), k=rng.randint(1, 30)))
+        chunks = [data[start:end] for start, end in zip([0, *cuts], [*cuts, len(data)])]
+        assert decode(chunks) == records
+
+def test_empty_lines_and_missing_trailing_newline():
+    assert decode([b'{"a":1}\n\n', b'\n{"b"', b':2}']) == [{"a": 1}, {"b": 2}]
+    assert decode([b"", b"\n", b"  "]) == []
+
+def test_large_record_in_small_chunks():
+    record = {"paragraphs": ["word " * 100] * 200}
+    data = orjson.dumps(record) + b"\n"
+    assert decode([data[i:i + 1] for i in range(len(data))]) == [record]
+
+def test_malformed_lines_are_skipped():
+    decoder = NDJSONDecoder()
+    records = decoder.feed(b'{"a":1}\n{"b":\n  \n{"c":3}\n{"d"') + decoder.close()
+    assert records == [{"a": 1}, {"c": 3}]
+    assert decoder.skipped == 2
+
+def test_stream_continues_after_malformed_line():
+    records = [{"url": f"https://example.com/{i}"} for i in range(5)]
+    data = b"".join(orjson.dumps(record) + b"\n" for record in records[:2]) + b"\xff\xfe not json\n" + \
+        b"".join(orjson.dumps(record) + b"\n" for record in records[2:])
+    assert decode([data[i:i + 7] for i in range(0, len(data), 7)]) == records
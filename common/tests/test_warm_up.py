@@ -0,0 +1,52 @@
+"""
+    Tests of the readiness of the services while warming up
+"""
+import asyncio
+
+from news_common import WarmUp
+
+def test_ready_once_every_step_has_run():
+    async def run():
+        warm_up = WarmUp("test-service", retry_delay=0.01)
+        loaded = asyncio.Event()
+        warm_up.add("model", loaded.wait)
+        task = asyncio.create_task(warm_up.run())
+        await asyncio.sleep(0.02)
+        before = warm_up.ready
+        loaded.set()
+        await task
+        return before, warm_up.get_state()
+
+    before, state = asyncio.run(run())
+    assert not before
+    assert state["ready"] and not state["degraded"] and state["attempts"] == {"model": 1}
+
+def test_failed_step_is_degraded_and_retried():
+    async def run():
+        warm_up = WarmUp("test-service", retry_delay=0.01, max_retry_delay=0.02)
+        attempts = 0
+
+        async def flaky():
+            nonlocal attempts
+            attempts += 1
+            if attempts < 4:
+                raise ConnectionError("The backend is not reachable")
+
+        warm_up.add("backend", flaky)
+        warm_up.add("tokenizer", lambda: asyncio.sleep(0))
+        task = asyncio.create_task(warm_up.run())
+        while not warm_up.ready:
+            await asyncio.sleep(0)
+        degraded = warm_up.get_state()
+        await asyncio.wait_for(task, 1)
+        return degraded, warm_up.get_state()
+
+    degraded, state = asyncio.run(run())
+    assert degraded["ready"] and degraded["degraded"] and "ConnectionError" in degraded["errors"]["backend"]
+    assert state["ready"] and not state["degraded"] and state["errors"] == {}
+    assert state["attempts"] == {"backend": 4, "tokenizer": 1}
+
+def test_disabled_is_ready_right_away():
+    warm_up = WarmUp("test-service", enabled=False)
+    asyncio.run(warm_up.run())
+    assert warm_up.ready and not warm_up.degraded
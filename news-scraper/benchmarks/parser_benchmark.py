@@ -0,0 +1,67 @@
+"""
+    Micro-benchmark of the HTML parser backends over a corpus of saved article pages (*.html files in a directory).
+    Each backend runs in a fresh process, so that the peak RSS of one backend does not affect the others.
+
+    Usage (from the news-scraper directory):
+        python benchmarks/parser_benchmark.py path/to/corpus --backends html.parser lxml selectolax --repeat 3
+"""
+from typing import List, Tuple
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "src"))
+
+from utils.article_scraper import parse_article # noqa: E402
+from utils.html_parser import PARSER_BACKENDS # noqa: E402
+
+def load_corpus(corpus_dir: str) -> List[bytes]:
+    files = sorted(f for f in os.listdir(corpus_dir) if f.endswith((".html", ".htm")))
+    corpus = []
+    for f in files:
+        with open(os.path.join(corpus_dir, f), "rb") as fp:
+            corpus.append(fp.read())
+    return corpus
+
+def run_backend(corpus_dir: str, backend: str, repeat: int) -> Tuple[int, float, int, int]:
+    """
+        Parses every page in the corpus repeat times with the backend. Runs in its own process.
+
+        Returns
+        -------
+        num_docs, seconds, num_paragraphs, peak_rss_kb: Tuple[int, float, int, int]
+    """
+    corpus = load_corpus(corpus_dir)
+    num_paragraphs = 0
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        for content in corpus:
+            num_paragraphs += len(parse_article(content, backend))
+    seconds = time.perf_counter() - start_time
+    peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return len(corpus) * repeat, seconds, num_paragraphs // repeat, peak_rss_kb
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", help="Directory containing the saved HTML pages")
+    parser.add_argument("--backends", nargs="+", default=list(PARSER_BACKENDS), choices=PARSER_BACKENDS)
+    parser.add_argument("--repeat", type=int, default=3, help="Number of passes over the corpus")
+    args = parser.parse_args()
+
+    print(f"{'backend':<12} {'docs':>6} {'docs/sec':>10} {'paragraphs':>11} {'peak RSS (MB)':>14}")
+    context = multiprocessing.get_context("spawn")
+    for backend in args.backends:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            try:
+                num_docs, seconds, num_paragraphs, peak_rss_kb = executor.submit(run_backend, args.corpus, backend, args.repeat).result()
+            except ImportError as e:
+                print(f"{backend:<12} skipped ({e})")
+                continue
+        print(f"{backend:<12} {num_docs:>6} {num_docs / seconds:>10.1f} {num_paragraphs:>11} {peak_rss_kb / 1024:>14.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -2,75 +2,161 @@ import asyncio
 import logging
 import logging.config
 import time
+from contextlib import aclosing, asynccontextmanager
 from typing import Annotated, AsyncGenerator
 
-import orjson
 from fastapi import FastAPI, Query
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from news_common import ndjson_line, with_heartbeats, WarmUp
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 import uvicorn
 
-from utils import get_google_news, scrape_article
+from utils import (get_google_news, scrape_articles_concurrently, domain_scheduler, close_http_client, shutdown_parse_executor, article_cache,
+                   query_coalescer, InFlightQuery, run_in_parse_executor, minhash_signature, NearDuplicateIndex,
+                   observe_stage, time_stage, trace_id, TraceIDMiddleware, load_google_news, warm_up_parse_executor)
 
-logging.config.fileConfig('news_scraper_logging.conf', disable_existing_loggers=False)
 logger = logging.getLogger('news-scraper')
 
-app = FastAPI(title='news-scraper')
+# Creates the Google News client and starts the parse workers in the background at startup, instead of on the first request (see /ready)
+warm_up = WarmUp('news-scraper')
+warm_up.add("google_news", lambda: asyncio.to_thread(load_google_news))
+warm_up.add("parse_executor", warm_up_parse_executor)
 
-async def get_articles_by_query(query: str, limit: int) -> AsyncGenerator[str, None]: # think of a better name!
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Configured at startup rather than at import, so that importing the module (e.g. in the benchmarks) does not read the config file
+    logging.config.fileConfig('news_scraper_logging.conf', disable_existing_loggers=False)
+    # Requests are accepted while warming up, the client and the workers are created by whichever comes first
+    warm_up_task = asyncio.create_task(warm_up.run())
+    yield
+    warm_up_task.cancel()
+    # Close the pooled connections used for scraping the articles
+    await close_http_client()
+    shutdown_parse_executor()
+    article_cache.close()
+
+app = FastAPI(title='news-scraper', lifespan=lifespan)
+app.add_middleware(TraceIDMiddleware)
+
+async def scrape_query(query: str, flight: InFlightQuery) -> None:
     """
         Gets the URLs of articles related to the query, and asynchronously scrape the articles to obtain their information.
-        Returns an asynchronous generator that yields the json formatted string containing article details.
+        Near-duplicates of the articles published so far (e.g. syndicated copies of the same wire story) are not published as articles,
+        so they do not count towards the limit and are not summarized.
+        The NDJSON lines containing the article details are published to the flight, which is shared by all the requests
+        for the same query, until it has enough articles for all of them.
 
         Parameters
         ----------
         query: str
             The query to search articles on
 
-        limit: int
-            The maximum number of articles to return. This is so that the articles do not take too long to return as each scraping each article
-            has a 5 second delay
-
-        Yields
-        -------
-        result: str
-            A JSON-formatted string representing a dictionary containing the url of the article and a list of <p> tags at each article.
+        flight: InFlightQuery
+            The in-flight pipeline to publish the articles to. The articles are scraped concurrently (up to MAX_CONCURRENT_SCRAPES at a time),
+            and any scrapes still in flight are cancelled once the flight has enough articles
     """
-    logger.info(f"Started news scraping for \"{query}\"")
+    logger.info(f"[{trace_id.get()}] Started news scraping for \"{query}\"")
     start_time = time.time()
+    start_wait_time = domain_scheduler.total_wait_time()
 
     urls = get_google_news(query)
+    duplicates = NearDuplicateIndex() # Only the articles of this query, which is all that the clients of the flight have been sent
+    num_duplicates = 0
     
-    tasks = []
-    count = 0
-    # Asynchronously scrape each article at the url, as they arrive from the async generator from get_google_news
-    async for url in urls:
-        if count >= limit:
-            break
-        
-        # Step 1: Asynchronously scrape the article at the URL
-        task = asyncio.create_task(scrape_article(url))
-        task_results = await task
-
-        # Step 2: As these results from the scraping task arrive, yield them
-        url, paragraphs = task_results
-        tasks.append(task)
-        if len(paragraphs) > 0:
-            count += 1
-            result = {
-                        "url": url, 
-                        "paragraphs": paragraphs
-                    }
-            # Format the dictionary into a json string
-            output = orjson.dumps(result).decode("utf-8")
-            yield output     
-
-    logger.info(f"News scraping completed in {time.time() - start_time:.2f}s")
+    # Scrape the articles concurrently as the urls arrive from get_google_news, and publish them in the order that they complete
+    async with aclosing(scrape_articles_concurrently(urls)) as scraped_articles:
+        async for url, paragraphs in scraped_articles:
+            if paragraphs is None:
+                # Let the requests know about the failure without breaking the stream. This does not count towards the limit
+                flight.publish(ndjson_line({"type": "error", "url": url, "error": "Failed to scrape the article"}), is_article=False)
+            elif len(paragraphs) > 0:
+                with time_stage("dedup"):
+                    signature = await run_in_parse_executor(minhash_signature, paragraphs)
+                duplicate_of = duplicates.find(signature) if signature is not None else None
+                if duplicate_of is not None:
+                    # Merge it into the article it duplicates, by only passing its url along. This does not count towards the limit
+                    num_duplicates += 1
+                    flight.publish(ndjson_line({"type": "duplicate", "url": url, "duplicate_of": duplicate_of}), is_article=False)
+                    continue
+                if signature is not None:
+                    duplicates.add(url, signature)
+
+                result = {
+                            "type": "article",
+                            "url": url, 
+                            "paragraphs": paragraphs
+                        }
+                if flight.num_articles == 0:
+                    observe_stage("first_article", time.time() - start_time)
+                # Format the dictionary into a json line, once for all the requests sharing the pipeline
+                flight.publish(ndjson_line(result))
+
+            if flight.is_full():
+                # Stop new requests from joining before tearing down, as this pipeline will not produce any more articles.
+                # Leaving the context cancels the scrapes that are still in flight
+                flight.finish()
+                break
+
+    observe_stage("pipeline", time.time() - start_time)
+    logger.info(f"[{trace_id.get()}] News scraping completed in {time.time() - start_time:.2f}s "
+                f"({domain_scheduler.total_wait_time() - start_wait_time:.2f}s spent waiting on the politeness scheduler, "
+                f"{num_duplicates} near-duplicate articles dropped)")
+
+async def get_articles_by_query(query: str, limit: int) -> AsyncGenerator[bytes, None]: # think of a better name!
+    """
+        Returns an asynchronous generator that yields newline-delimited JSON (NDJSON) lines containing article details for articles related to the query.
+        Concurrent requests for the same query share the same scraping pipeline (see scrape_query), and requests that join
+        late get the articles scraped so far first. A heartbeat line is sent whenever there has been no other line for HEARTBEAT_INTERVAL seconds.
+
+        Parameters
+        ----------
+        query: str
+            The query to search articles on
+
+        limit: int
+            The maximum number of articles to return
+
+        Yields
+        -------
+        line: bytes
+            A JSON line representing a dictionary, one of
+            {"type": "article", "url": the url of the article, "paragraphs": a list of <p> tags at the article}
+            {"type": "error", "url": the url of the article, "error": the error message}
+            {"type": "duplicate", "url": the url of the article, "duplicate_of": the url of the article it is a near-duplicate of}
+            {"type": "heartbeat"}
+    """
+    async with aclosing(with_heartbeats(query_coalescer.stream(query, limit, scrape_query))) as lines:
+        async for line in lines:
+            yield line
 
 @app.get("/article-details")
 async def get_article_details(search_query: Annotated[str, Query(min_length=1, max_length=50, pattern=r'^[a-zA-Z0-9\s\-_\,]+$')], # Allow only alphanumeric characters and '-', '_', ',' in the query
                             limit: Annotated[int, Query(gt=0)] = 3
             ):
-    return StreamingResponse(get_articles_by_query(search_query, limit), media_type='application/json')
+    return StreamingResponse(get_articles_by_query(search_query, limit), media_type='application/x-ndjson')
+
+@app.get("/ready")
+async def get_readiness():
+    """
+        API endpoint for the readiness probe. Responds with 503 until the Google News client has been created and the parse workers have
+        started, and with 200 after, together with how long each of the warm-up steps took. If a step failed, the service is still ready
+        but degraded, as the step is retried in the background and otherwise done on first use
+    """
+    return JSONResponse(warm_up.get_state(), status_code=200 if warm_up.ready else 503)
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+        API endpoint for Prometheus to scrape the stage timing histograms from
+    """
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/cache-stats")
+async def get_cache_stats():
+    """
+        API endpoint to get the hit/miss/eviction counters of the article cache, to help with sizing the cache
+    """
+    return article_cache.stats
 
     
 
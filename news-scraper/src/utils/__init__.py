@@ -1,2 +1,10 @@
-from .get_news import get_google_news
-from .article_scraper import scrape_article
\ No newline at end of file
+from .get_news import get_google_news, load_google_news
+from .article_scraper import scrape_article
+from .scrape_pool import scrape_articles_concurrently
+from .domain_scheduler import domain_scheduler
+from .http_client import close_http_client
+from .html_parser import shutdown_parse_executor, run_in_parse_executor, warm_up_parse_executor
+from .article_cache import article_cache
+from .query_coalescer import query_coalescer, InFlightQuery
+from .dedup import minhash_signature, NearDuplicateIndex
+from .metrics import observe_stage, time_stage, trace_id, TraceIDMiddleware
@@ -0,0 +1,138 @@
+from typing import Dict, List, Optional, Tuple
+from collections import OrderedDict
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import orjson
+
+logger = logging.getLogger('article_scraper')
+
+ARTICLE_CACHE_PATH = os.environ.get("ARTICLE_CACHE_PATH", "article_cache.sqlite3") # Set to an empty string to only cache in memory
+ARTICLE_CACHE_TTL = float(os.environ.get("ARTICLE_CACHE_TTL", 6 * 60 * 60)) # Seconds before a cached article is scraped again
+ARTICLE_CACHE_MAX_ENTRIES = int(os.environ.get("ARTICLE_CACHE_MAX_ENTRIES", 10000)) # Max number of articles in the on-disk cache
+ARTICLE_CACHE_MEMORY_ENTRIES = int(os.environ.get("ARTICLE_CACHE_MEMORY_ENTRIES", 256)) # Max number of articles in the in-memory LRU
+
+class ArticleCache:
+    """
+        Cache of the processed paragraphs of each article, keyed by the (decoded) URL of the article.
+        There are two tiers: an in-memory LRU in front of an on-disk SQLite database, which persists across restarts.
+        Entries expire after ttl seconds, and the least recently used entries are evicted when either tier is full.
+    """
+    def __init__(self,
+                 path: str = ARTICLE_CACHE_PATH,
+                 ttl: float = ARTICLE_CACHE_TTL,
+                 max_entries: int = ARTICLE_CACHE_MAX_ENTRIES,
+                 memory_entries: int = ARTICLE_CACHE_MEMORY_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+
+        self._memory: OrderedDict[str, Tuple[float, List[str]]] = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self.stats: Dict[str, int] = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "memory_evictions": 0, "disk_evictions": 0, "expirations": 0}
+
+    def _get_db(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS articles (url TEXT PRIMARY KEY, paragraphs BLOB, created_at REAL, accessed_at REAL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS articles_accessed_at ON articles (accessed_at)")
+        return self._db
+
+    def _remember(self, url: str, created_at: float, paragraphs: List[str]) -> None:
+        self._memory[url] = (created_at, paragraphs)
+        self._memory.move_to_end(url)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+            self.stats["memory_evictions"] += 1
+
+    def _get_from_disk(self, url: str) -> Optional[Tuple[float, List[str]]]:
+        with self._db_lock:
+            db = self._get_db()
+            row = db.execute("SELECT created_at, paragraphs FROM articles WHERE url = ? AND created_at > ?",
+                             (url, time.time() - self.ttl)).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE articles SET accessed_at = ? WHERE url = ?", (time.time(), url))
+            db.commit()
+        return row[0], orjson.loads(row[1])
+
+    def _set_on_disk(self, url: str, created_at: float, paragraphs: List[str]) -> None:
+        with self._db_lock:
+            db = self._get_db()
+            db.execute("INSERT OR REPLACE INTO articles VALUES (?, ?, ?, ?)", (url, orjson.dumps(paragraphs), created_at, created_at))
+            expired = db.execute("DELETE FROM articles WHERE created_at <= ?", (time.time() - self.ttl,)).rowcount
+            excess = db.execute("SELECT COUNT(*) FROM articles").fetchone()[0] - self.max_entries
+            if excess > 0:
+                db.execute("DELETE FROM articles WHERE url IN (SELECT url FROM articles ORDER BY accessed_at LIMIT ?)", (excess,))
+            db.commit()
+        self.stats["expirations"] += expired
+        self.stats["disk_evictions"] += max(excess, 0)
+
+    async def get(self, url: str) -> Optional[List[str]]:
+        """
+            Gets the cached paragraphs of the article at the URL
+
+            Parameters
+            ----------
+            url: str
+                The URL of the article
+
+            Returns
+            -------
+            paragraphs: Optional[List[str]]
+                The cached paragraphs of the article, or None if the article is not cached (or has expired)
+        """
+        entry = self._memory.get(url)
+        if entry is not None:
+            created_at, paragraphs = entry
+            if time.time() - created_at < self.ttl:
+                self._memory.move_to_end(url)
+                self.stats["memory_hits"] += 1
+                return paragraphs
+            del self._memory[url]
+            self.stats["expirations"] += 1
+
+        if self.path:
+            entry = await asyncio.to_thread(self._get_from_disk, url)
+            if entry is not None:
+                self._remember(url, *entry)
+                self.stats["disk_hits"] += 1
+                return entry[1]
+
+        self.stats["misses"] += 1
+        return None
+
+    async def set(self, url: str, paragraphs: List[str]) -> None:
+        """
+            Caches the paragraphs of the article at the URL
+
+            Parameters
+            ----------
+            url: str
+                The URL of the article
+
+            paragraphs: List[str]
+                The processed paragraphs of the article
+        """
+        created_at = time.time()
+        self._remember(url, created_at, paragraphs)
+        if self.path:
+            await asyncio.to_thread(self._set_on_disk, url, created_at, paragraphs)
+
+    def close(self) -> None:
+        """
+            Closes the on-disk cache. Called when the app shuts down.
+        """
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+article_cache = ArticleCache()
@@ -1,50 +1,55 @@
-from typing import List, Tuple
-import requests
-import re
-import random
+from typing import List, Optional, Tuple
 import logging
-import asyncio
+import time
 
-from bs4 import BeautifulSoup
+from .article_cache import article_cache
+from .domain_scheduler import domain_scheduler
+from .http_client import fetch_html
+from .text_normalizer import normalize_paragraphs
+from .html_parser import PARSER_BACKEND, extract_paragraphs, run_in_parse_executor
+from .metrics import observe_stage, time_stage
 
 logger = logging.getLogger('article_scraper')
 
-DELAY = 3
 PARA_WORD_LIMIT = 15
-headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36"}
+MAX_PARAGRAPHS = 25
 
-def get_article(url: str) -> List[str]:
+def parse_article(content: bytes, backend: str) -> List[str]:
     """
-        Scrapes the article at the URL for text in their <p> tags, corresponding to the paragraphs in the article.
+        Parses the HTML page of the article for text in their <p> tags, corresponding to the paragraphs in the article, and processes them.
+        This is CPU-bound, and is run in the parse executor (see html_parser.run_in_parse_executor) instead of on the event loop.
 
         Parameters
         ----------
-        url: str
-            The URL to scrape
+        content: bytes
+            The HTML content of the article
+
+        backend: str
+            The parser used to parse the HTML, one of html_parser.PARSER_BACKENDS
         
         Returns
         -------
         paragraphs: List[str]
-            A list containing the text from the <p> tags in the article
+            A list containing the processed text from the <p> tags in the article
     """
-    try:
-        page = requests.get(url, headers=headers, timeout=10)
-    except requests.exceptions.ConnectionError as e:
-        logger.error("Connection error: ", e)
-        return []
-    except requests.exceptions.Timeout:
-        logger.error(f"Timeout when trying to scrape from: {url}")
-        return []
-    
-    if page.ok:
-        soup = BeautifulSoup(page.content, "html.parser")
+    paragraphs = extract_paragraphs(content, backend)
+    return process_article(paragraphs)
 
-        for element in soup.find_all(['script', 'style', 'aside', 'nav', 'header', 'footer']):
-            element.decompose()
+def parse_article_timed(content: bytes, backend: str) -> Tuple[List[str], float, float]:
+    """
+        Same as parse_article, but also times the parsing and the processing. The stage timings are recorded by the caller, as this may run
+        in another process.
 
-        paragraphs = soup.find_all(["p"])
-        return paragraphs
-    return []
+        Returns
+        -------
+        paragraphs, parse_seconds, process_seconds: Tuple[List[str], float, float]
+            The processed paragraphs, and the number of seconds spent parsing the HTML and processing the paragraphs
+    """
+    start_time = time.perf_counter()
+    paragraphs = extract_paragraphs(content, backend)
+    parsed_time = time.perf_counter()
+    paragraphs = process_article(paragraphs)
+    return paragraphs, parsed_time - start_time, time.perf_counter() - parsed_time
 
 def process_article(paragraphs: List[str]) -> List[str]:
     """
@@ -65,39 +70,15 @@ def process_article(paragraphs: List[str]) -> List[str]:
         results: List[str]
             A list containing the processed text of each <p> tag   
     """
-    results = []
-
-    for p in paragraphs:
-        p = p.get_text(strip=True)
-        # Remove repeated whitespaces from the paragraph
-        p = re.sub(r'\s+', ' ', p)
+    # Only take the first MAX_PARAGRAPHS (+1) paragraphs, this prevents the article from getting way too long
+    return normalize_paragraphs(paragraphs, PARA_WORD_LIMIT, MAX_PARAGRAPHS)
 
-        # Remove any strings that start with http:// or https://
-        p = re.sub(r"^https?://\S+", " ", p)
-
-        # Replace "'" with "’".
-        p = re.sub(r"'", "’", p)
-
-        # Replace opening/closing quotes with curly quotes
-        for i in range(p.count('"')//2+1) : 
-            # Alternate between open and closing quotes
-            p = p.replace(r'"', '“', 1)
-            p = p.replace(r'"', '”', 1)
-        
-        # Filter out paragraphs that are less than 15 words long
-        if p.count(" ") > PARA_WORD_LIMIT:
-            results.append(p)
-
-        if len(results) > 25:
-            # only take the first 25 paragraphs, this prevents the article from getting way too long
-            return results
-
-    return results
-
-async def scrape_article(url: str) -> Tuple[str, List[str]]:
+async def scrape_article(url: str) -> Tuple[str, Optional[List[str]]]:
     """
-        Gets the text from each <p> tag in the article and processes it, and then sleeps for a while.
-        This is to prevent repeated scrapes from the same website.
+        Gets the text from each <p> tag in the article and processes it. Articles that were scraped recently are served from the article cache.
+        The page is fetched with the shared async HTTP client, and parsed in the parse executor, so the event loop is never blocked.
+        The fetch waits on the per-domain politeness scheduler first, to prevent repeated scrapes from the same website
+        while articles from different websites are scraped in parallel.
 
         Parameters
         ----------
@@ -106,14 +87,30 @@ async def scrape_article(url: str) -> Tuple[str, List[str]]:
 
         Returns
         -------
-        url, paragraphs: Tuple[str, List[str]]
-            A tuple containing the URL, and a list of text from each <p> tag in the article
+        url, paragraphs: Tuple[str, Optional[List[str]]]
+            A tuple containing the URL, and a list of text from each <p> tag in the article, or None if the page could not be fetched
+            (e.g. it timed out, responded with an error, or is not HTML), so that the failure is reported instead of looking like an empty article
     """
-    # get_article and process_article is synchronous
-    paragraphs = get_article(url)
-    paragraphs = process_article(paragraphs)
-    
-    await asyncio.sleep(DELAY * random.uniform(0.5, 1.5)) # In case we somehow end up scraping from the same website
+    paragraphs = await article_cache.get(url)
+    if paragraphs is not None:
+        logger.info(f"Obtained cached article for {url}")
+        return url, paragraphs
+
+    async with domain_scheduler.acquire(url) as waited:
+        observe_stage("politeness_wait", waited)
+        with time_stage("fetch"):
+            content = await fetch_html(url)
+
+    if content is None:
+        return url, None
+    # The time in the parse executor also includes waiting for a free worker, and sending the page to the worker
+    with time_stage("parse_executor"):
+        paragraphs, parse_seconds, process_seconds = await run_in_parse_executor(parse_article_timed, content, PARSER_BACKEND)
+    observe_stage("parse", parse_seconds)
+    observe_stage("process_article", process_seconds)
+    if paragraphs:
+        # Do not cache empty articles, the website might only have failed temporarily
+        await article_cache.set(url, paragraphs)
     
     logger.info(f"Successfully scraped article for {url}")
 
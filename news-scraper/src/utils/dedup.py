@@ -0,0 +1,99 @@
+from typing import Dict, List, Optional, Set, Tuple
+import os
+import random
+import zlib
+
+DEDUP_THRESHOLD = float(os.environ.get("DEDUP_THRESHOLD", 0.7)) # Min (estimated) Jaccard similarity of two articles for them to be near-duplicates
+DEDUP_SHINGLE_SIZE = int(os.environ.get("DEDUP_SHINGLE_SIZE", 5)) # Number of consecutive words in each shingle
+# The signature is split into DEDUP_BANDS bands of DEDUP_NUM_PERM // DEDUP_BANDS hashes, and two articles are compared if they have any band in
+# common. With 16 bands of 4 hashes, articles with a similarity of 0.7 are compared with a probability of ~0.98, and of 0.3 with ~0.12
+DEDUP_NUM_PERM = 64
+DEDUP_BANDS = 16
+
+MERSENNE_PRIME = (1 << 61) - 1
+# The (a, b) of the hash functions (a * x + b) % MERSENNE_PRIME that stand in for the permutations. Fixed, so that the signatures computed in
+# different processes can be compared
+_rng = random.Random(0)
+PERMUTATIONS = [(_rng.randrange(1, MERSENNE_PRIME), _rng.randrange(0, MERSENNE_PRIME)) for _ in range(DEDUP_NUM_PERM)]
+
+Signature = Tuple[int, ...]
+
+def shingle_hashes(paragraphs: List[str], shingle_size: int = DEDUP_SHINGLE_SIZE) -> Set[int]:
+    """
+        Hashes every run of shingle_size consecutive words in the article (ignoring case and punctuation around the words)
+    """
+    words = [word.strip(".,;:!?\"'()[]“”‘’").lower() for paragraph in paragraphs for word in paragraph.split()]
+    words = [word for word in words if word]
+    if len(words) < shingle_size:
+        return {zlib.crc32(" ".join(words).encode("utf-8"))} if words else set()
+    return {zlib.crc32(" ".join(words[i:i + shingle_size]).encode("utf-8")) for i in range(len(words) - shingle_size + 1)}
+
+def minhash_signature(paragraphs: List[str]) -> Optional[Signature]:
+    """
+        Computes the MinHash signature of the article, where the fraction of positions at which the signatures of two articles are
+        equal estimates the Jaccard similarity of their shingles. This is CPU-bound, so it should be run in the parse executor.
+
+        Parameters
+        ----------
+        paragraphs: List[str]
+            The processed paragraphs of the article
+
+        Returns
+        -------
+        signature: Optional[Signature]
+            The signature of the article, or None if it has no words
+    """
+    hashes = shingle_hashes(paragraphs)
+    if not hashes:
+        return None
+    return tuple(min((a * h + b) % MERSENNE_PRIME for h in hashes) for a, b in PERMUTATIONS)
+
+def estimate_similarity(signature: Signature, other: Signature) -> float:
+    return sum(x == y for x, y in zip(signature, other)) / len(signature)
+
+class NearDuplicateIndex:
+    """
+        Locality-sensitive hashing (LSH) index of the MinHash signatures of articles, to find near-duplicates (e.g. syndicated copies
+        of the same wire story) without comparing each article to every other one. Only the articles that share a band of their signature
+        are compared.
+        Each query pipeline has its own index, as an article is only a duplicate of the articles that were sent to the same clients. So the
+        index holds at most the articles of one query, and is dropped with the pipeline.
+    """
+    def __init__(self, threshold: float = DEDUP_THRESHOLD):
+        self.threshold = threshold
+        self._rows = DEDUP_NUM_PERM // DEDUP_BANDS
+        self._signatures: Dict[str, Signature] = {} # url -> signature
+        self._buckets: Dict[Tuple[int, Signature], Set[str]] = {} # (band, the hashes in the band) -> urls
+
+    def _bands(self, signature: Signature) -> List[Tuple[int, Signature]]:
+        return [(band, signature[band * self._rows:(band + 1) * self._rows]) for band in range(DEDUP_BANDS)]
+
+    def find(self, signature: Signature) -> Optional[str]:
+        """
+            Finds an article in the index that is a near-duplicate of the article with the signature
+
+            Returns
+            -------
+            url: Optional[str]
+                The url of the most similar article, or None if there is no near-duplicate
+        """
+        candidates = set().union(*(self._buckets.get(band, ()) for band in self._bands(signature)))
+        best_url, best_similarity = None, self.threshold
+        for url in candidates:
+            similarity = estimate_similarity(signature, self._signatures[url])
+            if similarity >= best_similarity:
+                best_url, best_similarity = url, similarity
+        return best_url
+
+    def add(self, url: str, signature: Signature) -> None:
+        """
+            Adds the article to the index
+        """
+        if url in self._signatures:
+            return
+        self._signatures[url] = signature
+        for band in self._bands(signature):
+            self._buckets.setdefault(band, set()).add(url)
+
+    def __len__(self) -> int:
+        return len(self._signatures)
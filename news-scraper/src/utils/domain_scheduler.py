@@ -0,0 +1,136 @@
+from typing import AsyncIterator, Dict, Tuple
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+import asyncio
+import logging
+import os
+import time
+
+import orjson
+
+logger = logging.getLogger('article_scraper')
+
+DOMAIN_MIN_INTERVAL = float(os.environ.get("DOMAIN_MIN_INTERVAL", 3)) # Minimum number of seconds between the start of two fetches to the same domain
+DOMAIN_MAX_CONNECTIONS = int(os.environ.get("DOMAIN_MAX_CONNECTIONS", 1)) # Maximum number of fetches in flight to the same domain
+# Per-domain overrides, e.g. '{"reuters.com": {"min_interval": 5, "max_connections": 1}}'
+DOMAIN_LIMITS = orjson.loads(os.environ.get("DOMAIN_LIMITS", "{}"))
+MIN_PRUNE_DOMAINS = 256 # The state of the domains is not pruned until this many domains are tracked
+
+def get_domain(url: str) -> str:
+    """
+        Gets the domain of the URL, which is used as the key for the per-domain limits. The "www." prefix is dropped so that
+        www.example.com and example.com share the same limits.
+
+        Parameters
+        ----------
+        url: str
+            The URL of the article
+
+        Returns
+        -------
+        domain: str
+            The domain of the URL
+    """
+    domain = (urlsplit(url).hostname or "").lower()
+    if domain.startswith("www."):
+        domain = domain[4:]
+    return domain
+
+class DomainScheduler:
+    """
+        Politeness scheduler that spaces out fetches to the same domain, while fetches to different domains proceed in parallel.
+        Each domain has a minimum interval between the start of two fetches, and a cap on the number of fetches in flight.
+        The time spent waiting on the scheduler is accumulated in total_waited.
+        The state of a domain is dropped once it has no fetches in flight or waiting and its next slot has passed, as it would be created
+        the same way on the next fetch. Otherwise every domain ever seen would be kept, which in a long-running service is unbounded.
+    """
+    def __init__(self,
+                 min_interval: float = DOMAIN_MIN_INTERVAL,
+                 max_connections: int = DOMAIN_MAX_CONNECTIONS,
+                 domain_limits: Dict[str, Dict[str, float]] = DOMAIN_LIMITS):
+        self.min_interval = min_interval
+        self.max_connections = max_connections
+        self.domain_limits = domain_limits
+
+        self._next_slot: Dict[str, float] = {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._users: Dict[str, int] = {} # Number of fetches holding or waiting for a connection slot of the domain
+        self._prune_at = MIN_PRUNE_DOMAINS # Prune once this many domains are tracked, see _prune
+        self.total_waited = 0.0
+
+    def get_limits(self, domain: str) -> Tuple[float, int]:
+        """
+            Gets the (min_interval, max_connections) for the domain, taking into account any per-domain overrides
+        """
+        limits = self.domain_limits.get(domain, {})
+        min_interval = float(limits.get("min_interval", self.min_interval))
+        max_connections = int(limits.get("max_connections", self.max_connections))
+        return min_interval, max_connections
+
+    def _prune(self) -> None:
+        """
+            Drops the state of the domains that are idle, i.e. with no fetches in flight or waiting, and whose next slot has passed.
+            This runs once the number of tracked domains doubles, so that it takes amortized constant time per fetch
+        """
+        now = time.monotonic()
+        for domain in [domain for domain in self._semaphores if self._next_slot.get(domain, 0.0) <= now and not self._users.get(domain)]:
+            del self._semaphores[domain]
+            self._next_slot.pop(domain, None)
+        self._prune_at = max(MIN_PRUNE_DOMAINS, 2 * len(self._semaphores))
+
+    @asynccontextmanager
+    async def acquire(self, url: str) -> AsyncIterator[float]:
+        """
+            Waits until a fetch to the domain of the URL is allowed, and holds one of the domain's connection slots until the context exits.
+
+            Parameters
+            ----------
+            url: str
+                The URL that is about to be fetched
+
+            Yields
+            ------
+            waited: float
+                The number of seconds spent waiting on the scheduler
+        """
+        domain = get_domain(url)
+        min_interval, max_connections = self.get_limits(domain)
+        if len(self._semaphores) >= self._prune_at:
+            self._prune()
+        if domain not in self._semaphores:
+            self._semaphores[domain] = asyncio.Semaphore(max_connections)
+
+        start_time = time.monotonic()
+        self._users[domain] = self._users.get(domain, 0) + 1
+        try:
+            async with self._semaphores[domain]:
+                # Reserve the next slot before sleeping, so that concurrent fetches to the same domain queue up behind each other
+                now = time.monotonic()
+                slot = max(now, self._next_slot.get(domain, 0.0))
+                self._next_slot[domain] = slot + min_interval
+                if slot > now:
+                    await asyncio.sleep(slot - now)
+
+                waited = time.monotonic() - start_time
+                self.total_waited += waited
+                if waited > 0.01:
+                    logger.info(f"Waited {waited:.2f}s on the politeness scheduler for {domain}")
+                yield waited
+        finally:
+            self._users[domain] -= 1
+            if not self._users[domain]:
+                del self._users[domain]
+
+    def total_wait_time(self) -> float:
+        """
+            Gets the total number of seconds spent waiting on the scheduler, across all domains
+        """
+        return self.total_waited
+
+    def __len__(self) -> int:
+        """
+            The number of domains whose state is kept
+        """
+        return len(self._semaphores)
+
+domain_scheduler = DomainScheduler()
@@ -1,18 +1,93 @@
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Deque, Dict, List, Optional, Tuple
+from collections import OrderedDict, deque
 import asyncio
 import logging
+import os
+import time
 
-from pygooglenews import GoogleNews #TODO: find another way to search through google news without violating their robots.txt (probably paid api services, like bing news)
-from googlenewsdecoder import new_decoderv1
+from .domain_scheduler import DomainScheduler
+from .metrics import observe_stage, time_stage
 
 logger = logging.getLogger('get_news')
 
-gn = GoogleNews(lang='en', country='US')
-INTERVAL_TIME = 5 # Recommended value to prevent rate limits
+gn = None # The GoogleNews client, see get_google_news_client
+INTERVAL_TIME = float(os.environ.get("INTERVAL_TIME", 5)) # Recommended value to prevent rate limits
+SEARCH_WINDOW = '1d' # Search for news in the past 1 day
+SEARCH_CACHE_TTL = float(os.environ.get("SEARCH_CACHE_TTL", 5 * 60)) # Seconds before the same search is sent to Google News again
+DECODE_CACHE_SIZE = int(os.environ.get("DECODE_CACHE_SIZE", 4096)) # Max number of decoded links to remember
+DECODE_PREFETCH = int(os.environ.get("DECODE_PREFETCH", 3)) # Number of links decoded ahead of the scraper
+DECODE_CONCURRENCY = int(os.environ.get("DECODE_CONCURRENCY", 2)) # Max number of links being decoded at the same time
+GOOGLE_NEWS_URL = "https://news.google.com"
+
+# Shared across requests, so that the rate limit of the decoder holds no matter how many queries are running
+decode_scheduler = DomainScheduler(min_interval=INTERVAL_TIME, max_connections=DECODE_CONCURRENCY, domain_limits={})
+decoded_urls: OrderedDict[str, str] = OrderedDict() # Google News link -> url of the actual news article
+search_results: Dict[Tuple[str, str], Tuple[float, List[Dict]]] = {} # (query, window) -> (time of search, entries)
+
+def get_google_news_client():
+    """
+        Gets the Google News client, creating it on first use (or by the warm-up at startup, see news_scraper.py).
+        pygooglenews (and its dependencies) take a while to import, so they are not imported until then, to start the service faster.
+    """
+    global gn
+    if gn is None:
+        from pygooglenews import GoogleNews #TODO: find another way to search through google news without violating their robots.txt (probably paid api services, like bing news)
+        gn = GoogleNews(lang='en', country='US')
+    return gn
+
+def new_decoderv1(link: str) -> Dict:
+    """
+        Decodes the Google News link into the url of the actual news article, with googlenewsdecoder (imported on first use)
+    """
+    from googlenewsdecoder import new_decoderv1 as decode
+    return decode(link)
+
+def load_google_news() -> None:
+    """
+        Imports and creates the Google News client and the decoder ahead of the first search. Called by the warm-up at startup
+    """
+    get_google_news_client()
+    import googlenewsdecoder # noqa: F401
+
+async def search_google_news(query: str, when: str = SEARCH_WINDOW) -> List[Dict]:
+    """
+        Searches Google News (news.google.com) with a search query for related news in the time window. The search is run in a thread,
+        as it is a blocking call, and the results are cached for SEARCH_CACHE_TTL seconds.
+
+        Parameters
+        ----------
+        query: str
+            The search query (use this as you would do a search in Google News)
+
+        when: str
+            The time window of the search, e.g. '1d' for the past 1 day
+
+        Returns
+        -------
+        entries: List[Dict]
+            The RSS entries of the news articles
+    """
+    key = (query, when)
+    cached = search_results.get(key)
+    if cached is not None and time.time() - cached[0] < SEARCH_CACHE_TTL:
+        logger.info(f"Obtained cached search results for \"{query}\"")
+        return cached[1]
+
+    with time_stage("search"):
+        resp = await asyncio.to_thread(get_google_news_client().search, query, when=when, helper=True)
+    entries = resp['entries']
+
+    # Drop the expired searches so that the cache does not grow without bound
+    now = time.time()
+    for expired_key in [k for k, (searched_at, _) in search_results.items() if now - searched_at >= SEARCH_CACHE_TTL]:
+        del search_results[expired_key]
+    search_results[key] = (now, entries)
+    return entries
 
 async def get_google_news(query: str) -> AsyncGenerator[str, None]:
     """
-        Searches Google News (news.google.com) with a search query for related news in the past 1 day and yields the url to the news articles asynchronously
+        Searches Google News (news.google.com) with a search query for related news in the past 1 day and yields the url to the news articles asynchronously.
+        The next DECODE_PREFETCH links are decoded in the background, so that the next url is usually ready by the time it is needed.
 
         Parameters
         ----------
@@ -24,26 +99,65 @@ async def get_google_news(query: str) -> AsyncGenerator[str, None]:
         url: str
            The url to the news articles as they arrive
     """
-    resp = gn.search(query, when='1d', helper=True)
-    for count, news in enumerate(resp['entries']):
-        url = await decode_news_async(news)
-        logger.info(f"Obtained URL {url}")
-        yield url
+    entries = iter(await search_google_news(query))
+    decodes: Deque[asyncio.Task] = deque()
+    try:
+        for news in entries:
+            decodes.append(asyncio.create_task(decode_news_async(news)))
+            if len(decodes) >= DECODE_PREFETCH:
+                break
+
+        while decodes:
+            try:
+                url = await decodes.popleft()
+            except Exception as e:
+                logger.error(f"Failed to decode URL: {e!r}")
+                url = None
+            # Keep DECODE_PREFETCH links decoding ahead
+            news = next(entries, None)
+            if news is not None:
+                decodes.append(asyncio.create_task(decode_news_async(news)))
 
-async def decode_news_async(news: str) -> str:
+            if url is not None:
+                logger.info(f"Obtained URL {url}")
+                yield url
+    finally:
+        for task in decodes:
+            task.cancel()
+        await asyncio.gather(*decodes, return_exceptions=True)
+
+async def decode_news_async(news: Dict) -> Optional[str]:
     """
-        Decode the google news url (rss) to the url of the actual news article, in an async thread to ensure the INTERVAL_TIME is respected
+        Decode the google news url (rss) to the url of the actual news article, in an async thread.
+        The decodes wait on decode_scheduler, to ensure the INTERVAL_TIME is respected, and the decoded urls are cached.
 
         Parameters
         ----------
-        news: str
-            The url of the news article from google news
-        
+        news: Dict
+            The RSS entry of the news article from google news
+
         Returns
         -------
-        decoded_url: str
-            The url of the actual news article
+        decoded_url: Optional[str]
+            The url of the actual news article, or None if the url could not be decoded
     """
-    result = await asyncio.to_thread(new_decoderv1, news['link'], interval=INTERVAL_TIME) 
+    link = news['link']
+    decoded_url = decoded_urls.get(link)
+    if decoded_url is not None:
+        decoded_urls.move_to_end(link)
+        return decoded_url
+
+    async with decode_scheduler.acquire(GOOGLE_NEWS_URL) as waited:
+        observe_stage("decode_wait", waited)
+        with time_stage("decode"):
+            result = await asyncio.to_thread(new_decoderv1, link)
+
+    if not result.get('status'):
+        logger.error(f"Failed to decode {link}: {result.get('message')}")
+        return None
+
     decoded_url = result['decoded_url']
-    return decoded_url
\ No newline at end of file
+    decoded_urls[link] = decoded_url
+    while len(decoded_urls) > DECODE_CACHE_SIZE:
+        decoded_urls.popitem(last=False)
+    return decoded_url
@@ -0,0 +1,120 @@
+from typing import Callable, List, Optional, TypeVar
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+import asyncio
+import logging
+import os
+
+from bs4 import BeautifulSoup, SoupStrainer
+from news_common import available_cpus
+
+logger = logging.getLogger('article_scraper')
+
+T = TypeVar("T")
+
+PARSER_BACKENDS = ("html.parser", "lxml", "selectolax")
+PARSER_BACKEND = os.environ.get("PARSER_BACKEND", "html.parser")
+# selectolax releases the GIL while parsing, so a thread pool is enough for it. The pure python parsers need a process pool
+GIL_FREE_BACKENDS = ("selectolax",)
+PARSE_WORKERS = int(os.environ.get("PARSE_WORKERS", available_cpus()))
+# Paragraphs nested inside these tags are not part of the article text
+EXCLUDED_TAGS = ('script', 'style', 'aside', 'nav', 'header', 'footer')
+
+_executor: Optional[Executor] = None
+
+def _extract_html_parser(content: bytes, parser: str) -> List[str]:
+    # Only build the <body> subtree, instead of building the whole document and then decomposing the unwanted tags
+    soup = BeautifulSoup(content, parser, parse_only=SoupStrainer("body"))
+    paragraphs = soup.find_all("p")
+    if not paragraphs:
+        # The <body> tag is optional in HTML, and the pages without one have nothing in the strained tree, so parse the whole document
+        paragraphs = BeautifulSoup(content, parser).find_all("p")
+    return [p.get_text(strip=True) for p in paragraphs if p.find_parent(EXCLUDED_TAGS) is None]
+
+def _extract_lxml(content: bytes) -> List[str]:
+    import lxml.html
+
+    body = lxml.html.document_fromstring(content).body
+    paragraphs = []
+    for p in body.iter("p"):
+        if any(parent.tag in EXCLUDED_TAGS for parent in p.iterancestors()):
+            continue
+        paragraphs.append("".join(s.strip() for s in p.itertext()))
+    return paragraphs
+
+def _extract_selectolax(content: bytes) -> List[str]:
+    from selectolax.parser import HTMLParser
+
+    body = HTMLParser(content).body
+    if body is None:
+        return []
+    paragraphs = []
+    for p in body.css("p"):
+        parent = p.parent
+        while parent is not None and parent.tag not in EXCLUDED_TAGS:
+            parent = parent.parent
+        if parent is None:
+            paragraphs.append(p.text(strip=True))
+    return paragraphs
+
+def extract_paragraphs(content: bytes, backend: str = PARSER_BACKEND) -> List[str]:
+    """
+        Parses the HTML page and extracts the text in each <p> tag in the body of the page, skipping the <p> tags that are nested
+        in any of the EXCLUDED_TAGS (e.g. navigation bars, footers).
+
+        Parameters
+        ----------
+        content: bytes
+            The HTML content of the page
+
+        backend: str
+            The parser used to parse the HTML, one of PARSER_BACKENDS
+
+        Returns
+        -------
+        paragraphs: List[str]
+            A list containing the text from the <p> tags in the page
+    """
+    if backend == "html.parser":
+        return _extract_html_parser(content, "html.parser")
+    if backend == "lxml":
+        return _extract_lxml(content)
+    if backend == "selectolax":
+        return _extract_selectolax(content)
+    raise ValueError(f"Unknown parser backend {backend!r}, expected one of {PARSER_BACKENDS}")
+
+def get_parse_executor() -> Executor:
+    """
+        Gets the executor that the HTML parsing runs in, creating it on first use. This is a process pool for the pure python parsers,
+        and a thread pool for the parsers that release the GIL.
+    """
+    global _executor
+    if _executor is None:
+        if PARSER_BACKEND in GIL_FREE_BACKENDS:
+            _executor = ThreadPoolExecutor(max_workers=PARSE_WORKERS, thread_name_prefix="parser")
+        else:
+            _executor = ProcessPoolExecutor(max_workers=PARSE_WORKERS)
+        logger.info(f"Started {type(_executor).__name__} with {PARSE_WORKERS} workers for the {PARSER_BACKEND} parser")
+    return _executor
+
+def shutdown_parse_executor() -> None:
+    """
+        Shuts down the executor that the HTML parsing runs in. Called when the app shuts down.
+    """
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+async def run_in_parse_executor(func: Callable[..., T], *args) -> T:
+    """
+        Runs the CPU-bound func(*args) in the parse executor, so that it does not block the event loop.
+        func and args must be picklable, as they may be sent to another process.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_parse_executor(), func, *args)
+
+async def warm_up_parse_executor() -> None:
+    """
+        Starts the workers of the parse executor (each of which imports the parser) ahead of the first article. Called by the warm-up at startup
+    """
+    await asyncio.gather(*(run_in_parse_executor(extract_paragraphs, b"<p></p>") for _ in range(PARSE_WORKERS)))
@@ -0,0 +1,93 @@
+from typing import Optional
+import logging
+import os
+
+import httpx
+
+logger = logging.getLogger('article_scraper')
+
+CONNECT_TIMEOUT = float(os.environ.get("CONNECT_TIMEOUT", 3)) # Seconds to establish a connection to the website
+READ_TIMEOUT = float(os.environ.get("READ_TIMEOUT", 10)) # Seconds to wait between two chunks of the response body
+MAX_RESPONSE_BYTES = int(os.environ.get("MAX_RESPONSE_BYTES", 5 * 1024 * 1024)) # Articles larger than this are not worth parsing
+MAX_CONNECTIONS = int(os.environ.get("MAX_CONNECTIONS", 100))
+MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("MAX_KEEPALIVE_CONNECTIONS", 20))
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml")
+
+headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36"}
+
+_client: Optional[httpx.AsyncClient] = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+        Gets the async HTTP client shared by all the article fetches, creating it on first use.
+        Sharing the client allows connections to be kept alive and reused (over HTTP/2 where the website supports it).
+
+        Returns
+        -------
+        client: httpx.AsyncClient
+            The shared async HTTP client
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(headers=headers,
+                                    http2=True,
+                                    follow_redirects=True,
+                                    timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+                                    limits=httpx.Limits(max_connections=MAX_CONNECTIONS,
+                                                        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS)
+                                    )
+    return _client
+
+async def close_http_client() -> None:
+    """
+        Closes the shared async HTTP client (and its pooled connections). Called when the app shuts down.
+    """
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+async def fetch_html(url: str) -> Optional[bytes]:
+    """
+        Fetches the HTML page at the URL with the shared async HTTP client.
+        The response body is streamed, and the fetch is aborted early if the response is not HTML, or if it is larger than MAX_RESPONSE_BYTES.
+
+        Parameters
+        ----------
+        url: str
+            The URL to fetch
+
+        Returns
+        -------
+        content: Optional[bytes]
+            The HTML content of the page, or None if the page could not be fetched
+    """
+    client = get_http_client()
+    try:
+        async with client.stream("GET", url) as response:
+            if not response.is_success:
+                logger.error(f"Got status {response.status_code} when trying to scrape from: {url}")
+                return None
+
+            content_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+            if content_type and content_type not in HTML_CONTENT_TYPES:
+                logger.error(f"Skipping non-HTML content ({content_type}) at: {url}")
+                return None
+
+            content_length = response.headers.get("content-length")
+            if content_length and content_length.isdigit() and int(content_length) > MAX_RESPONSE_BYTES:
+                logger.error(f"Skipping response of {content_length} bytes at: {url}")
+                return None
+
+            content = bytearray()
+            async for chunk in response.aiter_bytes():
+                content.extend(chunk)
+                if len(content) > MAX_RESPONSE_BYTES:
+                    logger.error(f"Aborted response larger than {MAX_RESPONSE_BYTES} bytes at: {url}")
+                    return None
+            return bytes(content)
+    except httpx.TimeoutException:
+        logger.error(f"Timeout when trying to scrape from: {url}")
+    except httpx.HTTPError as e:
+        logger.error(f"Connection error when trying to scrape from {url}: {e!r}")
+    return None
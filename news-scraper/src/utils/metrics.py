@@ -0,0 +1,5 @@
+from news_common.metrics import StageMetrics, TraceIDMiddleware, trace_id, METRICS_ENABLED, STAGE_BUCKETS, TRACE_ID_HEADER
+
+stage_metrics = StageMetrics("news-scraper", "Seconds spent in each stage of the news scraping pipeline")
+observe_stage = stage_metrics.observe
+time_stage = stage_metrics.time
@@ -0,0 +1,135 @@
+from typing import AsyncGenerator, Awaitable, Callable, Dict, List, Optional, Tuple
+from contextlib import aclosing
+import asyncio
+import logging
+
+from .metrics import trace_id
+
+logger = logging.getLogger('news-scraper')
+
+def normalize_query(query: str) -> str:
+    """
+        Normalizes the query so that queries that only differ in case or whitespace share the same pipeline
+    """
+    return " ".join(query.lower().split())
+
+class InFlightQuery:
+    """
+        The records (articles, and errors) produced by one in-flight pipeline, shared by all the requests for the same query.
+        The records are kept, so that requests that join late get the records produced so far replayed, followed by the live ones.
+    """
+    def __init__(self, limit: int):
+        self.limit = limit # The largest limit of all the requests that share the pipeline
+        self.records: List[Tuple[bytes, bool]] = [] # (NDJSON line, whether it is an article)
+        self.num_articles = 0
+        self.done = False
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._updated = asyncio.Event()
+
+    def _notify(self) -> None:
+        self._updated.set()
+        self._updated = asyncio.Event()
+
+    def publish(self, record: bytes, is_article: bool = True) -> None:
+        """
+            Adds a record produced by the pipeline, and wakes up the requests waiting for it.
+            Only articles count towards the limit, error records are passed along to the requests in between.
+        """
+        self.records.append((record, is_article))
+        self.num_articles += is_article
+        self._notify()
+
+    def finish(self) -> None:
+        """
+            Marks the pipeline as done. Requests that arrive afterwards start a new pipeline instead of joining this one
+        """
+        if not self.done:
+            self.done = True
+            self._notify()
+
+    def is_full(self) -> bool:
+        """
+            Whether the pipeline has produced enough articles for all the requests that share it
+        """
+        return self.num_articles >= self.limit
+
+    async def subscribe(self, limit: int) -> AsyncGenerator[bytes, None]:
+        """
+            Yields the records from the pipeline, starting from the first one, until limit articles have been yielded.
+            If every request leaves before the pipeline is done (e.g. the users abandoned the query), the pipeline is cancelled.
+        """
+        self.subscribers += 1
+        self.limit = max(self.limit, limit)
+        try:
+            i, num_articles = 0, 0
+            while num_articles < limit:
+                if i < len(self.records):
+                    record, is_article = self.records[i]
+                    yield record
+                    i += 1
+                    num_articles += is_article
+                elif self.done:
+                    break
+                else:
+                    await self._updated.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done and self.task is not None:
+                self.task.cancel()
+
+class QueryCoalescer:
+    """
+        Single-flight coalescing of the pipelines for the same (normalized) query: concurrent requests for the same query share
+        one in-flight pipeline instead of each running their own.
+    """
+    def __init__(self):
+        self._flights: Dict[str, InFlightQuery] = {}
+
+    async def _run(self, key: str, flight: InFlightQuery, pipeline: Awaitable[None]) -> None:
+        try:
+            await pipeline
+        except asyncio.CancelledError:
+            logger.info(f"Cancelled pipeline for \"{key}\" as every request has left")
+        except Exception as e:
+            logger.error(f"Pipeline for \"{key}\" failed: {e!r}")
+        finally:
+            flight.finish()
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    async def stream(self, query: str, limit: int, pipeline: Callable[[str, InFlightQuery], Awaitable[None]]) -> AsyncGenerator[bytes, None]:
+        """
+            Yields up to limit articles for the query, from the in-flight pipeline for the same query if there is one,
+            or else from a new pipeline.
+
+            Parameters
+            ----------
+            query: str
+                The query to search articles on
+
+            limit: int
+                The maximum number of articles to return
+
+            pipeline: Callable[[str, InFlightQuery], Awaitable[None]]
+                Runs the pipeline for the query, publishing the records to the InFlightQuery until it is full
+
+            Yields
+            ------
+            record: bytes
+                The records produced by the pipeline, as NDJSON lines
+        """
+        key = normalize_query(query)
+        flight = self._flights.get(key)
+        if flight is None or flight.done:
+            flight = InFlightQuery(limit)
+            flight.task = asyncio.create_task(self._run(key, flight, pipeline(query, flight)))
+            self._flights[key] = flight
+        else:
+            logger.info(f"[{trace_id.get()}] Joined the in-flight pipeline for \"{key}\" ({flight.num_articles} articles so far)")
+
+        async with aclosing(flight.subscribe(limit)) as records:
+            async for record in records:
+                yield record
+
+query_coalescer = QueryCoalescer()
@@ -0,0 +1,78 @@
+from typing import AsyncGenerator, AsyncIterator, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import os
+
+from .article_scraper import scrape_article
+
+logger = logging.getLogger('article_scraper')
+
+MAX_CONCURRENT_SCRAPES = int(os.environ.get("MAX_CONCURRENT_SCRAPES", 5)) # Max number of articles being scraped at the same time
+
+async def scrape_articles_concurrently(urls: AsyncIterator[str],
+                                       max_concurrency: int = MAX_CONCURRENT_SCRAPES
+                                       ) -> AsyncGenerator[Tuple[str, Optional[List[str]]], None]:
+    """
+        Scrapes the articles at the URLs with at most max_concurrency scrapes in flight at any time, and yields the results
+        in the order that the scrapes complete (not the order of the URLs).
+        A new URL is only pulled from urls when there is a free slot, so that we do not decode more URLs than we need.
+        Any scrapes that are still in flight when the generator is closed (e.g. the caller has enough articles) are cancelled.
+
+        Parameters
+        ----------
+        urls: AsyncIterator[str]
+            The URLs of the articles to scrape, e.g. from get_google_news
+
+        max_concurrency: int
+            The maximum number of articles being scraped at the same time
+
+        Yields
+        ------
+        url, paragraphs: Tuple[str, Optional[List[str]]]
+            A tuple containing the URL, and a list of text from each <p> tag in the article (or None if the article could not be fetched,
+            or scraping the article raised an error)
+    """
+    pending: Dict[asyncio.Future, str] = {} # scraping task -> url
+    next_url = None
+    urls_exhausted = False
+
+    try:
+        while True:
+            # Pull the next URL only when there is a free slot in the pool
+            if next_url is None and not urls_exhausted and len(pending) < max_concurrency:
+                next_url = asyncio.ensure_future(anext(urls))
+
+            waiting = set(pending) | {next_url} if next_url is not None else set(pending)
+            if not waiting:
+                break
+
+            done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task is next_url:
+                    next_url = None
+                    try:
+                        url = task.result()
+                    except StopAsyncIteration:
+                        urls_exhausted = True
+                        continue
+                    except Exception as e:
+                        logger.error(f"Failed to obtain the next URL to scrape: {e!r}")
+                        urls_exhausted = True
+                        continue
+                    pending[asyncio.create_task(scrape_article(url))] = url
+                else:
+                    url = pending.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        logger.error(f"Failed to scrape article at {url}: {e!r}")
+                        result = url, None
+                    yield result
+    finally:
+        # Tear down whatever is still in flight, e.g. once the caller has reached its limit
+        outstanding = set(pending) | {next_url} if next_url is not None else set(pending)
+        for task in outstanding:
+            task.cancel()
+        await asyncio.gather(*outstanding, return_exceptions=True)
+        if hasattr(urls, "aclose"):
+            await urls.aclose()
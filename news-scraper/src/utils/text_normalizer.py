@@ -0,0 +1,92 @@
+from typing import List
+import re
+
+LEADING_URL_PATTERN = re.compile(r"^https?://\S+")
+CURLY_QUOTES = ("“", "”")
+
+def curl_double_quotes(text: str) -> str:
+    """
+        Replaces the straight double quotes (") in the text with curly quotes, alternating between opening and closing quotes (“, ”)
+    """
+    if '"' not in text:
+        return text
+    parts = text.split('"')
+    result = [parts[0]]
+    for i, part in enumerate(parts[1:]):
+        result.append(CURLY_QUOTES[i & 1])
+        result.append(part)
+    return "".join(result)
+
+def collapse_whitespace(text: str) -> str:
+    """
+        Replaces every run of whitespace in the text with a single space. Same as re.sub(r"\\s+", " ", text), but str.split
+        and str.join are several times faster than the regex substitution (str.isspace() and \\s match the same characters).
+    """
+    words = text.split()
+    if not words:
+        return " " if text else ""
+    collapsed = " ".join(words)
+    if text[0].isspace():
+        collapsed = " " + collapsed
+    if text[-1].isspace():
+        collapsed = collapsed + " "
+    return collapsed
+
+def normalize_paragraph(text: str) -> str:
+    """
+        Normalizes the text of a paragraph
+        1. Removes repeated whitespaces
+        2. Removes a link (beginning with http(s)://) at the start of the paragraph
+        3. Replace straight quotes (", ') with curly quotes (”, ’)
+
+        Parameters
+        ----------
+        text: str
+            The text of the paragraph
+
+        Returns
+        -------
+        text: str
+            The normalized text
+    """
+    text = collapse_whitespace(text)
+    if text.startswith(("http://", "https://")):
+        text = LEADING_URL_PATTERN.sub(" ", text, count=1)
+    text = text.replace("'", "’")
+    return curl_double_quotes(text)
+
+def normalize_paragraphs(paragraphs: List[str], min_spaces: int, max_paragraphs: int) -> List[str]:
+    """
+        Normalizes the paragraphs of an article (see normalize_paragraph), and keeps the paragraphs that have more than
+        min_spaces spaces. Stops as soon as more than max_paragraphs paragraphs have been kept, so the rest of the article is never normalized.
+        The paragraphs are filtered before the quotes are replaced, so the dropped paragraphs only pay for the whitespace collapsing.
+
+        Parameters
+        ----------
+        paragraphs: List[str]
+            A list containing the text of each paragraph in the article
+
+        min_spaces: int
+            Paragraphs with this many spaces or fewer (after normalization) are dropped
+
+        max_paragraphs: int
+            Stop once more than this many paragraphs have been kept
+
+        Returns
+        -------
+        results: List[str]
+            A list containing the normalized text of the paragraphs that are kept
+    """
+    results = []
+    for p in paragraphs:
+        p = collapse_whitespace(p)
+        if p.startswith(("http://", "https://")):
+            p = LEADING_URL_PATTERN.sub(" ", p, count=1)
+
+        # Replacing the quotes does not change the number of spaces
+        if p.count(" ") > min_spaces:
+            results.append(curl_double_quotes(p.replace("'", "’")))
+
+            if len(results) > max_paragraphs:
+                break
+    return results
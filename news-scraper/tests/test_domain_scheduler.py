@@ -0,0 +1,68 @@
+"""
+    Tests of the politeness scheduler
+"""
+import asyncio
+
+from utils.domain_scheduler import MIN_PRUNE_DOMAINS, DomainScheduler
+
+async def fetch(scheduler: DomainScheduler, url: str) -> float:
+    async with scheduler.acquire(url) as waited:
+        return waited
+
+def test_spaces_out_fetches_to_the_same_domain():
+    async def run():
+        scheduler = DomainScheduler(min_interval=0.1, max_connections=1, domain_limits={})
+        return await asyncio.gather(fetch(scheduler, "https://www.example.com/a"), fetch(scheduler, "https://example.com/b"),
+                                    fetch(scheduler, "https://other.example.org/c"))
+
+    first, second, other = asyncio.run(run())
+    assert first < 0.05 and other < 0.05
+    assert second >= 0.09
+
+def test_idle_domains_are_pruned():
+    async def run():
+        scheduler = DomainScheduler(min_interval=0, max_connections=1, domain_limits={})
+        for i in range(10 * MIN_PRUNE_DOMAINS):
+            await fetch(scheduler, f"https://site{i}.example.com/article")
+        return scheduler
+
+    scheduler = asyncio.run(run())
+    assert len(scheduler) <= MIN_PRUNE_DOMAINS
+    assert not scheduler._users
+
+def test_busy_domains_are_kept():
+    async def run():
+        scheduler = DomainScheduler(min_interval=0, max_connections=1, domain_limits={})
+        busy = asyncio.Event()
+        release = asyncio.Event()
+
+        async def hold():
+            async with scheduler.acquire("https://busy.example.com/article"):
+                busy.set()
+                await release.wait()
+
+        task = asyncio.create_task(hold())
+        await busy.wait()
+        for i in range(10 * MIN_PRUNE_DOMAINS):
+            await fetch(scheduler, f"https://site{i}.example.com/article")
+        kept = "busy.example.com" in scheduler._semaphores
+        release.set()
+        await task
+        return kept
+
+    assert asyncio.run(run())
+
+def test_total_wait_time_is_kept_after_pruning():
+    async def run():
+        scheduler = DomainScheduler(min_interval=0.02, max_connections=1, domain_limits={})
+        await asyncio.gather(*(fetch(scheduler, "https://example.com/article") for _ in range(3)))
+        waited = scheduler.total_wait_time()
+        scheduler._prune_at = 0
+        await asyncio.sleep(0.03)
+        await fetch(scheduler, "https://other.example.com/article")
+        return waited, scheduler.total_wait_time(), len(scheduler)
+
+    waited, total, num_domains = asyncio.run(run())
+    assert waited >= 0.05
+    assert total >= waited
+    assert num_domains == 1
@@ -0,0 +1,29 @@
+"""
+    Tests of the extraction of the paragraphs from the HTML pages, with each of the parser backends that is installed
+"""
+import importlib.util
+
+import pytest
+
+from utils.html_parser import PARSER_BACKENDS, extract_paragraphs
+
+INSTALLED_BACKENDS = [backend for backend in PARSER_BACKENDS if backend == "html.parser" or importlib.util.find_spec(backend) is not None]
+
+PARAGRAPHS = b"<p>First paragraph of the article.</p><nav><p>Navigation</p></nav><div><p>Second <b>paragraph</b>.</p></div>"
+EXPECTED = ["First paragraph of the article.", "Secondparagraph."]
+
+@pytest.mark.parametrize("backend", INSTALLED_BACKENDS)
+def test_page_with_body(backend: str):
+    content = b"<!DOCTYPE html><html><head><title>Article</title></head><body>" + PARAGRAPHS + b"<footer><p>Footer</p></footer></body></html>"
+    assert extract_paragraphs(content, backend) == EXPECTED
+
+@pytest.mark.parametrize("backend", INSTALLED_BACKENDS)
+def test_page_without_body_tag(backend: str):
+    # The <html>, <head> and <body> tags may all be omitted in valid HTML
+    content = b"<!DOCTYPE html><html><head><title>Article</title></head>" + PARAGRAPHS + b"</html>"
+    assert extract_paragraphs(content, backend) == EXPECTED
+    assert extract_paragraphs(b"<title>Article</title>" + PARAGRAPHS, backend) == EXPECTED
+
+@pytest.mark.parametrize("backend", INSTALLED_BACKENDS)
+def test_page_without_paragraphs(backend: str):
+    assert extract_paragraphs(b"<html><body><div>No paragraphs</div></body></html>", backend) == []
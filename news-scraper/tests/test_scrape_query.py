@@ -0,0 +1,68 @@
+"""
+    Tests of the records streamed for a query, with Google News and the publishers replaced by fakes
+"""
+from typing import AsyncIterator, List
+import asyncio
+
+import httpx
+import orjson
+import pytest
+
+import news_scraper
+from utils import article_scraper, http_client
+from utils.article_cache import ArticleCache
+from utils.domain_scheduler import DomainScheduler
+
+ARTICLE_HTML = b"<html><body>" + b"<p>" + b" ".join([b"word"] * 40) + b"</p></body></html>"
+
+def publisher(request: httpx.Request) -> httpx.Response:
+    if request.url.host == "missing.example.com":
+        return httpx.Response(404, html="<p>Not found</p>")
+    if request.url.host == "slow.example.com":
+        raise httpx.ReadTimeout("Timed out", request=request)
+    if request.url.host == "pdf.example.com":
+        return httpx.Response(200, content=b"%PDF-1.7", headers={"content-type": "application/pdf"})
+    return httpx.Response(200, content=ARTICLE_HTML, headers={"content-type": "text/html; charset=utf-8"})
+
+async def run_inline(func, *args):
+    return func(*args)
+
+@pytest.fixture
+def fake_publishers(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(http_client, "_client", httpx.AsyncClient(transport=httpx.MockTransport(publisher)))
+    monkeypatch.setattr(article_scraper, "article_cache", ArticleCache(path=""))
+    monkeypatch.setattr(article_scraper, "domain_scheduler", DomainScheduler(min_interval=0, domain_limits={}))
+    monkeypatch.setattr(article_scraper, "run_in_parse_executor", run_inline)
+    monkeypatch.setattr(news_scraper, "run_in_parse_executor", run_inline)
+
+def search_results(urls: List[str]):
+    async def get_google_news(query: str) -> AsyncIterator[str]:
+        for url in urls:
+            yield url
+    return get_google_news
+
+async def get_records(query: str, limit: int) -> List[dict]:
+    return [orjson.loads(line) async for line in news_scraper.get_articles_by_query(query, limit)]
+
+def test_failed_fetches_are_reported(fake_publishers, monkeypatch: pytest.MonkeyPatch):
+    urls = ["https://missing.example.com/article", "https://slow.example.com/article", "https://pdf.example.com/article",
+            "https://ok.example.com/article"]
+    monkeypatch.setattr(news_scraper, "get_google_news", search_results(urls))
+
+    records = asyncio.run(get_records("failed fetches", 1))
+    errors = {record["url"] for record in records if record["type"] == "error"}
+    articles = [record for record in records if record["type"] == "article"]
+    assert errors == set(urls[:3])
+    assert [article["url"] for article in articles] == urls[3:]
+    assert len(articles[0]["paragraphs"]) == 1
+
+def test_duplicates_are_only_dropped_within_a_query(fake_publishers, monkeypatch: pytest.MonkeyPatch):
+    # Every publisher other than the failing ones serves the same article
+    monkeypatch.setattr(news_scraper, "get_google_news", search_results(["https://ok.example.com/article", "https://copy.example.com/article"]))
+    records = asyncio.run(get_records("duplicates", 2))
+    assert [record["type"] for record in records] == ["article", "duplicate"]
+    assert records[1]["duplicate_of"] == records[0]["url"]
+
+    monkeypatch.setattr(news_scraper, "get_google_news", search_results(["https://other.example.com/article"]))
+    records = asyncio.run(get_records("another query", 1))
+    assert [(record["type"], record["url"]) for record in records] == [("article", "https://other.example.com/article")]
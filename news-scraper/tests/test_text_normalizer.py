@@ -0,0 +1,70 @@
+"""
+    Randomized parity tests of the text normalizer against the implementation of process_article it replaced
+"""
+from typing import List
+import random
+import re
+
+import pytest
+
+from utils.article_scraper import MAX_PARAGRAPHS, PARA_WORD_LIMIT, process_article
+from utils.text_normalizer import collapse_whitespace, normalize_paragraph
+
+# Whitespace that str.split and the \s regex both treat specially, and characters that look like whitespace but are not
+WHITESPACE = [" ", "  ", "\t", "\n", "\r", "\x0b", "\x0c", "\x1c", "\x1f", "\x85", " ", " ", "　"]
+NOT_WHITESPACE = ["\x00", "​", "﻿"]
+WORDS = ["the", "government", "said", "tuesday", "économie", "数据", "it's", "\"quoted\"", "'single'", "\"", "'", "“", "”"]
+URLS = ["http://example.com/a?b=c", "https://news.example.org/2024/story", "https://", "http://x", "HTTP://upper.example.com"]
+
+def reference_process_article(paragraphs: List[str]) -> List[str]:
+    """
+        process_article before it was moved to the text normalizer, kept as is (with the constants it used) to check parity against
+    """
+    results = []
+
+    for p in paragraphs:
+        p = re.sub(r'\s+', ' ', p)
+        p = re.sub(r"^https?://\S+", " ", p)
+        p = re.sub(r"'", "’", p)
+        for i in range(p.count('"')//2+1) :
+            p = p.replace(r'"', '“', 1)
+            p = p.replace(r'"', '”', 1)
+
+        if p.count(" ") > PARA_WORD_LIMIT:
+            results.append(p)
+
+        if len(results) > MAX_PARAGRAPHS:
+            return results
+
+    return results
+
+def random_paragraph(rng: random.Random) -> str:
+    parts = []
+    if rng.random() < 0.2:
+        parts.append(rng.choice(WHITESPACE))
+    if rng.random() < 0.3:
+        parts.append(rng.choice(URLS))
+    for _ in range(rng.randint(0, 40)):
+        parts.append(rng.choice(WORDS + NOT_WHITESPACE + URLS) if rng.random() < 0.9 else "")
+        parts.append(rng.choice(WHITESPACE) if rng.random() < 0.8 else "".join(rng.choices(WHITESPACE, k=rng.randint(2, 4))))
+    if parts and rng.random() < 0.3:
+        # Drop the trailing whitespace
+        parts.pop()
+    return "".join(parts)
+
+@pytest.mark.parametrize("seed", range(20))
+def test_process_article_matches_reference(seed: int):
+    rng = random.Random(seed)
+    for _ in range(200):
+        paragraphs = [random_paragraph(rng) for _ in range(rng.randint(0, 40))]
+        assert process_article(paragraphs) == reference_process_article(paragraphs)
+
+@pytest.mark.parametrize("text", ["", " ", "\t\n", "a", " a ", "a  b", "\x1c\x1d\x1e\x1fa\x85", "a\x00 b", "​word​"])
+def test_collapse_whitespace_matches_regex(text: str):
+    assert collapse_whitespace(text) == re.sub(r"\s+", " ", text)
+
+@pytest.mark.parametrize("text", ["", "\"", "\"\"\"", "http://a.com", "https://a.com b", " https://a.com b", "it's \"a\" 'b'", "https:// a"])
+def test_normalize_paragraph_matches_reference(text: str):
+    # A paragraph with enough words to be kept, so that the reference returns the normalized paragraph
+    padding = " w" * (PARA_WORD_LIMIT + 1)
+    assert [normalize_paragraph(text + padding)] == reference_process_article([text + padding])
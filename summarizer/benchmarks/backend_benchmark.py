@@ -0,0 +1,98 @@
+"""
+    Throughput and latency comparison of the summarizer backends (see utils/backends.py) on the same articles.
+    The articles are chunked like in the summarizer, and the chunks of concurrent articles are batched together with the MicroBatcher.
+    Each backend is warmed up first (e.g. the CPU backend loads and exports the model on first use), so that only steady-state summaries
+    are measured.
+    - cpu: the in-process CPU backend (needs the cpu extra, pip install .[cpu]), configured with the CPU_* environment variables
+    - vllm: a vLLM server at --vllm-url, e.g. a vLLM CPU build on the same machine for a like-for-like comparison. If no url is given, the
+      stub server (stub_openai_server.py) is used, which only measures the overhead of the service
+
+    Usage (from the summarizer directory):
+        python benchmarks/backend_benchmark.py --backends cpu vllm --vllm-url http://127.0.0.1:8000/v1 --articles 32 --concurrency 1 8
+"""
+from typing import List, Optional
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+import uvicorn
+
+STUB_PORT = 8014
+BENCHMARK_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, BENCHMARK_DIR)
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, "..", "src"))
+
+import stub_openai_server # noqa: E402
+from utils import BACKENDS, MicroBatcher, chunk_article # noqa: E402
+
+WORDS = "the government said on tuesday that it would announce new measures to support the economy after the report".split()
+
+def make_article(num_paragraphs: int) -> List[str]:
+    return [" ".join(random.choices(WORDS, k=random.randint(20, 80))) for _ in range(num_paragraphs)]
+
+def start_stub_server() -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(stub_openai_server.app, host="127.0.0.1", port=STUB_PORT, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+def percentile(latencies: List[float], p: float) -> float:
+    return statistics.quantiles(latencies, n=100)[int(p) - 1] if len(latencies) > 1 else latencies[0]
+
+async def run(name: str, vllm_url: Optional[str], articles: List[List[str]], concurrency_levels: List[int]):
+    backend = BACKENDS[name](api_base=vllm_url) if name == "vllm" else BACKENDS[name]()
+    batcher = MicroBatcher(backend.summarize)
+    chunked = [[chunk.text for chunk in chunk_article(article)] for article in articles]
+    try:
+        start_time = time.perf_counter()
+        await backend.summarize(chunked[0][:1])
+        print(f"{name}: warm-up took {time.perf_counter() - start_time:.2f}s")
+
+        for concurrency in concurrency_levels:
+            semaphore = asyncio.Semaphore(concurrency)
+            latencies = []
+
+            async def summarize(chunks: List[str]):
+                async with semaphore:
+                    start_time = time.perf_counter()
+                    await batcher.submit(chunks)
+                    latencies.append(time.perf_counter() - start_time)
+
+            start_time = time.perf_counter()
+            await asyncio.gather(*(summarize(chunks) for chunks in chunked))
+            elapsed = time.perf_counter() - start_time
+            num_chunks = sum(len(chunks) for chunks in chunked)
+            print(f"{name}: {len(chunked)} articles ({num_chunks} chunks), {concurrency} concurrent: "
+                  f"{len(chunked) / elapsed:.2f} articles/s, {num_chunks / elapsed:.2f} chunks/s, "
+                  f"latency p50: {percentile(latencies, 50):.3f}s  p95: {percentile(latencies, 95):.3f}s  p99: {percentile(latencies, 99):.3f}s")
+    finally:
+        await backend.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", choices=list(BACKENDS), default=list(BACKENDS))
+    parser.add_argument("--vllm-url", default=None, help="Base url of the vLLM server (the stub server is used if not given)")
+    parser.add_argument("--articles", type=int, default=32)
+    parser.add_argument("--paragraphs", type=int, default=15, help="Number of paragraphs in each article")
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8])
+    args = parser.parse_args()
+
+    random.seed(0)
+    articles = [make_article(args.paragraphs) for _ in range(args.articles)]
+    server = start_stub_server() if "vllm" in args.backends and args.vllm_url is None else None
+    vllm_url = args.vllm_url or f"http://127.0.0.1:{STUB_PORT}/v1"
+    try:
+        for name in args.backends:
+            asyncio.run(run(name, vllm_url, articles, args.concurrency))
+    finally:
+        if server is not None:
+            server.should_exit = True
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+    Load test of the /article-summary endpoint against the stub OpenAI-compatible server (see stub_openai_server.py), so it runs without a GPU.
+    The stub server is started in the background, and the summarizer app is driven in-process with concurrent requests.
+
+    Usage (from the summarizer directory):
+        python benchmarks/load_test.py --articles 200 --concurrency 50
+"""
+from typing import List
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+import httpx
+import uvicorn
+
+STUB_PORT = 8013
+os.environ.setdefault("VLLM_API_BASE", f"http://127.0.0.1:{STUB_PORT}/v1")
+
+BENCHMARK_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, BENCHMARK_DIR)
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, "..", "src"))
+
+import stub_openai_server # noqa: E402
+from main import app # noqa: E402
+
+WORDS = "the government said on tuesday that it would announce new measures to support the economy after the report".split()
+
+def make_article(i: int, num_paragraphs: int) -> dict:
+    paragraphs = [" ".join(random.choices(WORDS, k=random.randint(20, 80))) for _ in range(num_paragraphs)]
+    return {"url": f"https://example.com/article-{i}", "paragraphs": paragraphs}
+
+def start_stub_server(base_latency: float, per_token_latency: float) -> uvicorn.Server:
+    stub_openai_server.BASE_LATENCY = base_latency
+    stub_openai_server.PER_TOKEN_LATENCY = per_token_latency
+    server = uvicorn.Server(uvicorn.Config(stub_openai_server.app, host="127.0.0.1", port=STUB_PORT, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+def percentile(latencies: List[float], p: float) -> float:
+    return statistics.quantiles(latencies, n=100)[int(p) - 1] if len(latencies) > 1 else latencies[0]
+
+async def run(num_articles: int, concurrency: int, num_paragraphs: int):
+    articles = [make_article(i, num_paragraphs) for i in range(num_articles)]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://summarizer", timeout=None) as client:
+        async def summarize(article: dict):
+            nonlocal errors
+            async with semaphore:
+                start_time = time.perf_counter()
+                response = await client.post("/article-summary", json=article)
+                latencies.append(time.perf_counter() - start_time)
+                errors += not response.is_success
+
+        start_time = time.perf_counter()
+        await asyncio.gather(*(summarize(article) for article in articles))
+        elapsed = time.perf_counter() - start_time
+
+    print(f"{num_articles} articles, {concurrency} concurrent, {errors} errors")
+    print(f"throughput: {num_articles / elapsed:.1f} articles/s")
+    print(f"latency p50: {percentile(latencies, 50):.3f}s  p95: {percentile(latencies, 95):.3f}s  p99: {percentile(latencies, 99):.3f}s")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--articles", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--paragraphs", type=int, default=15, help="Number of paragraphs in each article")
+    parser.add_argument("--base-latency", type=float, default=0.05)
+    parser.add_argument("--per-token-latency", type=float, default=0.01)
+    args = parser.parse_args()
+
+    server = start_stub_server(args.base_latency, args.per_token_latency)
+    try:
+        asyncio.run(run(args.articles, args.concurrency, args.paragraphs))
+    finally:
+        server.should_exit = True
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+    Stub of the OpenAI-compatible completions API of the vLLM server, for benchmarking the summarizer without a GPU.
+    Each request takes BASE_LATENCY seconds, plus PER_TOKEN_LATENCY seconds for every generated token. A batch of prompts is
+    generated together (like vLLM does), so it takes as long as its longest completion. The "summary" is the first words of the prompt.
+    Streamed requests (stream=true) send one token of every completion in the batch every PER_TOKEN_LATENCY seconds, as server-sent events.
+
+    Usage:
+        python benchmarks/stub_openai_server.py --port 8003 --base-latency 0.05 --per-token-latency 0.01
+"""
+from typing import List, Optional, Union
+import argparse
+import asyncio
+import time
+import uuid
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+import orjson
+import uvicorn
+
+BASE_LATENCY = 0.05
+PER_TOKEN_LATENCY = 0.01
+MAX_TOKENS = 16 # Default max_tokens of the completions API
+
+app = FastAPI(title="stub-openai-server")
+
+class CompletionRequest(BaseModel):
+    model: str
+    prompt: Union[str, List[str]]
+    max_tokens: Optional[int] = None
+    temperature: Optional[float] = None
+    top_p: Optional[float] = None
+    stream: bool = False
+
+def complete(prompt: str, max_tokens: int) -> str:
+    words = prompt.removeprefix("Summarize: ").split()
+    return " ".join(words[:max_tokens])
+
+async def stream_completion(completion_id: str, model: str, texts: List[str]):
+    await asyncio.sleep(BASE_LATENCY)
+    tokens = [text.split() for text in texts]
+    for position in range(max((len(t) for t in tokens), default=0)):
+        await asyncio.sleep(PER_TOKEN_LATENCY)
+        choices = [{"index": i, "text": (" " if position else "") + t[position], "logprobs": None, "finish_reason": None}
+                   for i, t in enumerate(tokens) if position < len(t)]
+        chunk = {"id": completion_id, "object": "text_completion", "created": int(time.time()), "model": model, "choices": choices}
+        yield b"data: " + orjson.dumps(chunk) + b"\n\n"
+    yield b"data: [DONE]\n\n"
+
+@app.post("/v1/completions")
+async def create_completion(request: CompletionRequest):
+    prompts = [request.prompt] if isinstance(request.prompt, str) else request.prompt
+    max_tokens = request.max_tokens or MAX_TOKENS
+    texts = [complete(prompt, max_tokens) for prompt in prompts]
+    if request.stream:
+        return StreamingResponse(stream_completion(f"cmpl-{uuid.uuid4().hex}", request.model, texts), media_type="text/event-stream")
+
+    num_tokens = max(len(text.split()) for text in texts) if texts else 0
+    await asyncio.sleep(BASE_LATENCY + PER_TOKEN_LATENCY * num_tokens)
+
+    return {
+        "id": f"cmpl-{uuid.uuid4().hex}",
+        "object": "text_completion",
+        "created": int(time.time()),
+        "model": request.model,
+        "choices": [{"index": i, "text": text, "logprobs": None, "finish_reason": "length"} for i, text in enumerate(texts)],
+        "usage": {"prompt_tokens": sum(len(p.split()) for p in prompts),
+                  "completion_tokens": sum(len(t.split()) for t in texts),
+                  "total_tokens": sum(len(p.split()) for p in prompts) + sum(len(t.split()) for t in texts)},
+    }
+
+def main():
+    global BASE_LATENCY, PER_TOKEN_LATENCY
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8003)
+    parser.add_argument("--base-latency", type=float, default=BASE_LATENCY)
+    parser.add_argument("--per-token-latency", type=float, default=PER_TOKEN_LATENCY)
+    args = parser.parse_args()
+
+    BASE_LATENCY, PER_TOKEN_LATENCY = args.base_latency, args.per_token_latency
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
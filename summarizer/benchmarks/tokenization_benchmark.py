@@ -0,0 +1,61 @@
+"""
+    Benchmark of the token counting used by chunk_text, over a few thousand realistic paragraphs (grouped into articles of 25 paragraphs).
+    Compares encoding each paragraph on its own, against one batched encode per article with a cold and a warm token count cache.
+
+    Usage (from the summarizer directory):
+        python benchmarks/tokenization_benchmark.py --paragraphs 5000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "src"))
+
+from utils import text_processing # noqa: E402
+
+SENTENCES = [
+    "The central bank held interest rates steady on Wednesday, citing persistent inflation in services.",
+    "Officials said the decision was unanimous, although two members had argued for a cut earlier this year.",
+    "“We will continue to monitor the data closely,” the governor told reporters at a press conference.",
+    "Shares in the region’s largest lenders rose more than 2% after the announcement.",
+    "Analysts at several brokerages now expect the first cut to come no earlier than the fourth quarter.",
+    "The government is expected to publish its revised growth forecasts next month.",
+]
+
+def make_paragraph() -> str:
+    return " ".join(random.choices(SENTENCES, k=random.randint(2, 6)))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paragraphs", type=int, default=5000)
+    args = parser.parse_args()
+
+    random.seed(0)
+    paragraphs = [make_paragraph() for _ in range(args.paragraphs)]
+    articles = [paragraphs[i:i + 25] for i in range(0, len(paragraphs), 25)]
+    tokenizer = text_processing.get_tokenizer()
+
+    start_time = time.perf_counter()
+    for article in articles:
+        [len(tokenizer.encode(p, add_special_tokens=False).ids) for p in article]
+    per_paragraph = time.perf_counter() - start_time
+
+    text_processing.token_counts.clear()
+    start_time = time.perf_counter()
+    for article in articles:
+        text_processing.count_tokens_batch(article)
+    batched_cold = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    for article in articles:
+        text_processing.count_tokens_batch(article)
+    batched_warm = time.perf_counter() - start_time
+
+    print(f"{len(paragraphs)} paragraphs in {len(articles)} articles")
+    for name, seconds in [("per-paragraph encode", per_paragraph), ("batched (cold cache)", batched_cold), ("batched (warm cache)", batched_warm)]:
+        print(f"{name:<22} {seconds * 1000:>9.1f} ms  {len(paragraphs) / seconds:>10.0f} paragraphs/s")
+
+if __name__ == "__main__":
+    main()
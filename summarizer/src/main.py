@@ -1,34 +1,105 @@
-from typing import List, Dict
+from typing import Annotated, AsyncGenerator, List, Dict, Literal, Optional
+from contextlib import AsyncExitStack, aclosing, asynccontextmanager
+import asyncio
+import os
+import time
 
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 import uvicorn
 from pydantic import BaseModel
 
-from openai import OpenAI
+import httpx
+import orjson
+from news_common import ndjson_line, aiter_ndjson, with_heartbeats, WarmUp
 
-from utils import chunk_text
+from utils import (chunk_article, chunking_stats, group_summaries, count_text_tokens, SUMMARY_PROMPT, CHUNKING_STRATEGY, MicroBatcher,
+                   StreamBatcher, SummaryCache, observe_stage, time_stage, trace_id, TraceIDMiddleware, TRACE_ID_HEADER,
+                   make_backend, AdmissionController, Overloaded, DeadlineExceeded, Priority, get_tokenizer)
 
-app = FastAPI()
+SUMMARY_TIMEOUT = float(os.environ.get("SUMMARY_TIMEOUT", 120)) # Seconds to summarize an article, including waiting and retries
+SUMMARY_MODE = os.environ.get("SUMMARY_MODE", "concat") # Default summary mode, see get_summary
+REDUCE_FAN_IN = int(os.environ.get("REDUCE_FAN_IN", 4)) # Max number of summaries combined into one in each reduce round
+MAX_REDUCE_DEPTH = int(os.environ.get("MAX_REDUCE_DEPTH", 3)) # Max number of reduce rounds
+TARGET_SUMMARY_TOKENS = int(os.environ.get("TARGET_SUMMARY_TOKENS", 200)) # Stop reducing once the summary is at most this long
+NEWS_SCRAPER_URL = os.environ.get("NEWS_SCRAPER_URL", "http://news-scraper:8000/article-details") # Used by the /query-summaries pipeline
+# Max seconds between two chunks of the article stream. The news scraper sends heartbeats while it is still searching
+SCRAPER_READ_TIMEOUT = float(os.environ.get("SCRAPER_READ_TIMEOUT", 30))
 
-# Attempt to load from a locally downloaded version of the model. If not found, download it from huggingface
-#model_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), "bart-large-cnn")
-#model = model_dir if os.path.exists(model_dir) else "facebook/bart-large-cnn"
-model = "bart-large-cnn"
+# Generates the summaries, with the model served by the vLLM server or in-process on the CPU (see utils.backends)
+backend = make_backend()
+# Client for streaming the articles from the news scraper in the /query-summaries pipeline, shared by all the requests
+news_scraper_client = httpx.AsyncClient(timeout=httpx.Timeout(SCRAPER_READ_TIMEOUT, connect=5))
+# Loads the tokenizer and the model in the background at startup, instead of at import or on the first request (see /ready)
+warm_up = WarmUp('summarizer')
+warm_up.add("tokenizer", lambda: asyncio.to_thread(get_tokenizer))
+warm_up.add("backend", backend.warm_up)
 
-openai_api_key = "EMPTY"
-openai_api_base = "http://vllm-server:8000/v1"
-client = OpenAI(
-    api_key=openai_api_key,
-    base_url=openai_api_base,
-)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Requests are accepted while warming up, the tokenizer and the model are loaded by whichever comes first
+    warm_up_task = asyncio.create_task(warm_up.run())
+    yield
+    warm_up_task.cancel()
+    await backend.close()
+    await news_scraper_client.aclose()
+    summary_cache.close()
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(TraceIDMiddleware)
+
+SummaryMode = Literal["concat", "map_reduce"]
 
 class Article(BaseModel):
     url: str
     paragraphs: List[str]
+    mode: SummaryMode = SUMMARY_MODE
+    priority: Priority = "interactive" # background for requests nobody is waiting on, e.g. prefetching
+    timeout: Optional[float] = None # Seconds the client will wait for the summary, at most (and by default) SUMMARY_TIMEOUT
+
+def get_timeout(article: Article) -> float:
+    """
+        Gets the number of seconds to summarize the article in, before the request is dropped
+    """
+    return min(article.timeout, SUMMARY_TIMEOUT) if article.timeout else SUMMARY_TIMEOUT
 
-def summarize_text(text: str):
+def error_record(url: str, timeout: float, error: Exception) -> bytes:
+    """
+        Formats the error of a summary that failed as a line of newline-delimited JSON, like the last line of stream_summary
     """
-        Invokes the API at the vLLM server to summarize the text using the model served at the vLLM server.
+    if isinstance(error, (TimeoutError, DeadlineExceeded)):
+        return ndjson_line({"url": url, "error": f"Timed out summarizing the article after {timeout}s", "done": True})
+    if isinstance(error, Overloaded):
+        return ndjson_line({"url": url, "error": str(error), "retry_after": error.retry_after, "done": True})
+    return ndjson_line({"url": url, "error": repr(error), "done": True})
+
+def overloaded_error(error: Overloaded) -> HTTPException:
+    """
+        The 503 response for requests rejected by the admission controller, with the Retry-After header
+    """
+    return HTTPException(status_code=503, detail=str(error), headers={"Retry-After": str(error.retry_after)})
+
+async def summarize_texts(texts: List[str]) -> List[str]:
+    """
+        Summarizes the texts with the summarizer backend. With the vLLM backend, all the texts are sent as a list of prompts in a single
+        request, which the vLLM server batches together.
+
+        Parameters
+        ----------
+        texts: List[str]
+            The texts to summarize
+        
+        Returns
+        -------
+        response_texts: List[str]
+            The summarized texts, in the same order as the texts
+    """
+    return await backend.summarize(texts)
+
+async def summarize_text(text: str) -> str:
+    """
+        Summarizes the text with the summarizer backend.
 
         Parameters
         ----------
@@ -40,36 +111,129 @@ def summarize_text(text: str):
         response_text: str
             The summarized text
     """
-    response = client.completions.create(model=model,
-                                      prompt=f"Summarize: {text}",
-                                      temperature=0.8, 
-                                        top_p=0.95)
-    response_text = response.choices[0].text.strip()
-    return response_text
+    return (await summarize_texts([text]))[0]
+
+# Chunks from concurrent articles that arrive within the batching window are summarized in the same request to the vLLM server
+summary_batcher = MicroBatcher(summarize_texts)
+# Same for the streamed summaries, the chunks of concurrent articles are streamed in the same request
+stream_batcher = StreamBatcher(backend.stream)
+# Summaries are only reused for the same model, sampling parameters and prompt (and chunking strategy for the article summaries)
+summary_cache = SummaryCache(namespace=orjson.dumps({"backend": backend.name, **backend.namespace(), "prompt": SUMMARY_PROMPT, "chunking": CHUNKING_STRATEGY},
+                                                    option=orjson.OPT_SORT_KEYS).decode("utf-8"))
+# Bounds the number of articles summarized at the same time. The rest wait in a priority queue, or are rejected with a 503 when it is full
+admission = AdmissionController()
+
+async def summarize_chunks(texts: List[str]) -> List[str]:
+    """
+        Summarizes the texts (chunks of the article, or groups of summaries), reusing the cached summaries.
+        Only the texts that have not been summarized before are sent to the model, in a single batch.
+
+        Parameters
+        ----------
+        texts: List[str]
+            The texts to summarize
 
-def get_summary(text: str) -> str:
+        Returns
+        -------
+        summaries: List[str]
+            The summary of each of the texts, in the same order as the texts
+    """
+    keys = [summary_cache.make_key("chunk", [text]) for text in texts]
+    summaries = await summary_cache.get_many(keys)
+
+    missing = [i for i, summary in enumerate(summaries) if summary is None]
+    # Includes waiting for the batch to fill up and for the other texts in the batch
+    with time_stage("batch"):
+        results = await summary_batcher.submit([texts[i] for i in missing])
+    for i, summary in zip(missing, results):
+        summaries[i] = summary
+
+    await summary_cache.set_many({keys[i]: summaries[i] for i in missing})
+    return summaries
+
+async def reduce_summaries(summaries: List[str]) -> str:
+    """
+        Recursively combines the summaries until the result fits within TARGET_SUMMARY_TOKENS. In each round, groups of up to REDUCE_FAN_IN
+        consecutive summaries are summarized again (all the groups in one batch), for at most MAX_REDUCE_DEPTH rounds.
+        This bounds both the length of the summary and the number of model calls, regardless of the length of the article.
+
+        Parameters
+        ----------
+        summaries: List[str]
+            The summaries of the chunks of the article
+
+        Returns
+        -------
+        article_summary: str
+            The combined summary
+    """
+    for _ in range(MAX_REDUCE_DEPTH):
+        # Summaries that already fit together are kept as they are, however many there are, as every round loses some of the content
+        if count_text_tokens(" ".join(summaries)) <= TARGET_SUMMARY_TOKENS:
+            break
+        summaries = await summarize_chunks(group_summaries(summaries, REDUCE_FAN_IN))
+    return " ".join(summaries)
+
+async def get_summary(text: List[str], mode: SummaryMode = SUMMARY_MODE, priority: Priority = "interactive", deadline: Optional[float] = None) -> str:
     """
         Generates a summary for the article using the LLM. The article is first splits into chunks and each chunk 
-        is summarized indepdently. Then, the summaries of each chunk is appended and returned as a single string.
+        is summarized indepdently. All the chunks are summarized in a single batched request to the vLLM server (together with the
+        chunks of any other articles being summarized at the same time). Then, depending on the mode
+        - concat: the summaries of each chunk is appended and returned as a single string.
+        - map_reduce: the summaries of each chunk are recursively combined and summarized again (see reduce_summaries), so that the
+          length of the summary is bounded regardless of the length of the article.
+        The summaries of the article and of each chunk are cached, so only the chunks that have not been summarized before are sent to the model.
+        Articles that are not cached wait for the admission controller first, interactive before background, then shortest first.
         TODO: Maybe implement some post processing of the appended summary to ensure grammatical flow or something?
 
         Parameters
         ----------
-        text: str
-            The text to summarize
+        text: List[str]
+            The paragraphs of the article to summarize
+
+        mode: SummaryMode
+            How the summaries of the chunks are combined, concat or map_reduce
+
+        priority: Priority
+            The priority class of the request, interactive or background
+
+        deadline: Optional[float]
+            The time (of the event loop) by which the summary is needed, SUMMARY_TIMEOUT from now by default.
+            The article is dropped if it is still queued by then
 
         Returns
         -------
         article_summary: str
             The summarized article
+
+        Raises
+        ------
+        Overloaded
+            If the admission queue is full
+        DeadlineExceeded
+            If the deadline passes while the article is queued
     """
+    article_key = summary_cache.make_key("article", [mode, *text])
+    article_summary = await summary_cache.get(article_key)
+    if article_summary is not None:
+        return article_summary
+
     # Chunk the text such that the number of tokens fit within the token limits of the model
-    chunks = chunk_text(text)
+    with time_stage("chunking"):
+        chunks = chunk_article(text)
 
     # Get the output from the model
-    article_summary = [summarize_text(chunk) for chunk in chunks]
-    article_summary = " ".join(article_summary)
+    if deadline is None:
+        deadline = asyncio.get_running_loop().time() + SUMMARY_TIMEOUT
+    async with admission.admit(priority, sum(chunk.num_tokens for chunk in chunks), deadline):
+        chunk_summaries = await summarize_chunks([chunk.text for chunk in chunks])
+        if mode == "map_reduce":
+            with time_stage("reduce"):
+                article_summary = await reduce_summaries(chunk_summaries)
+        else:
+            article_summary = " ".join(chunk_summaries)
 
+    await summary_cache.set_many({article_key: article_summary})
     return article_summary
 
 @app.post("/article-summary")
@@ -81,7 +245,7 @@ async def summarize_article(article: Article) -> Dict[str, str]:
         Parameters
         ----------
         article: Article
-            The article details containing the url and a list of the <p> tags from the article HTML
+            The article details containing the url and a list of the <p> tags from the article HTML, and optionally the summary mode
 
         Returns
         -------
@@ -93,7 +257,18 @@ async def summarize_article(article: Article) -> Dict[str, str]:
         }
     """
     paragraphs = article.paragraphs
-    article_summary = get_summary(paragraphs)
+    timeout = get_timeout(article)
+    try:
+        # Rejects the request before the article is chunked if the queue is already full
+        admission.check(article.priority)
+        deadline = asyncio.get_running_loop().time() + timeout
+        async with asyncio.timeout_at(deadline):
+            with time_stage("summary"):
+                article_summary = await get_summary(paragraphs, article.mode, article.priority, deadline)
+    except Overloaded as e:
+        raise overloaded_error(e)
+    except (TimeoutError, DeadlineExceeded):
+        raise HTTPException(status_code=504, detail=f"Timed out summarizing the article after {timeout}s")
     response = {
         "url": article.url,
         "summary": article_summary
@@ -101,6 +276,266 @@ async def summarize_article(article: Article) -> Dict[str, str]:
     
     return response
 
+async def stream_summary(article: Article) -> AsyncGenerator[bytes, None]:
+    """
+        Generates the summary for the article like get_summary, but streams the tokens of the summary from the backend as they are generated,
+        so that the first words of the summary can be shown right away. All the chunks are generated in one streamed request, together with
+        the chunks of the articles streamed at the same time (see stream_batcher).
+        The chunks whose summaries are cached are sent in one piece each, before the others, and are not generated again. Cached article
+        summaries, and map_reduce summaries (which need every chunk summary before the final one can start), are sent in one piece.
+
+        Parameters
+        ----------
+        article: Article
+            The article details containing the url and a list of the <p> tags from the article HTML, and optionally the summary mode
+
+        Yields
+        ------
+        line: bytes
+            A line of newline-delimited JSON, one of
+            {"url": url of the article, "chunk": index of the chunk, "delta": the next piece of text of the summary of the chunk}
+            {"url": url of the article, "summary": the article summary, "done": true}
+            {"url": url of the article, "error": the error message, "retry_after": seconds (if the summarizer is overloaded), "done": true}
+    """
+    url, paragraphs = article.url, article.paragraphs
+    timeout = get_timeout(article)
+    start_time = time.perf_counter()
+    try:
+        # Only the awaits are bounded by the deadline, not the yields. If the deadline passed while the generator is suspended at a yield,
+        # the cancellation would be delivered to whoever is sending the line instead, and the stream would end without the error record
+        deadline = asyncio.get_running_loop().time() + timeout
+        article_key = summary_cache.make_key("article", [article.mode, *paragraphs])
+        async with asyncio.timeout_at(deadline):
+            article_summary = await summary_cache.get(article_key)
+            if article_summary is None and article.mode == "map_reduce":
+                article_summary = await get_summary(paragraphs, article.mode, article.priority, deadline)
+
+        if article_summary is None:
+            with time_stage("chunking"):
+                chunks = chunk_article(paragraphs)
+            # The chunks shared with articles summarized before (e.g. another version of the same story) are replayed from the cache,
+            # and only the rest are generated
+            chunk_keys = [summary_cache.make_key("chunk", [chunk.text]) for chunk in chunks]
+            async with asyncio.timeout_at(deadline):
+                cached = await summary_cache.get_many(chunk_keys)
+            chunk_summaries = [summary or "" for summary in cached]
+            for index, summary in enumerate(chunk_summaries):
+                if summary:
+                    yield ndjson_line({"url": url, "chunk": index, "delta": summary})
+
+            missing = [index for index, summary in enumerate(cached) if summary is None]
+            async with AsyncExitStack() as stack:
+                if missing:
+                    async with asyncio.timeout_at(deadline):
+                        await stack.enter_async_context(admission.admit(article.priority, sum(chunks[i].num_tokens for i in missing), deadline))
+                    deltas = await stack.enter_async_context(aclosing(stream_batcher.stream([chunks[i].text for i in missing])))
+                    while True:
+                        # The deltas that arrived while suspended at a yield are read without awaiting, so the timeout alone
+                        # would never fire for a reader slower than the backend
+                        if asyncio.get_running_loop().time() >= deadline:
+                            raise TimeoutError
+                        async with asyncio.timeout_at(deadline):
+                            item = await anext(deltas, None)
+                        if item is None:
+                            break
+                        index, delta = missing[item[0]], item[1]
+                        # The summary is stripped at the end, so drop the leading whitespace of the first delta
+                        delta = delta if chunk_summaries[index] else delta.lstrip()
+                        chunk_summaries[index] += delta
+                        if delta:
+                            yield ndjson_line({"url": url, "chunk": index, "delta": delta})
+
+            chunk_summaries = [summary.strip() for summary in chunk_summaries]
+            article_summary = " ".join(chunk_summaries)
+            await summary_cache.set_many({**{chunk_keys[i]: chunk_summaries[i] for i in missing}, article_key: article_summary})
+    except Exception as e:
+        yield error_record(url, timeout, e)
+        return
+
+    observe_stage("summary", time.perf_counter() - start_time)
+    yield ndjson_line({"url": url, "summary": article_summary, "done": True})
+
+@app.post("/article-summary/stream")
+async def stream_article_summary(article: Article) -> StreamingResponse:
+    """
+        API endpoint to stream the article summary as newline-delimited JSON, as it is generated (see stream_summary)
+
+        Parameters
+        ----------
+        article: Article
+            The article details containing the url and a list of the <p> tags from the article HTML, and optionally the summary mode
+    """
+    # Rejects the request with a 503 while the response status can still be set
+    try:
+        admission.check(article.priority)
+    except Overloaded as e:
+        raise overloaded_error(e)
+    return StreamingResponse(stream_summary(article), media_type="application/x-ndjson")
+
+async def summary_record(article: Article) -> bytes:
+    """
+        Summarizes the article (see get_summary) and formats the summary as a line of newline-delimited JSON, like the last line of stream_summary
+    """
+    timeout = get_timeout(article)
+    try:
+        deadline = asyncio.get_running_loop().time() + timeout
+        async with asyncio.timeout_at(deadline):
+            with time_stage("summary"):
+                article_summary = await get_summary(article.paragraphs, article.mode, article.priority, deadline)
+    except Exception as e:
+        return error_record(article.url, timeout, e)
+    return ndjson_line({"url": article.url, "summary": article_summary, "done": True})
+
+async def get_articles(query: str, limit: int) -> AsyncGenerator[Dict, None]:
+    """
+        Streams the articles for the query from the news scraper, skipping its heartbeat and error records
+    """
+    params = {"search_query": query, "limit": limit}
+    headers = {TRACE_ID_HEADER: trace_id.get()}
+    async with news_scraper_client.stream("GET", NEWS_SCRAPER_URL, params=params, headers=headers) as response:
+        response.raise_for_status()
+        async for record in aiter_ndjson(response):
+            if record.get("type", "article") == "article":
+                yield record
+
+async def query_summaries(query: str, limit: int, mode: SummaryMode, stream_tokens: bool, priority: Priority = "interactive") -> AsyncGenerator[bytes, None]:
+    """
+        Searches and scrapes the articles for the query (using the news scraper), and summarizes each article as soon as it arrives, while the
+        rest of the articles are still being scraped. The articles go straight from the news scraper into the summarizer, instead of through
+        the frontend, and only the summaries are sent back.
+        If every article is summarized in one piece, the chunks of all the articles (and of any other requests) go through summary_batcher,
+        so they share requests to the vLLM server. Otherwise, the summary of each article is streamed like stream_summary, and the chunks of
+        the articles streamed at the same time go through stream_batcher instead.
+
+        Parameters
+        ----------
+        query: str
+            The query to search articles on
+
+        limit: int
+            The maximum number of articles to summarize
+
+        mode: SummaryMode
+            How the summaries of the chunks are combined, concat or map_reduce
+
+        stream_tokens: bool
+            Whether to stream the tokens of the summaries as they are generated
+
+        priority: Priority
+            The priority class of the summaries, interactive or background
+
+        Yields
+        ------
+        line: bytes
+            A line of newline-delimited JSON, one of
+            {"type": "article", "url": url of the article}, when the article has been scraped and is being summarized
+            The lines of stream_summary for each article (only the last one if stream_tokens is false)
+            {"type": "error", "error": the error message}, if the articles could not be obtained from the news scraper
+    """
+    lines: asyncio.Queue[Optional[bytes]] = asyncio.Queue()
+
+    async def summarize(article: Article) -> None:
+        if stream_tokens:
+            async with aclosing(stream_summary(article)) as summary_lines:
+                async for line in summary_lines:
+                    lines.put_nowait(line)
+        else:
+            lines.put_nowait(await summary_record(article))
+
+    async def run() -> None:
+        try:
+            async with asyncio.TaskGroup() as tg:
+                async with aclosing(get_articles(query, limit)) as articles:
+                    async for record in articles:
+                        article = Article(url=record["url"], paragraphs=record["paragraphs"], mode=mode, priority=priority)
+                        lines.put_nowait(ndjson_line({"type": "article", "url": article.url}))
+                        tg.create_task(summarize(article))
+        except Exception as e:
+            lines.put_nowait(ndjson_line({"type": "error", "error": f"Failed to get the articles: {e!r}"}))
+        finally:
+            lines.put_nowait(None)
+
+    # If the client disconnects, the pipeline is cancelled, which closes the stream from the news scraper and cancels the summaries in flight
+    task = asyncio.create_task(run())
+    try:
+        while (line := await lines.get()) is not None:
+            yield line
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+@app.get("/query-summaries")
+async def get_query_summaries(search_query: Annotated[str, Query(min_length=1, max_length=50, pattern=r'^[a-zA-Z0-9\s\-_\,]+$')], # Same as the news scraper
+                              limit: Annotated[int, Query(gt=0)] = 3,
+                              mode: SummaryMode = SUMMARY_MODE,
+                              stream_tokens: bool = False,
+                              priority: Priority = "interactive") -> StreamingResponse:
+    """
+        API endpoint to search, scrape and summarize the articles for a query in one pipeline, streaming the summaries as newline-delimited JSON
+        (see query_summaries). Heartbeat lines are sent while there is nothing else to send.
+
+        Parameters
+        ----------
+        search_query: str
+            The query to search articles on
+
+        limit: int
+            The maximum number of articles to summarize
+
+        mode: SummaryMode
+            How the summaries of the chunks are combined, concat or map_reduce
+
+        stream_tokens: bool
+            Whether to stream the tokens of the summaries as they are generated
+
+        priority: Priority
+            The priority class of the summaries, interactive or background (e.g. prefetching)
+    """
+    # Rejects the request with a 503 before the articles are scraped, if no more summaries can be queued
+    try:
+        admission.check(priority)
+    except Overloaded as e:
+        raise overloaded_error(e)
+    return StreamingResponse(with_heartbeats(query_summaries(search_query, limit, mode, stream_tokens, priority)), media_type="application/x-ndjson")
+
+@app.get("/ready")
+async def get_readiness() -> JSONResponse:
+    """
+        API endpoint for the readiness probe. Responds with 503 until the tokenizer and the model have been loaded, and with 200 after,
+        together with how long each of the warm-up steps took. If a step failed (e.g. the model could not be loaded yet), the service is
+        still ready but degraded, as the step is retried in the background and otherwise done on first use
+    """
+    return JSONResponse(warm_up.get_state(), status_code=200 if warm_up.ready else 503)
+
+@app.get("/metrics")
+async def get_metrics() -> Response:
+    """
+        API endpoint for Prometheus to scrape the stage timing histograms from
+    """
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/chunking-stats")
+async def get_chunking_stats() -> Dict[str, Dict[int, int]]:
+    """
+        API endpoint to get the chunks-per-article and tokens-per-chunk histograms, to see how many model calls the chunking results in
+    """
+    return {name: dict(sorted(histogram.items())) for name, histogram in chunking_stats.items()}
+
+@app.get("/cache-stats")
+async def get_cache_stats() -> Dict[str, float]:
+    """
+        API endpoint to get the hit/miss counters and hit rates of the summary cache
+    """
+    return summary_cache.get_stats()
+
+@app.get("/queue-stats")
+async def get_queue_stats() -> Dict[str, float]:
+    """
+        API endpoint to get the number of active and queued articles and the number of articles shed by the admission controller.
+        The queue depth and wait times are also exported to Prometheus, see /metrics
+    """
+    return admission.get_stats()
+
 if __name__ == "__main__":
     uvicorn.run("main:app", 
                 host="127.0.0.1",
@@ -1 +1,9 @@
-from .text_processing import chunk_text
\ No newline at end of file
+from .text_processing import chunk_text
+from .batching import MicroBatcher, StreamBatcher
+from .retry import call_with_retries
+from .text_processing import Chunk, count_tokens_batch, count_text_tokens, get_tokenizer
+from .chunking import chunk_article, chunking_stats, group_summaries, SUMMARY_PROMPT, CHUNKING_STRATEGY
+from .summary_cache import SummaryCache
+from .metrics import observe_stage, time_stage, trace_id, TraceIDMiddleware, TRACE_ID_HEADER
+from .backends import make_backend, SummarizerBackend, BACKENDS
+from .admission import AdmissionController, Overloaded, DeadlineExceeded, Priority
@@ -0,0 +1,192 @@
+from __future__ import annotations
+from typing import AsyncIterator, Dict, List, Literal, Tuple
+from contextlib import asynccontextmanager
+import asyncio
+import heapq
+import itertools
+import math
+import os
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from .metrics import METRICS_ENABLED, STAGE_BUCKETS
+
+MAX_ACTIVE_SUMMARIES = int(os.environ.get("MAX_ACTIVE_SUMMARIES", 16)) # Max number of articles being summarized by the model at the same time
+MAX_QUEUED_SUMMARIES = int(os.environ.get("MAX_QUEUED_SUMMARIES", 64)) # Max number of articles waiting, beyond which requests are rejected
+MAX_RETRY_AFTER = 30 # Max number of seconds in the Retry-After of rejected requests
+
+Priority = Literal["interactive", "background"]
+PRIORITIES: Dict[str, int] = {"interactive": 0, "background": 1} # Lower goes first
+
+queue_depth = Gauge("summarizer_queue_depth", "Number of articles waiting to be summarized", ["priority"])
+queue_wait_seconds = Histogram("summarizer_queue_wait_seconds", "Seconds the articles waited to be summarized", ["priority"], buckets=STAGE_BUCKETS)
+shed_total = Counter("summarizer_shed_total", "Number of articles that were not summarized, by reason (rejected, evicted or expired)",
+                     ["priority", "reason"])
+
+class Overloaded(Exception):
+    """
+        The queue is full. The request should be retried after retry_after seconds
+    """
+    def __init__(self, retry_after: int):
+        super().__init__(f"The summarizer is overloaded, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+class DeadlineExceeded(Exception):
+    """
+        The deadline of the request passed before it could be summarized
+    """
+
+class AdmissionController:
+    """
+        Admission control in front of the model. At most max_active articles are summarized at the same time, and the rest wait in a
+        bounded queue, in order of priority class (interactive before background), then shortest job first (by the number of tokens in
+        the chunks of the article), then arrival.
+        - When the queue is full, an interactive request takes the place of the largest queued background request. Otherwise the request
+          is rejected right away with Overloaded, so the client can back off instead of waiting in an ever deeper queue.
+        - Requests whose deadline has passed while queued are dropped (with DeadlineExceeded) before they reach the model.
+    """
+    def __init__(self, max_active: int = MAX_ACTIVE_SUMMARIES, max_queued: int = MAX_QUEUED_SUMMARIES):
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.active = 0
+        self.service_time = 1.0 # Moving average of the seconds an admitted article takes, to estimate the Retry-After
+        self._queue: List[Tuple[int, int, int, float, asyncio.Future]] = [] # (priority, tokens, arrival, deadline, waiter)
+        self._queued: Dict[str, int] = {priority: 0 for priority in PRIORITIES}
+        self._arrivals = itertools.count()
+        self.stats: Dict[str, int] = {"admitted": 0, "rejected": 0, "evicted": 0, "expired": 0}
+
+    def _set_queued(self, priority: str, delta: int) -> None:
+        self._queued[priority] += delta
+        if METRICS_ENABLED:
+            queue_depth.labels(priority).set(self._queued[priority])
+
+    def _shed(self, priority: str, reason: str) -> None:
+        self.stats[reason] += 1
+        if METRICS_ENABLED:
+            shed_total.labels(priority, reason).inc()
+
+    def retry_after(self) -> int:
+        """
+            Estimates the number of seconds until the queue has room again
+        """
+        waiting = sum(self._queued.values())
+        return max(1, min(MAX_RETRY_AFTER, math.ceil(self.service_time * (waiting + 1) / self.max_active)))
+
+    def _find_evictable(self, rank: Tuple[int, int]) -> int:
+        """
+            Finds the queued background request that is ranked last, if it is ranked after rank. Returns its index in the queue, or -1
+        """
+        worst = -1
+        for i, (priority, tokens, arrival, _, waiter) in enumerate(self._queue):
+            if waiter.done() or priority == PRIORITIES["interactive"] or (priority, tokens) <= rank:
+                continue
+            if worst == -1 or (priority, tokens, arrival) > self._queue[worst][:3]:
+                worst = i
+        return worst
+
+    def check(self, priority: Priority) -> None:
+        """
+            Raises Overloaded if a request of the priority class would be rejected right now, so that it can be rejected before any work is done
+        """
+        if sum(self._queued.values()) >= self.max_queued and (priority != "interactive" or self._queued["background"] == 0):
+            self._shed(priority, "rejected")
+            raise Overloaded(self.retry_after())
+
+    def _enqueue(self, priority: Priority, tokens: int, deadline: float) -> asyncio.Future:
+        rank = (PRIORITIES[priority], tokens)
+        if sum(self._queued.values()) >= self.max_queued:
+            evict = self._find_evictable(rank) if priority == "interactive" else -1
+            if evict == -1:
+                self._shed(priority, "rejected")
+                raise Overloaded(self.retry_after())
+            # The evicted entry stays in the heap, and is skipped as its waiter is done
+            evicted = self._queue[evict]
+            evicted[4].set_exception(Overloaded(self.retry_after()))
+            self._set_queued("background", -1)
+            self._shed("background", "evicted")
+
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (*rank, next(self._arrivals), deadline, waiter))
+        self._set_queued(priority, 1)
+        return waiter
+
+    def _grant_next(self) -> None:
+        loop = asyncio.get_running_loop()
+        while self.active < self.max_active and self._queue:
+            priority, _, _, deadline, waiter = heapq.heappop(self._queue)
+            if waiter.done(): # Cancelled or evicted
+                continue
+            name = next(name for name, value in PRIORITIES.items() if value == priority)
+            self._set_queued(name, -1)
+            if loop.time() >= deadline:
+                waiter.set_exception(DeadlineExceeded())
+                self._shed(name, "expired")
+                continue
+            self.active += 1
+            waiter.set_result(None)
+
+    def _release(self) -> None:
+        self.active -= 1
+        self._grant_next()
+
+    @asynccontextmanager
+    async def admit(self, priority: Priority, tokens: int, deadline: float) -> AsyncIterator[None]:
+        """
+            Waits until the article can be summarized, and holds one of the active slots until the context exits
+
+            Parameters
+            ----------
+            priority: Priority
+                The priority class of the request, interactive or background
+
+            tokens: int
+                The number of tokens in the chunks of the article, the shorter articles go first within the priority class
+
+            deadline: float
+                The time (of the event loop) by which the summary is needed
+
+            Raises
+            ------
+            Overloaded
+                If the queue is full
+            DeadlineExceeded
+                If the deadline passes before the article can be summarized
+        """
+        loop = asyncio.get_running_loop()
+        if loop.time() >= deadline:
+            self._shed(priority, "expired")
+            raise DeadlineExceeded()
+
+        enqueued_at = loop.time()
+        if self.active < self.max_active and not any(self._queued.values()):
+            self.active += 1
+        else:
+            waiter = self._enqueue(priority, tokens, deadline)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.cancelled():
+                    # Still queued, the entry is skipped once it reaches the front of the queue
+                    self._set_queued(priority, -1)
+                elif waiter.exception() is None:
+                    # Admitted right as the request was cancelled
+                    self._release()
+                raise
+
+        self.stats["admitted"] += 1
+        if METRICS_ENABLED:
+            queue_wait_seconds.labels(priority).observe(loop.time() - enqueued_at)
+        started_at = loop.time()
+        try:
+            yield
+        finally:
+            self.service_time = 0.9 * self.service_time + 0.1 * (loop.time() - started_at)
+            self._release()
+
+    def get_stats(self) -> Dict[str, float]:
+        """
+            Gets the number of active and queued articles (by priority class), and the number of articles admitted and shed
+        """
+        return {"active": self.active, "max_active": self.max_active, "max_queued": self.max_queued,
+                **{f"queued_{priority}": queued for priority, queued in self._queued.items()},
+                **self.stats, "retry_after": self.retry_after()}
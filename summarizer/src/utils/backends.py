@@ -0,0 +1,256 @@
+from __future__ import annotations
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import logging
+import os
+import time
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from news_common import available_cpus
+
+from .chunking import CHUNKING_STRATEGY, CONTEXT_TOKENS, SUMMARY_PROMPT
+from .metrics import observe_stage, time_stage, trace_id, TRACE_ID_HEADER
+from .retry import call_with_retries
+from .text_processing import CHUNK_TOKEN_LIMIT, tokenizer_file
+
+logger = logging.getLogger('summarizer')
+
+SUMMARIZER_BACKEND = os.environ.get("SUMMARIZER_BACKEND", "vllm") # One of BACKENDS
+SAMPLING_PARAMS = {"temperature": 0.8, "top_p": 0.95}
+# Max number of tokens in the summary of each chunk (the CPU backend generates the same number of tokens). The summaries get the same share
+# of the tokens of the chunks with either chunking strategy: 16 tokens (the default max_tokens of the completions API, which the vLLM
+# backend has always used) for the rolling chunks of up to CHUNK_TOKEN_LIMIT tokens, and proportionally more for the budget chunks,
+# which fill up the context of the model
+ROLLING_SUMMARY_TOKENS = 16
+MAX_SUMMARY_TOKENS = int(os.environ.get("MAX_SUMMARY_TOKENS", ROLLING_SUMMARY_TOKENS if CHUNKING_STRATEGY == "rolling"
+                                        else ROLLING_SUMMARY_TOKENS * CONTEXT_TOKENS // CHUNK_TOKEN_LIMIT))
+
+# vLLM backend
+VLLM_MODEL = os.environ.get("VLLM_MODEL", "bart-large-cnn") # The served model name
+VLLM_API_BASE = os.environ.get("VLLM_API_BASE", "http://vllm-server:8000/v1")
+MAX_INFLIGHT_REQUESTS = int(os.environ.get("MAX_INFLIGHT_REQUESTS", 8)) # Max number of requests in flight to the vLLM server
+REQUEST_TIMEOUT = float(os.environ.get("REQUEST_TIMEOUT", 60)) # Seconds for a single request to the vLLM server
+
+# CPU backend
+CPU_MODEL = os.environ.get("CPU_MODEL", "sshleifer/distilbart-cnn-12-6") # Huggingface model id or local directory, with the bart tokenizer
+CPU_ENGINE = os.environ.get("CPU_ENGINE", "onnx") # onnx (ONNX Runtime) or int8 (PyTorch with dynamically quantized int8 linear layers)
+CPU_THREADS = int(os.environ.get("CPU_THREADS", available_cpus())) # Number of threads used by the engine for each batch
+CPU_MAX_BATCH_SIZE = int(os.environ.get("CPU_MAX_BATCH_SIZE", 8)) # Larger batches are generated in several passes
+# The ONNX model exported on first use is saved here, so that the next starts load it instead of exporting it again
+CPU_EXPORT_DIR = os.environ.get("CPU_EXPORT_DIR", os.path.join(os.path.dirname(os.path.realpath(__file__)), "onnx"))
+
+class SummarizerBackend(ABC):
+    """
+        Generates the summaries of texts with a model. The texts of concurrent requests are collected by the MicroBatcher (and the
+        StreamBatcher) in main.py, so summarize (and stream) is called with batches of texts. The backends implement namespace and summarize, and may override the rest.
+    """
+    name: str
+
+    @abstractmethod
+    def namespace(self) -> Dict[str, Any]:
+        """
+            Identifies the model and the generation parameters, so that cached summaries are only reused for the same ones
+        """
+
+    @abstractmethod
+    async def summarize(self, texts: List[str]) -> List[str]:
+        """
+            Summarizes the texts
+
+            Parameters
+            ----------
+            texts: List[str]
+                The texts to summarize
+
+            Returns
+            -------
+            summaries: List[str]
+                The summarized texts, in the same order as the texts
+        """
+
+    async def stream(self, texts: List[str]) -> AsyncIterator[Tuple[int, str]]:
+        """
+            Summarizes the texts, yielding the summaries as they are generated. Backends that cannot stream yield each summary in one piece.
+
+            Yields
+            ------
+            index, delta: Tuple[int, str]
+                The index of the text, and the next piece of its summary
+        """
+        for index, summary in enumerate(await self.summarize(texts)):
+            yield index, summary
+
+    async def warm_up(self) -> None:
+        """
+            Loads the model ahead of the first request, called at startup (see WarmUp). Backends without anything to load do nothing
+        """
+
+    async def close(self) -> None:
+        pass
+
+class VLLMBackend(SummarizerBackend):
+    """
+        Summarizes the texts with the model served by a vLLM server (or any other OpenAI-compatible completions API).
+        All the texts are sent as a list of prompts in a single request, which the vLLM server batches together.
+        At most MAX_INFLIGHT_REQUESTS requests are sent at the same time, and overloaded (429/503) responses are retried.
+    """
+    name = "vllm"
+
+    def __init__(self, api_base: str = VLLM_API_BASE, model: str = VLLM_MODEL, max_inflight_requests: int = MAX_INFLIGHT_REQUESTS):
+        self.model = model
+        # The client is shared by all the requests, so the connections to the vLLM server are pooled and kept alive.
+        # Retries are handled by call_with_retries instead of the client
+        self.client = AsyncOpenAI(
+            api_key="EMPTY",
+            base_url=api_base,
+            timeout=httpx.Timeout(REQUEST_TIMEOUT, connect=5),
+            max_retries=0,
+            http_client=DefaultAsyncHttpxClient(limits=httpx.Limits(max_connections=max_inflight_requests,
+                                                                    max_keepalive_connections=max_inflight_requests)),
+        )
+        # Requests beyond max_inflight_requests wait here (while the batcher keeps filling up the next batch), instead of queueing at the vLLM server
+        self.slots = asyncio.Semaphore(max_inflight_requests)
+
+    def namespace(self) -> Dict[str, Any]:
+        return {"model": self.model, "max_tokens": MAX_SUMMARY_TOKENS, **SAMPLING_PARAMS}
+
+    def _create(self, texts: List[str], stream: bool):
+        return self.client.completions.create(model=self.model,
+                                              prompt=[SUMMARY_PROMPT.format(text=text) for text in texts],
+                                              max_tokens=MAX_SUMMARY_TOKENS,
+                                              stream=stream,
+                                              extra_headers={TRACE_ID_HEADER: trace_id.get()},
+                                              **SAMPLING_PARAMS)
+
+    async def summarize(self, texts: List[str]) -> List[str]:
+        async def request():
+            with time_stage("vllm_slot_wait"):
+                await self.slots.acquire()
+            try:
+                with time_stage("vllm_request"):
+                    return await self._create(texts, stream=False)
+            finally:
+                self.slots.release()
+
+        response = await call_with_retries(request)
+        # The choices are not guaranteed to be in the same order as the prompts
+        summaries = [""] * len(texts)
+        for choice in response.choices:
+            summaries[choice.index] = choice.text.strip()
+        return summaries
+
+    async def stream(self, texts: List[str]) -> AsyncIterator[Tuple[int, str]]:
+        with time_stage("vllm_slot_wait"):
+            await self.slots.acquire()
+        try:
+            request_time = time.perf_counter()
+            stream = await call_with_retries(lambda: self._create(texts, stream=True))
+            first_token = True
+            async for completion in stream:
+                if first_token:
+                    observe_stage("vllm_first_token", time.perf_counter() - request_time)
+                    first_token = False
+                for choice in completion.choices:
+                    yield choice.index, choice.text
+            observe_stage("vllm_request", time.perf_counter() - request_time)
+        finally:
+            self.slots.release()
+
+    async def close(self) -> None:
+        await self.client.close()
+
+class CPUBackend(SummarizerBackend):
+    """
+        Summarizes the texts in-process on the CPU, so that no GPU (or vLLM server) is needed, e.g. for low-traffic or edge deployments.
+        The model is run either with ONNX Runtime (exported from the PyTorch model on first use), or with PyTorch with the linear layers
+        dynamically quantized to int8. The batches are generated one at a time in a worker thread, so the event loop is never blocked, and
+        sorted by length so that texts of similar lengths are padded together.
+        Needs the optional dependencies of the cpu extra (pip install .[cpu]).
+    """
+    name = "cpu"
+
+    def __init__(self, model: str = CPU_MODEL, engine: str = CPU_ENGINE, max_batch_size: int = CPU_MAX_BATCH_SIZE, threads: int = CPU_THREADS):
+        if engine not in ("onnx", "int8"):
+            raise ValueError(f"Unknown CPU engine {engine!r}, expected onnx or int8")
+        self.model_name = model
+        self.engine = engine
+        self.max_batch_size = max_batch_size
+        self.threads = threads
+        self._model = None
+        self._tokenizer = None
+        # A single worker, as each batch already uses all the threads
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cpu-summarizer")
+
+    def namespace(self) -> Dict[str, Any]:
+        return {"model": self.model_name, "engine": self.engine, "max_tokens": MAX_SUMMARY_TOKENS, **SAMPLING_PARAMS}
+
+    def _load(self) -> None:
+        if self._model is not None:
+            return
+        import torch
+        from transformers import PreTrainedTokenizerFast
+
+        torch.set_num_threads(self.threads)
+        self._tokenizer = PreTrainedTokenizerFast(tokenizer_file=tokenizer_file, bos_token="<s>", eos_token="</s>", unk_token="<unk>",
+                                                  pad_token="<pad>", mask_token="<mask>")
+        start_time = time.perf_counter()
+        if self.engine == "onnx":
+            from optimum.onnxruntime import ORTModelForSeq2SeqLM
+            export_dir = os.path.join(CPU_EXPORT_DIR, self.model_name.replace("/", "--"))
+            if os.path.isdir(export_dir):
+                self._model = ORTModelForSeq2SeqLM.from_pretrained(export_dir)
+            else:
+                self._model = ORTModelForSeq2SeqLM.from_pretrained(self.model_name, export=True)
+                try:
+                    self._model.save_pretrained(export_dir)
+                except OSError as e:
+                    logger.warning(f"Failed to save the exported model to {export_dir}, it will be exported again on the next start: {e!r}")
+        else:
+            from transformers import AutoModelForSeq2SeqLM
+            model = AutoModelForSeq2SeqLM.from_pretrained(self.model_name).eval()
+            self._model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        logger.info(f"Loaded {self.model_name} ({self.engine}) in {time.perf_counter() - start_time:.2f}s")
+
+    def _generate(self, texts: List[str]) -> List[str]:
+        import torch
+
+        self._load()
+        summaries = [""] * len(texts)
+        # Sort by length, so that each batch pads its texts to a similar length
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        for start in range(0, len(order), self.max_batch_size):
+            batch = order[start:start + self.max_batch_size]
+            inputs = self._tokenizer([SUMMARY_PROMPT.format(text=texts[i]) for i in batch],
+                                     padding=True, truncation=True, max_length=CONTEXT_TOKENS, return_tensors="pt")
+            with torch.inference_mode():
+                outputs = self._model.generate(**inputs, max_new_tokens=MAX_SUMMARY_TOKENS, do_sample=True, **SAMPLING_PARAMS)
+            for i, summary in zip(batch, self._tokenizer.batch_decode(outputs, skip_special_tokens=True)):
+                summaries[i] = summary.strip()
+        return summaries
+
+    async def warm_up(self) -> None:
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._load)
+
+    async def summarize(self, texts: List[str]) -> List[str]:
+        with time_stage("cpu_generate"):
+            return await asyncio.get_running_loop().run_in_executor(self._executor, self._generate, texts)
+
+    async def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+BACKENDS = {
+    "vllm": VLLMBackend,
+    "cpu": CPUBackend,
+}
+
+def make_backend(name: Optional[str] = None) -> SummarizerBackend:
+    """
+        Creates the summarizer backend, SUMMARIZER_BACKEND by default
+    """
+    name = name or SUMMARIZER_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown summarizer backend {name!r}, expected one of {list(BACKENDS)}")
+    return BACKENDS[name]()
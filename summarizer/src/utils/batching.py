@@ -0,0 +1,207 @@
+from __future__ import annotations
+from typing import AsyncGenerator, AsyncIterator, Awaitable, Callable, List, Optional, Set, Tuple, Union
+from contextlib import aclosing
+import asyncio
+import os
+
+BATCH_WINDOW = float(os.environ.get("BATCH_WINDOW_MS", 10)) / 1000 # Seconds to wait for more texts before sending a batch
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", 64)) # Send the batch right away once it has this many texts
+
+class MicroBatcher:
+    """
+        Collects the texts submitted by concurrent requests over a short window, and processes them together in a single batch
+        (e.g. one request to the vLLM server with a list of prompts). Each request gets back the results for its own texts, in order.
+        The texts of requests cancelled while waiting for the batch (e.g. the client disconnected) are dropped from it, and a batch is
+        cancelled once every request waiting on it has been cancelled, so that the backend does not generate results nobody will read.
+    """
+    def __init__(self,
+                 process_batch: Callable[[List[str]], Awaitable[List[str]]],
+                 window: float = BATCH_WINDOW,
+                 max_batch_size: int = MAX_BATCH_SIZE):
+        self.process_batch = process_batch
+        self.window = window
+        self.max_batch_size = max_batch_size
+
+        self._pending: List[Tuple[List[str], asyncio.Future]] = []
+        self._pending_size = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._running: Set[asyncio.Task] = set()
+
+    async def submit(self, texts: List[str]) -> List[str]:
+        """
+            Adds the texts to the next batch, and waits for their results
+
+            Parameters
+            ----------
+            texts: List[str]
+                The texts to process
+
+            Returns
+            -------
+            results: List[str]
+                The result for each of the texts, in the same order as the texts
+        """
+        if not texts:
+            return []
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((texts, future))
+        self._pending_size += len(texts)
+
+        if self._pending_size >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+
+        batch = [(texts, future) for texts, future in self._pending if not future.cancelled()]
+        self._pending = []
+        self._pending_size = 0
+        if not batch:
+            return
+
+        # Keep a reference to the task so that it is not garbage collected while running
+        task = asyncio.create_task(self._run(batch))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+        def cancel_if_abandoned(_: asyncio.Future) -> None:
+            if all(future.cancelled() for _, future in batch):
+                task.cancel()
+        for _, future in batch:
+            future.add_done_callback(cancel_if_abandoned)
+
+    async def _run(self, batch: List[Tuple[List[str], asyncio.Future]]) -> None:
+        texts = [text for request_texts, _ in batch for text in request_texts]
+        try:
+            results = await self.process_batch(texts)
+        except asyncio.CancelledError:
+            for _, future in batch:
+                future.cancel()
+            raise
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        # Split the results back to the requests that submitted the texts
+        start = 0
+        for request_texts, future in batch:
+            end = start + len(request_texts)
+            if not future.done(): # The request may have been cancelled while waiting
+                future.set_result(results[start:end])
+            start = end
+
+_END = None # Sent to a StreamBatcher request once the batch has been streamed
+
+class _StreamRequest:
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.deltas: asyncio.Queue[Union[Tuple[int, str], BaseException, None]] = asyncio.Queue()
+        self.closed = False # The request stopped reading its deltas (e.g. it was cancelled)
+        self.batch: List[_StreamRequest] = []
+        self.task: Optional[asyncio.Task] = None
+
+class StreamBatcher:
+    """
+        Like MicroBatcher, but for streamed results: the texts submitted by concurrent requests over a short window are streamed together
+        (e.g. one streamed request to the vLLM server with a list of prompts), and each piece of a result is passed on to the request that
+        submitted the text as soon as it arrives.
+        The backend does not say when each text is done, so the stream of every request ends when the whole batch has been streamed, i.e.
+        when the longest result of the batch is done. A batch is cancelled once every request reading from it has stopped.
+    """
+    def __init__(self,
+                 stream_batch: Callable[[List[str]], AsyncIterator[Tuple[int, str]]],
+                 window: float = BATCH_WINDOW,
+                 max_batch_size: int = MAX_BATCH_SIZE):
+        self.stream_batch = stream_batch
+        self.window = window
+        self.max_batch_size = max_batch_size
+
+        self._pending: List[_StreamRequest] = []
+        self._pending_size = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._running: Set[asyncio.Task] = set()
+
+    async def stream(self, texts: List[str]) -> AsyncGenerator[Tuple[int, str], None]:
+        """
+            Adds the texts to the next batch, and yields the pieces of their results as they are streamed
+
+            Parameters
+            ----------
+            texts: List[str]
+                The texts to process
+
+            Yields
+            ------
+            index, delta: Tuple[int, str]
+                The index of the text in texts, and the next piece of its result
+        """
+        if not texts:
+            return
+
+        request = _StreamRequest(texts)
+        self._pending.append(request)
+        self._pending_size += len(texts)
+
+        if self._pending_size >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+
+        try:
+            while (item := await request.deltas.get()) is not _END:
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            request.closed = True
+            if request.task is not None and all(other.closed for other in request.batch):
+                request.task.cancel()
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch = [request for request in self._pending if not request.closed]
+        self._pending = []
+        self._pending_size = 0
+        if not batch:
+            return
+
+        # Keep a reference to the task so that it is not garbage collected while running
+        task = asyncio.create_task(self._run(batch))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+        for request in batch:
+            request.batch, request.task = batch, task
+
+    async def _run(self, batch: List[_StreamRequest]) -> None:
+        # The request and the index in the request of each text of the batch
+        owners = [(request, index) for request in batch for index in range(len(request.texts))]
+        try:
+            async with aclosing(self.stream_batch([text for request in batch for text in request.texts])) as deltas:
+                async for index, delta in deltas:
+                    request, request_index = owners[index]
+                    if not request.closed:
+                        request.deltas.put_nowait((request_index, delta))
+        except asyncio.CancelledError as e:
+            for request in batch:
+                request.deltas.put_nowait(e)
+            raise
+        except Exception as e:
+            for request in batch:
+                request.deltas.put_nowait(e)
+            return
+
+        for request in batch:
+            request.deltas.put_nowait(_END)
@@ -0,0 +1,217 @@
+from __future__ import annotations
+from typing import Callable, Dict, List, Tuple
+from collections import Counter
+from functools import lru_cache
+import math
+import os
+import re
+
+from .text_processing import Chunk, chunk_text, count_text_tokens, count_tokens_batch, get_tokenizer
+
+SUMMARY_PROMPT = "Summarize: {text}"
+CONTEXT_TOKENS = int(os.environ.get("CONTEXT_TOKENS", 1024)) # Max number of input tokens of the model (bart-large-cnn)
+NUM_SPECIAL_TOKENS = 2 # <s> and </s> added by the tokenizer
+# Joining the paragraphs with spaces may not tokenize to exactly the sum of their token counts, so leave some room
+CHUNK_SAFETY_MARGIN = 16
+CHUNK_TOKEN_OVERLAP = int(os.environ.get("CHUNK_TOKEN_OVERLAP", 32)) # Number of tokens from the end of a chunk repeated at the start of the next
+CHUNKING_STRATEGY = os.environ.get("CHUNKING_STRATEGY", "budget")
+TOKENS_PER_CHUNK_BUCKET = 128 # Bucket size of the tokens-per-chunk histogram
+
+# A sentence ends with . ! or ?, optionally followed by a closing quote or bracket
+SENTENCE_BOUNDARY_PATTERN = re.compile(r"(?<=[.!?])\s+|(?<=[.!?][”’\"')])\s+")
+
+chunking_stats: Dict[str, Counter] = {"chunks_per_article": Counter(), "tokens_per_chunk": Counter()}
+
+@lru_cache(maxsize=1)
+def get_chunk_budget() -> int:
+    """
+        Gets the max number of tokens in a chunk, so that the prompt containing the chunk fits in the context of the model
+    """
+    return CONTEXT_TOKENS - count_text_tokens(SUMMARY_PROMPT.format(text="")) - NUM_SPECIAL_TOKENS - CHUNK_SAFETY_MARGIN
+
+def split_by_tokens(text: str, max_tokens: int) -> List[str]:
+    """
+        Splits the text into pieces of at most max_tokens tokens. Only used for sentences that are too long by themselves.
+    """
+    offsets = get_tokenizer().encode(text, add_special_tokens=False).offsets
+    pieces = []
+    for start in range(0, len(offsets), max_tokens):
+        end = min(start + max_tokens, len(offsets))
+        piece_end = offsets[end][0] if end < len(offsets) else len(text)
+        pieces.append(text[offsets[start][0]:piece_end].strip())
+    return [piece for piece in pieces if piece]
+
+def get_overlap(text: str, num_tokens: int) -> Tuple[str, int]:
+    """
+        Gets the last num_tokens tokens of the text (as text), which are repeated at the start of the next chunk
+
+        Returns
+        -------
+        overlap, overlap_tokens: Tuple[str, int]
+            The overlapping text and its number of tokens
+    """
+    if num_tokens <= 0:
+        return "", 0
+    offsets = get_tokenizer().encode(text, add_special_tokens=False).offsets
+    if len(offsets) <= num_tokens:
+        return text, len(offsets)
+    return text[offsets[-num_tokens][0]:].strip(), num_tokens
+
+def split_oversized(paragraphs: List[str], max_tokens: int) -> Tuple[List[str], List[int]]:
+    """
+        Splits the paragraphs that have more than max_tokens tokens at their sentence boundaries (and the sentences that are
+        still too long, at max_tokens), so that every piece fits in a chunk.
+
+        Returns
+        -------
+        units, unit_tokens: Tuple[List[str], List[int]]
+            The paragraphs (or pieces of them), and the number of tokens in each of them
+    """
+    units, unit_tokens = [], []
+    for paragraph, num_tokens in zip(paragraphs, count_tokens_batch(paragraphs)):
+        if num_tokens <= max_tokens:
+            units.append(paragraph)
+            unit_tokens.append(num_tokens)
+            continue
+
+        sentences = [s for s in SENTENCE_BOUNDARY_PATTERN.split(paragraph) if s]
+        for sentence, sentence_tokens in zip(sentences, count_tokens_batch(sentences)):
+            if sentence_tokens <= max_tokens:
+                units.append(sentence)
+                unit_tokens.append(sentence_tokens)
+            else:
+                pieces = split_by_tokens(sentence, max_tokens)
+                units.extend(pieces)
+                unit_tokens.extend(count_tokens_batch(pieces))
+    return units, unit_tokens
+
+def pack(unit_tokens: List[int], capacity: int, overlap_tokens: int) -> List[Tuple[int, int]]:
+    """
+        Greedily packs the units (in order) into chunks of at most capacity tokens, where every chunk after the first also holds
+        overlap_tokens tokens from the previous chunk. Greedy packing gives the fewest possible chunks for the capacity.
+
+        Returns
+        -------
+        ranges: List[Tuple[int, int]]
+            The (start, end) indices of the units in each chunk
+    """
+    ranges = []
+    start, used = 0, 0
+    for i, num_tokens in enumerate(unit_tokens):
+        available = capacity - (overlap_tokens if ranges else 0)
+        if i > start and used + num_tokens > available:
+            ranges.append((start, i))
+            start, used = i, 0
+        used += num_tokens
+    ranges.append((start, len(unit_tokens)))
+    return ranges
+
+def chunk_text_to_budget(text: List[str]) -> List[Chunk]:
+    """
+        Chunks the article text so that each chunk fills the context of the model (minus the prompt), to minimise the number of chunks
+        (and so the number of calls to the model) per article.
+        1. Paragraphs that do not fit in a chunk are split at sentence boundaries.
+        2. The paragraphs are packed in order into the fewest possible chunks, and then the chunk size is reduced as much as possible
+           without needing more chunks, so that the chunks are of similar sizes (instead of a full chunk followed by a tiny one).
+        3. The last CHUNK_TOKEN_OVERLAP tokens of each chunk are repeated at the start of the next chunk, for context.
+
+        Parameters
+        ----------
+        text: List[str]
+            The paragraphs of the article to chunk
+
+        Returns
+        -------
+        chunks: List[Chunk]
+            A list of chunked text created from the article, together with the number of tokens in each chunk
+    """
+    budget = get_chunk_budget()
+    units, unit_tokens = split_oversized(text, budget - CHUNK_TOKEN_OVERLAP)
+    if not units:
+        return []
+
+    ranges = pack(unit_tokens, budget, CHUNK_TOKEN_OVERLAP)
+    if len(ranges) > 1:
+        # Binary search for the smallest capacity that still gives the same number of chunks
+        low, high = math.ceil(sum(unit_tokens) / len(ranges)), budget
+        while low < high:
+            capacity = (low + high) // 2
+            if len(pack(unit_tokens, capacity, CHUNK_TOKEN_OVERLAP)) <= len(ranges):
+                high = capacity
+            else:
+                low = capacity + 1
+        ranges = pack(unit_tokens, high, CHUNK_TOKEN_OVERLAP)
+
+    chunks = []
+    for start, end in ranges:
+        chunk = " ".join(units[start:end])
+        num_tokens = sum(unit_tokens[start:end])
+        if chunks:
+            overlap, overlap_tokens = get_overlap(chunks[-1].text, CHUNK_TOKEN_OVERLAP)
+            chunk = f"{overlap} {chunk}"
+            num_tokens += overlap_tokens
+        chunks.append(Chunk(chunk, num_tokens))
+    return chunks
+
+def group_summaries(summaries: List[str], fan_in: int) -> List[str]:
+    """
+        Groups consecutive summaries (at most fan_in in each group, and within the chunk budget) to be summarized together in the next
+        round of a map-reduce summarization.
+
+        Parameters
+        ----------
+        summaries: List[str]
+            The summaries from the previous round, in the order of the article
+
+        fan_in: int
+            The maximum number of summaries in a group
+
+        Returns
+        -------
+        groups: List[str]
+            The text of each group, i.e. its summaries joined together
+    """
+    budget = get_chunk_budget()
+    groups, current_group, token_count = [], [], 0
+    for summary, num_tokens in zip(summaries, count_tokens_batch(summaries)):
+        if current_group and (len(current_group) >= fan_in or token_count + num_tokens > budget):
+            groups.append(" ".join(current_group))
+            current_group, token_count = [], 0
+        current_group.append(summary)
+        token_count += num_tokens
+    if current_group:
+        groups.append(" ".join(current_group))
+    return groups
+
+CHUNKERS: Dict[str, Callable[[List[str]], List[Chunk]]] = {
+    "rolling": chunk_text, # Paragraph-level rolling window with small chunks
+    "budget": chunk_text_to_budget, # Token-budgeted chunks that fill the context of the model
+}
+
+def record_chunking_stats(chunks: List[Chunk]) -> None:
+    chunking_stats["chunks_per_article"][len(chunks)] += 1
+    for chunk in chunks:
+        chunking_stats["tokens_per_chunk"][chunk.num_tokens // TOKENS_PER_CHUNK_BUCKET * TOKENS_PER_CHUNK_BUCKET] += 1
+
+def chunk_article(text: List[str], strategy: str = CHUNKING_STRATEGY) -> List[Chunk]:
+    """
+        Chunks the article text with the chunking strategy, and records the number of chunks and tokens per chunk in chunking_stats
+
+        Parameters
+        ----------
+        text: List[str]
+            The paragraphs of the article to chunk
+
+        strategy: str
+            The chunking strategy, one of CHUNKERS
+
+        Returns
+        -------
+        chunks: List[Chunk]
+            A list of chunked text created from the article, together with the number of tokens in each chunk
+    """
+    if strategy not in CHUNKERS:
+        raise ValueError(f"Unknown chunking strategy {strategy!r}, expected one of {list(CHUNKERS)}")
+    chunks = CHUNKERS[strategy](text)
+    record_chunking_stats(chunks)
+    return chunks
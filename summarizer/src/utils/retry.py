@@ -0,0 +1,66 @@
+from __future__ import annotations
+from typing import Awaitable, Callable, Optional, TypeVar
+import asyncio
+import logging
+import os
+import random
+
+import httpx
+import openai
+
+logger = logging.getLogger('summarizer')
+
+T = TypeVar("T")
+
+MAX_RETRIES = int(os.environ.get("MAX_RETRIES", 3))
+RETRY_BASE_DELAY = float(os.environ.get("RETRY_BASE_DELAY", 0.5)) # Seconds before the first retry, doubled after every retry
+RETRY_MAX_DELAY = float(os.environ.get("RETRY_MAX_DELAY", 10))
+# The vLLM server is overloaded (429) or not ready yet (503), so the request is likely to succeed if it is sent again later
+RETRY_STATUS_CODES = (429, 503)
+
+def get_retry_after(response: httpx.Response) -> Optional[float]:
+    """
+        Gets the number of seconds to wait before retrying from the Retry-After header of the response, if there is one
+    """
+    retry_after = response.headers.get("retry-after")
+    try:
+        return min(float(retry_after), RETRY_MAX_DELAY) if retry_after is not None else None
+    except ValueError: # Retry-After can also be a HTTP date, just use the backoff instead
+        return None
+
+async def call_with_retries(func: Callable[[], Awaitable[T]], max_retries: int = MAX_RETRIES) -> T:
+    """
+        Calls func, retrying with exponential backoff (and jitter) if the vLLM server is overloaded (429/503) or could not be reached.
+        The Retry-After header sent by the server is honoured if there is one. Any other error is raised right away.
+
+        Parameters
+        ----------
+        func: Callable[[], Awaitable[T]]
+            Sends the request to the vLLM server
+
+        max_retries: int
+            The maximum number of times to retry
+
+        Returns
+        -------
+        result: T
+            The result of func
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return await func()
+        except openai.APIStatusError as e:
+            if e.status_code not in RETRY_STATUS_CODES or attempt == max_retries:
+                raise
+            delay = get_retry_after(e.response)
+            reason = f"status {e.status_code}"
+        except openai.APIConnectionError as e: # Also covers timeouts
+            if attempt == max_retries:
+                raise
+            delay = None
+            reason = repr(e)
+
+        if delay is None:
+            delay = min(RETRY_BASE_DELAY * 2 ** attempt, RETRY_MAX_DELAY) * random.uniform(0.5, 1.5)
+        logger.warning(f"Request to the vLLM server failed ({reason}), retrying in {delay:.2f}s")
+        await asyncio.sleep(delay)
@@ -0,0 +1,150 @@
+from __future__ import annotations
+from typing import Dict, List, Optional
+from collections import OrderedDict
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+SUMMARY_CACHE_SIZE = int(os.environ.get("SUMMARY_CACHE_SIZE", 4096)) # Max number of summaries in the in-memory LRU
+# Optional on-disk cache (e.g. on a volume shared by the summarizer replicas). Disabled if empty
+SUMMARY_CACHE_PATH = os.environ.get("SUMMARY_CACHE_PATH", "")
+SUMMARY_CACHE_MAX_ENTRIES = int(os.environ.get("SUMMARY_CACHE_MAX_ENTRIES", 100000)) # Max number of summaries in the on-disk cache
+
+def normalize_paragraphs(paragraphs: List[str]) -> str:
+    """
+        Normalizes the paragraphs so that articles that only differ in whitespace share the same cache entry
+    """
+    return "\n".join(" ".join(p.split()) for p in paragraphs)
+
+class SummaryCache:
+    """
+        Cache of the summaries of articles and of chunks, keyed by a hash of the normalized text, the model and the sampling parameters.
+        Caching the chunks as well allows articles that share chunks (e.g. syndicated wire stories) to reuse part of the work.
+        There is an in-process LRU, and optionally an on-disk SQLite database behind it that can be shared by multiple replicas.
+    """
+    def __init__(self,
+                 namespace: str,
+                 memory_entries: int = SUMMARY_CACHE_SIZE,
+                 path: str = SUMMARY_CACHE_PATH,
+                 max_entries: int = SUMMARY_CACHE_MAX_ENTRIES):
+        self.namespace = namespace # The model and sampling parameters, summaries are only reused if these are the same
+        self.memory_entries = memory_entries
+        self.path = path
+        self.max_entries = max_entries
+
+        self._memory: OrderedDict[str, str] = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self.stats: Dict[str, int] = {"article_hits": 0, "article_misses": 0, "chunk_hits": 0, "chunk_misses": 0, "disk_hits": 0, "evictions": 0}
+
+    def make_key(self, kind: str, paragraphs: List[str]) -> str:
+        """
+            Makes the cache key of an article or chunk (kind) from its paragraphs
+        """
+        text = f"{self.namespace}\n{kind}\n{normalize_paragraphs(paragraphs)}"
+        return f"{kind}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+    def _get_db(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS summaries (key TEXT PRIMARY KEY, summary TEXT, accessed_at REAL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS summaries_accessed_at ON summaries (accessed_at)")
+        return self._db
+
+    def _get_from_disk(self, keys: List[str]) -> Dict[str, str]:
+        with self._db_lock:
+            db = self._get_db()
+            placeholders = ",".join("?" * len(keys))
+            rows = db.execute(f"SELECT key, summary FROM summaries WHERE key IN ({placeholders})", keys).fetchall()
+            if rows:
+                db.executemany("UPDATE summaries SET accessed_at = ? WHERE key = ?", [(time.time(), key) for key, _ in rows])
+                db.commit()
+        return dict(rows)
+
+    def _set_on_disk(self, entries: Dict[str, str]) -> None:
+        with self._db_lock:
+            db = self._get_db()
+            now = time.time()
+            db.executemany("INSERT OR REPLACE INTO summaries VALUES (?, ?, ?)", [(key, summary, now) for key, summary in entries.items()])
+            excess = db.execute("SELECT COUNT(*) FROM summaries").fetchone()[0] - self.max_entries
+            if excess > 0:
+                db.execute("DELETE FROM summaries WHERE key IN (SELECT key FROM summaries ORDER BY accessed_at LIMIT ?)", (excess,))
+            db.commit()
+
+    def _remember(self, key: str, summary: str) -> None:
+        self._memory[key] = summary
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    async def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        """
+            Gets the cached summaries of the keys, from the in-process LRU first and then from the on-disk cache
+
+            Parameters
+            ----------
+            keys: List[str]
+                The cache keys (see make_key)
+
+            Returns
+            -------
+            summaries: List[Optional[str]]
+                The cached summary of each key, or None if it is not cached
+        """
+        summaries = []
+        for key in keys:
+            summary = self._memory.get(key)
+            if summary is not None:
+                self._memory.move_to_end(key)
+            summaries.append(summary)
+
+        missing = [key for key, summary in zip(keys, summaries) if summary is None]
+        if missing and self.path:
+            found = await asyncio.to_thread(self._get_from_disk, missing)
+            self.stats["disk_hits"] += len(found)
+            for key, summary in found.items():
+                self._remember(key, summary)
+            summaries = [summary if summary is not None else found.get(key) for key, summary in zip(keys, summaries)]
+
+        for key, summary in zip(keys, summaries):
+            kind = key.split(":", 1)[0]
+            self.stats[f"{kind}_hits" if summary is not None else f"{kind}_misses"] += 1
+        return summaries
+
+    async def get(self, key: str) -> Optional[str]:
+        return (await self.get_many([key]))[0]
+
+    async def set_many(self, entries: Dict[str, str]) -> None:
+        """
+            Caches the summaries
+
+            Parameters
+            ----------
+            entries: Dict[str, str]
+                The summary of each cache key
+        """
+        for key, summary in entries.items():
+            self._remember(key, summary)
+        if entries and self.path:
+            await asyncio.to_thread(self._set_on_disk, entries)
+
+    def get_stats(self) -> Dict[str, float]:
+        """
+            Gets the hit/miss counters, and the hit rates of the article and chunk summaries
+        """
+        stats: Dict[str, float] = dict(self.stats)
+        for kind in ("article", "chunk"):
+            lookups = self.stats[f"{kind}_hits"] + self.stats[f"{kind}_misses"]
+            stats[f"{kind}_hit_rate"] = self.stats[f"{kind}_hits"] / lookups if lookups else 0.0
+        return stats
+
+    def close(self) -> None:
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -1,17 +1,52 @@
 from __future__ import annotations
-from typing import List
+from typing import TYPE_CHECKING, List, NamedTuple, Optional
+from collections import OrderedDict
 import os
+import threading
 
-from transformers import PreTrainedTokenizerFast
+if TYPE_CHECKING:
+    from tokenizers import Tokenizer
 
 # TOKENIZER
-tokenizer_file = os.path.join(os.path.dirname(os.path.realpath(__file__)), "tokenizer.json")
-tokenizer = PreTrainedTokenizerFast(tokenizer_file=tokenizer_file)
+tokenizer_file = os.path.join(os.path.dirname(os.path.realpath(__file__)), "tokenizer.json") # Downloaded when the image is built
+_tokenizer: Optional[Tokenizer] = None
+_tokenizer_lock = threading.Lock()
 
 # TODO: maybe instead of setting hard limits for the chunks, try to decide it based on the average number of chunks in each paragraph.
 CHUNK_TOKEN_LIMIT = 200
 CHUNK_OVERLAP = 2
 MAX_PARA_IN_CHUNK = CHUNK_OVERLAP * 2 + 1 # To prevent too many paragraphs being in the same chunk, resulting in loss of information post summarization
+TOKEN_COUNT_CACHE_SIZE = int(os.environ.get("TOKEN_COUNT_CACHE_SIZE", 16384)) # Max number of paragraphs to remember the token counts of
+
+# paragraph -> number of tokens. The overlapping windows and repeated articles count the same paragraphs again
+token_counts: OrderedDict[str, int] = OrderedDict()
+
+def get_tokenizer() -> Tokenizer:
+    """
+        Gets the tokenizer, loading it from tokenizer_file on first use (or by the warm-up at startup, see main.py).
+        Only the tokenizers runtime is imported, instead of all of transformers, which takes much longer to import and would slow down
+        the start of the service.
+
+        Returns
+        -------
+        tokenizer: Tokenizer
+            The tokenizer of the model, without truncation or padding
+    """
+    global _tokenizer
+    if _tokenizer is None:
+        with _tokenizer_lock:
+            if _tokenizer is None:
+                from tokenizers import Tokenizer
+                tokenizer = Tokenizer.from_file(tokenizer_file)
+                # Count every token of the text, like PreTrainedTokenizerFast did
+                tokenizer.no_truncation()
+                tokenizer.no_padding()
+                _tokenizer = tokenizer
+    return _tokenizer
+
+class Chunk(NamedTuple):
+    text: str
+    num_tokens: int # Sum of the token counts of the paragraphs in the chunk, so that it does not need to be tokenized again
 
 def count_text_tokens(text: str) -> int:
     """
@@ -22,26 +57,51 @@ def count_text_tokens(text: str) -> int:
         text: str
             The text from which you want the token counts
         
-        tokenizer: transformers.AutoTokenizer
-            The tokenizer used to tokenize the text
-        
         Returns
         -------
         num_tokens: int
             The number of tokens in the text
     """
-    tokens = tokenizer.encode(text, add_special_tokens=False)  # Encode without special tokens
-    num_tokens = len(tokens)
+    return count_tokens_batch([text])[0]
+
+def count_tokens_batch(texts: List[str]) -> List[int]:
+    """
+        Counts the number of tokens in each of the texts. The texts that are not in the token count cache are tokenized
+        together in a single batch, which the fast tokenizer encodes in parallel.
+
+        Parameters
+        ---------
+        texts: List[str]
+            The texts from which you want the token counts
+        
+        Returns
+        -------
+        num_tokens: List[int]
+            The number of tokens in each of the texts
+    """
+    misses = list(dict.fromkeys(t for t in texts if t not in token_counts))
+    if misses:
+        encodings = get_tokenizer().encode_batch(misses, add_special_tokens=False)
+        for text, encoding in zip(misses, encodings):
+            token_counts[text] = len(encoding.ids)
+
+    num_tokens = []
+    for text in texts:
+        token_counts.move_to_end(text)
+        num_tokens.append(token_counts[text])
+
+    while len(token_counts) > TOKEN_COUNT_CACHE_SIZE:
+        token_counts.popitem(last=False)
     return num_tokens
 
-def chunk_text(text: str) -> List[str]:
+def chunk_text(text: List[str]) -> List[Chunk]:
     """
         Chunks the article text to make it easier to summarize, and for the text to fit within the token limit of the summarizer.
         This ensures that the text passed into the summarizer is not too long, and will not result in loss of information post summarization
         if the generated summary is too short.
 
         The chunking strategy used is a sentence-aware(?) rolling window. 
-        1. The number of tokens in each paragraph (of the article) is obtained.
+        1. The number of tokens in each paragraph (of the article) is obtained, with all the paragraphs tokenized in one batch.
         2. Add each paragraph to the chunk until the total number of tokens in that chunk exceeds CHUNK_TOKEN_LIMIT, or if the number of paragraphs
            in the chunk exceeds MAX_PARA_IN_CHUNK. This attempts to find a nice balance in the length of the chunk and the amount of information 
            present in the chunk, so that not too much information will be lost due to the summarization.
@@ -50,18 +110,15 @@ def chunk_text(text: str) -> List[str]:
 
         Parameters
         ----------
-        text: str
-            The article text to chunk
-
-        tokenizer: transformers.AutoTokenizer
-            The tokenizer used to tokenize the text
+        text: List[str]
+            The paragraphs of the article to chunk
         
         Returns
         -------
-        chunks: List[str]
-            A list of chunked text created from the article
+        chunks: List[Chunk]
+            A list of chunked text created from the article, together with the number of tokens in each chunk
     """   
-    text_tokens = [count_text_tokens(t, tokenizer) for t in text]
+    text_tokens = count_tokens_batch(text)
 
     chunks = []
     current_chunk = []
@@ -69,7 +126,7 @@ def chunk_text(text: str) -> List[str]:
     for i, (paragraph_text, num_tokens) in enumerate(zip(text, text_tokens)):
         if token_count + num_tokens >= CHUNK_TOKEN_LIMIT or len(current_chunk) >= MAX_PARA_IN_CHUNK:
             # End of current_chunk
-            chunks.append(" ".join(current_chunk))
+            chunks.append(Chunk(" ".join(current_chunk), token_count))
 
             # Form the beginning of the new current_chunk using the previous paragraphs
             window_start_idx = max(i-CHUNK_OVERLAP, 0)
@@ -81,5 +138,5 @@ def chunk_text(text: str) -> List[str]:
 
     # Add the final chunk
     if current_chunk: # do we need this check?
-        chunks.append(" ".join(current_chunk))
+        chunks.append(Chunk(" ".join(current_chunk), token_count))
     return chunks
\ No newline at end of file
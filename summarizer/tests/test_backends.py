@@ -0,0 +1,34 @@
+"""
+    Tests of the summarizer backend interface
+"""
+from typing import Any, Dict, List
+import asyncio
+
+import pytest
+
+from utils import SummarizerBackend
+
+class EchoBackend(SummarizerBackend):
+    name = "echo"
+
+    def namespace(self) -> Dict[str, Any]:
+        return {}
+
+    async def summarize(self, texts: List[str]) -> List[str]:
+        return [text.upper() for text in texts]
+
+def test_incomplete_backend_fails_on_instantiation():
+    class NoSummarizeBackend(SummarizerBackend):
+        name = "incomplete"
+
+        def namespace(self) -> Dict[str, Any]:
+            return {}
+
+    with pytest.raises(TypeError, match="summarize"):
+        NoSummarizeBackend()
+
+def test_stream_falls_back_to_summarize():
+    async def run():
+        return [item async for item in EchoBackend().stream(["a", "b"])]
+
+    assert asyncio.run(run()) == [(0, "A"), (1, "B")]
@@ -0,0 +1,118 @@
+"""
+    Tests of the batching of the texts of concurrent requests
+"""
+from typing import AsyncIterator, List, Tuple
+import asyncio
+
+from utils import MicroBatcher, StreamBatcher
+
+class SlowBatch:
+    """
+        Processes the batches after a delay, and records the batches it was sent and whether they were cancelled
+    """
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.batches: List[List[str]] = []
+        self.cancelled = 0
+
+    async def __call__(self, texts: List[str]) -> List[str]:
+        self.batches.append(texts)
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return [text.upper() for text in texts]
+
+def test_concurrent_requests_are_batched():
+    process_batch = SlowBatch(0)
+    batcher = MicroBatcher(process_batch, window=0.01)
+
+    async def run():
+        return await asyncio.gather(batcher.submit(["a", "b"]), batcher.submit(["c"]))
+
+    assert asyncio.run(run()) == [["A", "B"], ["C"]]
+    assert process_batch.batches == [["a", "b", "c"]]
+
+def test_batch_is_cancelled_once_every_request_is_cancelled():
+    process_batch = SlowBatch(10)
+    batcher = MicroBatcher(process_batch, window=0.01)
+
+    async def run():
+        requests = [asyncio.create_task(batcher.submit([text])) for text in "ab"]
+        await asyncio.sleep(0.05)
+        requests[0].cancel()
+        await asyncio.sleep(0.01)
+        assert process_batch.cancelled == 0 # The other request is still waiting on the batch
+        requests[1].cancel()
+        await asyncio.gather(*requests, return_exceptions=True)
+        await asyncio.sleep(0.01)
+
+    asyncio.run(run())
+    assert process_batch.batches == [["a", "b"]]
+    assert process_batch.cancelled == 1
+
+def test_cancelled_requests_are_dropped_from_the_next_batch():
+    process_batch = SlowBatch(0)
+    batcher = MicroBatcher(process_batch, window=0.05)
+
+    async def run():
+        cancelled = asyncio.create_task(batcher.submit(["a"]))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        return await batcher.submit(["b"])
+
+    assert asyncio.run(run()) == ["B"]
+    assert process_batch.batches == [["b"]]
+
+class SlowStream:
+    """
+        Streams the results of the batches one letter at a time, and records the batches it was sent and whether they were cancelled
+    """
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.batches: List[List[str]] = []
+        self.cancelled = 0
+
+    async def __call__(self, texts: List[str]) -> AsyncIterator[Tuple[int, str]]:
+        self.batches.append(texts)
+        try:
+            for letter in range(max(map(len, texts))):
+                await asyncio.sleep(self.delay)
+                for index, text in enumerate(texts):
+                    if letter < len(text):
+                        yield index, text[letter].upper()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+
+async def read(batcher: StreamBatcher, texts: List[str]) -> List[Tuple[int, str]]:
+    return [item async for item in batcher.stream(texts)]
+
+def test_concurrent_streams_are_batched():
+    stream_batch = SlowStream(0)
+    batcher = StreamBatcher(stream_batch, window=0.01)
+
+    async def run():
+        return await asyncio.gather(read(batcher, ["ab", "c"]), read(batcher, ["de"]))
+
+    assert asyncio.run(run()) == [[(0, "A"), (1, "C"), (0, "B")], [(0, "D"), (0, "E")]]
+    assert stream_batch.batches == [["ab", "c", "de"]]
+
+def test_stream_batch_is_cancelled_once_every_request_stops_reading():
+    stream_batch = SlowStream(10)
+    batcher = StreamBatcher(stream_batch, window=0.01)
+
+    async def run():
+        requests = [asyncio.create_task(read(batcher, [text])) for text in ("ab", "cd")]
+        await asyncio.sleep(0.05)
+        requests[0].cancel()
+        await asyncio.sleep(0.01)
+        assert stream_batch.cancelled == 0 # The other request is still reading from the batch
+        requests[1].cancel()
+        await asyncio.gather(*requests, return_exceptions=True)
+        await asyncio.sleep(0.01)
+
+    asyncio.run(run())
+    assert stream_batch.batches == [["ab", "cd"]]
+    assert stream_batch.cancelled == 1
@@ -0,0 +1,45 @@
+"""
+    Tests of the map_reduce summary mode, with the model and the tokenizer replaced by fakes
+"""
+from typing import List
+import asyncio
+
+import pytest
+
+import main
+
+@pytest.fixture
+def summarized(monkeypatch: pytest.MonkeyPatch) -> List[List[str]]:
+    """
+        Replaces the model with a fake that summarizes each text into its first word, and the tokenizer (which is downloaded when the image
+        is built) with counting each word as a token. Returns the batches of texts sent to the fake model
+    """
+    batches = []
+
+    async def summarize_chunks(texts: List[str]) -> List[str]:
+        batches.append(texts)
+        return [text.split()[0] for text in texts]
+
+    monkeypatch.setattr(main, "summarize_chunks", summarize_chunks)
+    monkeypatch.setattr(main, "count_text_tokens", lambda text: len(text.split()))
+    monkeypatch.setattr(main, "group_summaries", lambda summaries, fan_in: [" ".join(summaries[i:i + fan_in])
+                                                                           for i in range(0, len(summaries), fan_in)])
+    monkeypatch.setattr(main, "TARGET_SUMMARY_TOKENS", 10)
+    return batches
+
+def test_summaries_that_fit_are_not_reduced(summarized: List[List[str]]):
+    # Several summaries that fit within TARGET_SUMMARY_TOKENS together are kept as they are
+    summaries = ["one two three", "four five", "six seven eight"]
+    assert asyncio.run(main.reduce_summaries(summaries)) == "one two three four five six seven eight"
+    assert summarized == []
+
+def test_single_summary_that_fits_is_not_reduced(summarized: List[List[str]]):
+    assert asyncio.run(main.reduce_summaries(["one two three"])) == "one two three"
+    assert summarized == []
+
+def test_summaries_that_do_not_fit_are_reduced(summarized: List[List[str]]):
+    summaries = [f"summary{i} " + "word " * 4 for i in range(6)]
+    article_summary = asyncio.run(main.reduce_summaries(summaries))
+    assert len(article_summary.split()) <= main.TARGET_SUMMARY_TOKENS
+    assert len(summarized) == 1
+    assert len(summarized[0]) == -(-len(summaries) // main.REDUCE_FAN_IN)
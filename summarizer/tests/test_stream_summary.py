@@ -0,0 +1,67 @@
+"""
+    Tests of the streamed summaries, with the model and the tokenizer replaced by fakes
+"""
+from typing import AsyncIterator, List, Tuple
+import asyncio
+
+import orjson
+import pytest
+
+import main
+from utils import Chunk, StreamBatcher, SummaryCache
+
+class EndlessBackend:
+    """
+        Streams the summary of each text one word at a time, without ever finishing
+    """
+    async def stream(self, texts: List[str]) -> AsyncIterator[Tuple[int, str]]:
+        while True:
+            await asyncio.sleep(0.01)
+            yield 0, " word"
+
+class RecordingBackend:
+    """
+        Streams the summary of each text in two pieces, and records the texts it was asked to summarize
+    """
+    def __init__(self):
+        self.texts: List[str] = []
+
+    async def stream(self, texts: List[str]) -> AsyncIterator[Tuple[int, str]]:
+        self.texts.extend(texts)
+        for index, text in enumerate(texts):
+            yield index, " summary of"
+            yield index, f" {text}"
+
+async def read_slowly(article: main.Article) -> List[dict]:
+    records = []
+    async for line in main.stream_summary(article):
+        records.append(orjson.loads(line))
+        # The deadline passes while the generator is suspended at a yield
+        await asyncio.sleep(0.05)
+    return records
+
+def test_deadline_while_suspended_ends_with_error_record(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(main, "stream_batcher", StreamBatcher(EndlessBackend().stream))
+    monkeypatch.setattr(main, "chunk_article", lambda paragraphs: [Chunk(" ".join(paragraphs), len(paragraphs))])
+
+    records = asyncio.run(read_slowly(main.Article(url="https://example.com", paragraphs=["text"], timeout=0.2)))
+    assert records[0]["delta"] == "word"
+    assert records[-1]["done"] and "Timed out" in records[-1]["error"]
+    assert all("delta" in record for record in records[:-1])
+
+def test_cached_chunks_are_replayed_and_not_generated_again(monkeypatch: pytest.MonkeyPatch):
+    backend, cache = RecordingBackend(), SummaryCache(namespace="test", path="")
+    monkeypatch.setattr(main, "stream_batcher", StreamBatcher(backend.stream))
+    monkeypatch.setattr(main, "summary_cache", cache)
+    monkeypatch.setattr(main, "chunk_article", lambda paragraphs: [Chunk(paragraph, 1) for paragraph in paragraphs])
+    asyncio.run(cache.set_many({cache.make_key("chunk", ["first"]): "cached first", cache.make_key("chunk", ["second"]): "cached second"}))
+
+    async def read(article: main.Article) -> List[dict]:
+        return [orjson.loads(line) async for line in main.stream_summary(article)]
+
+    records = asyncio.run(read(main.Article(url="https://example.com", paragraphs=["first", "second", "third"], mode="concat")))
+    assert backend.texts == ["third"]
+    assert [(record["chunk"], record["delta"]) for record in records[:-1]] == [(0, "cached first"), (1, "cached second"), (2, "summary of"),
+                                                                                (2, " third")]
+    assert records[-1] == {"url": "https://example.com", "summary": "cached first cached second summary of third", "done": True}
+    assert asyncio.run(cache.get(cache.make_key("chunk", ["third"]))) == "summary of third"